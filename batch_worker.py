@@ -0,0 +1,110 @@
+"""
+Background batch runner for the desktop app.
+
+Runs compression_engine.compress_batch on a worker thread and reports
+progress through a queue that the Tk thread polls with root.after, so the
+main loop never blocks on image work.
+"""
+
+import logging
+import queue
+import threading
+import time
+import traceback
+
+import compression_engine
+from compression_engine import BatchControl
+
+
+class BatchWorker(threading.Thread):
+    """Compress a list of files in the background.
+
+    Messages put on `self.messages` are dicts with a "type" key:
+      - "progress": done, total, current, images_per_sec, mb_per_sec, eta_seconds,
+        plus the outcome for `current`: error, skipped, resumed, bytes_saved
+      - "finished": results, cancelled
+      - "error": error (the batch itself could not run)
+    """
+
+    def __init__(self, files, output_dir, settings, workers=None, incremental=False,
+                 memory_limit=None, deadline=None, pipeline_depth=0, dedup=None, journal=None):
+        super().__init__(daemon=True)
+        self.files = list(files)
+        self.output_dir = output_dir
+        self.settings = settings
+        self.workers = workers
+        self.incremental = incremental
+        self.memory_limit = memory_limit
+        self.deadline = deadline
+        self.pipeline_depth = pipeline_depth
+        self.dedup = dedup
+        self.journal = journal
+        self.control = BatchControl()
+        self.messages = queue.Queue()
+        self._processed_bytes = 0
+        self._started_at = None
+
+    def cancel(self):
+        self.control.cancel()
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+    @property
+    def paused(self):
+        return self.control.paused
+
+    def run(self):
+        self._started_at = time.monotonic()
+        try:
+            results = compression_engine.compress_batch(
+                self.files, self.output_dir, self.settings,
+                progress_callback=self._on_progress,
+                workers=self.workers,
+                control=self.control,
+                incremental=self.incremental,
+                memory_limit=self.memory_limit,
+                deadline=self.deadline,
+                pipeline_depth=self.pipeline_depth,
+                dedup=self.dedup,
+                journal=self.journal)
+            self.messages.put({
+                "type": "finished",
+                "results": results,
+                "cancelled": self.control.cancelled
+            })
+        except Exception as e:
+            logging.error(f"Batch failed: {str(e)}")
+            logging.error(traceback.format_exc())
+            self.messages.put({"type": "error", "error": str(e)})
+
+    def _on_progress(self, done, total, result):
+        self._processed_bytes += result.input_bytes
+        elapsed = time.monotonic() - self._started_at - self.control.paused_seconds
+        elapsed = max(elapsed, 1e-6)
+        images_per_sec = done / elapsed
+        self.messages.put({
+            "type": "progress",
+            "done": done,
+            "total": total,
+            "current": result.input_path,
+            "images_per_sec": images_per_sec,
+            "mb_per_sec": self._processed_bytes / (1024 * 1024) / elapsed,
+            "eta_seconds": (total - done) / images_per_sec if images_per_sec else None,
+            "error": result.error,
+            "skipped": result.skipped,
+            "resumed": result.resumed,
+            "bytes_saved": max(0, result.input_bytes - result.output_bytes) if result.ok else 0
+        })
+
+    def drain(self):
+        """Return all queued messages without blocking"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
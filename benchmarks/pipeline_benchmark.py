@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Compression pipeline benchmark.
+
+Generates a deterministic synthetic corpus (noisy photos, flat graphics,
+alpha PNGs and a large panorama), runs compression_engine.compress_batch
+over a matrix of output formats, quality levels, resize presets,
+encoder effort tiers and worker counts, and writes the results as JSON:
+images/s, MB/s of input, peak RSS and compression ratio per case. Each
+lower effort tier is also summarized against "max" as relative output
+size and speed-up, the trade-off the deadline scheduler relies on.
+
+With --baseline the run is compared against an earlier JSON file and any
+case that got slower or compresses worse by more than --threshold is
+reported; the exit status is 1 if there are regressions.
+
+    python benchmarks/pipeline_benchmark.py --quick --output run.json
+    python benchmarks/pipeline_benchmark.py --save-baseline benchmarks/baseline.json
+    python benchmarks/pipeline_benchmark.py --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Allow running from the repository root or from benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image, __version__ as PIL_VERSION
+
+import compression_engine
+from compression_engine import CompressionSettings, split_list
+
+BENCHMARK_VERSION = 2
+
+PRESETS = {
+    "original": None,
+    "hd": (1920, 1080),
+    "thumbnail": (300, 300),
+}
+
+FULL_MATRIX = {
+    "formats": list(compression_engine.OUTPUT_FORMATS),
+    "qualities": [60, 85],
+    "presets": list(PRESETS),
+    "efforts": list(compression_engine.EFFORT_TIERS),
+    "workers": [1, compression_engine.default_workers()],
+}
+
+QUICK_MATRIX = {
+    "formats": ["jpeg", "webp"],
+    "qualities": [85],
+    "presets": ["original", "thumbnail"],
+    "efforts": ["fast", "max"],
+    "workers": [1, compression_engine.default_workers()],
+}
+
+DEFAULT_THRESHOLD = 0.10
+
+
+def _photo(rng, width, height):
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    r = 128 + 100 * np.sin(x / 170.0) * np.cos(y / 230.0)
+    g = 128 + 90 * np.sin((x + y) / 310.0)
+    b = 128 + 80 * np.cos(x / 90.0) * np.sin(y / 130.0)
+    pixels = np.stack([r, g, b], axis=-1)
+    pixels += rng.normal(0, 10, pixels.shape)
+    return Image.fromarray(pixels.clip(0, 255).astype(np.uint8))
+
+
+def _graphic(rng, width, height):
+    # Few flat colours with hard edges, like a screenshot or a chart
+    pixels = np.full((height, width, 3), 245, dtype=np.uint8)
+    for _ in range(12):
+        x0, y0 = rng.integers(0, width - 1), rng.integers(0, height - 1)
+        x1, y1 = rng.integers(x0 + 1, width + 1), rng.integers(y0 + 1, height + 1)
+        pixels[y0:y1, x0:x1] = rng.integers(0, 256, 3)
+    return Image.fromarray(pixels)
+
+
+def _alpha(rng, width, height):
+    image = _photo(rng, width, height).convert("RGBA")
+    y, x = np.mgrid[0:height, 0:width]
+    radius = np.hypot(x - width / 2, y - height / 2) / (min(width, height) / 2)
+    alpha = ((1 - radius).clip(0, 1) * 255).astype(np.uint8)
+    image.putalpha(Image.fromarray(alpha))
+    return image
+
+
+# name -> (generator, size, file format); sizes are multiplied by --scale
+CORPUS = (
+    ("photo_1", _photo, (2400, 1600), "JPEG"),
+    ("photo_2", _photo, (1600, 2400), "JPEG"),
+    ("photo_3", _photo, (3000, 2000), "JPEG"),
+    ("graphic_1", _graphic, (1600, 1000), "PNG"),
+    ("graphic_2", _graphic, (1024, 768), "PNG"),
+    ("alpha_1", _alpha, (1200, 1200), "PNG"),
+    ("alpha_2", _alpha, (800, 600), "PNG"),
+    ("panorama", _photo, (8000, 2000), "JPEG"),
+)
+
+
+def make_corpus(directory, scale=1.0, seed=0):
+    """Write the synthetic corpus to `directory`; the same seed gives the same bytes"""
+    paths = []
+    for i, (name, generator, (width, height), file_format) in enumerate(CORPUS):
+        rng = np.random.default_rng(seed + i)
+        size = (max(16, int(width * scale)), max(16, int(height * scale)))
+        image = generator(rng, *size)
+        extension = ".jpg" if file_format == "JPEG" else ".png"
+        path = os.path.join(directory, name + extension)
+        if file_format == "JPEG":
+            image.save(path, "JPEG", quality=92)
+        else:
+            image.save(path, "PNG")
+        paths.append(path)
+    return paths
+
+
+def case_name(output_format, quality, preset, effort, workers):
+    return f"{output_format}-q{quality}-{preset}-{effort}-w{workers}"
+
+
+def run_case(files, output_format, quality, preset, effort, workers, repeat):
+    settings = CompressionSettings(output_format=output_format, quality=quality, effort=effort)
+    if PRESETS[preset]:
+        settings.resize_enabled = True
+        settings.width, settings.height = PRESETS[preset]
+
+    input_bytes = sum(os.path.getsize(path) for path in files)
+    timings = []
+    for _ in range(repeat):
+        output_dir = tempfile.mkdtemp(prefix="bench-out-")
+        try:
+            start = time.perf_counter()
+            results = compression_engine.compress_batch(
+                files, output_dir, settings, workers=workers)
+            timings.append(time.perf_counter() - start)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    summary = compression_engine.summarize_results(results)
+    if summary["failed"]:
+        raise RuntimeError(compression_engine.format_failures(results))
+    seconds = statistics.median(timings)
+    return {
+        "format": output_format,
+        "quality": quality,
+        "preset": preset,
+        "effort": effort,
+        "workers": workers,
+        "images": len(files),
+        "seconds": round(seconds, 4),
+        "images_per_sec": round(len(files) / seconds, 3),
+        "mb_per_sec": round(input_bytes / (1024 * 1024) / seconds, 3),
+        "peak_rss_mb": compression_engine.peak_rss_mb(),
+        "compression_ratio": round(summary["output_bytes"] / input_bytes, 4),
+    }
+
+
+def effort_tradeoffs(cases):
+    """Output size and speed of each effort tier relative to "max" for the same case"""
+    tradeoffs = {}
+    for name, case in cases.items():
+        if case["effort"] == "max":
+            continue
+        reference = cases.get(case_name(case["format"], case["quality"], case["preset"],
+                                        "max", case["workers"]))
+        if not reference:
+            continue
+        tradeoffs[name] = {
+            "size_vs_max": round(case["compression_ratio"] / reference["compression_ratio"], 4),
+            "speedup_vs_max": round(case["images_per_sec"] / reference["images_per_sec"], 3),
+        }
+    return tradeoffs
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return a list of regression messages for cases present in both runs"""
+    regressions = []
+    for name, case in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+        if case["images_per_sec"] < base["images_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {case['images_per_sec']:.2f} img/s vs "
+                f"{base['images_per_sec']:.2f} baseline")
+        if case["compression_ratio"] > base["compression_ratio"] * (1 + threshold):
+            regressions.append(
+                f"{name}: ratio {case['compression_ratio']:.4f} vs "
+                f"{base['compression_ratio']:.4f} baseline")
+        if (case["peak_rss_mb"] and base.get("peak_rss_mb")
+                and case["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold)):
+            regressions.append(
+                f"{name}: peak RSS {case['peak_rss_mb']:.0f} MB vs "
+                f"{base['peak_rss_mb']:.0f} MB baseline")
+    return regressions
+
+
+def write_json(data, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="Run a small subset of the matrix")
+    parser.add_argument("--formats", help="Comma-separated output formats to run")
+    parser.add_argument("--qualities", help="Comma-separated quality levels to run")
+    parser.add_argument("--presets", help=f"Comma-separated resize presets ({', '.join(PRESETS)})")
+    parser.add_argument("--efforts",
+                        help=f"Comma-separated effort tiers ({', '.join(compression_engine.EFFORT_TIERS)})")
+    parser.add_argument("--workers", help="Comma-separated worker counts to run")
+    parser.add_argument("--scale", type=float, default=1.0, help="Corpus image size multiplier")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case (median is reported)")
+    parser.add_argument("--output", help="Write the results JSON here (default: stdout)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Also write the results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against this baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed relative slowdown before a case is flagged "
+                             f"(default {DEFAULT_THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    matrix = dict(QUICK_MATRIX if args.quick else FULL_MATRIX)
+    if args.formats:
+        matrix["formats"] = split_list(args.formats.lower())
+    if args.qualities:
+        matrix["qualities"] = [int(q) for q in split_list(args.qualities)]
+    if args.presets:
+        matrix["presets"] = split_list(args.presets)
+    if args.efforts:
+        matrix["efforts"] = split_list(args.efforts.lower())
+    if args.workers:
+        matrix["workers"] = [int(w) for w in split_list(args.workers)]
+    unknown = set(matrix["presets"]) - set(PRESETS)
+    if unknown:
+        parser.error(f"Unknown preset(s): {', '.join(sorted(unknown))}")
+    unknown = set(matrix["efforts"]) - set(compression_engine.EFFORT_TIERS)
+    if unknown:
+        parser.error(f"Unknown effort(s): {', '.join(sorted(unknown))}")
+    # Duplicate worker counts happen on single-core machines
+    matrix["workers"] = sorted(set(matrix["workers"]))
+
+    report = {
+        "version": BENCHMARK_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "pillow": PIL_VERSION,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "corpus": {"scale": args.scale, "seed": args.seed},
+        "cases": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = make_corpus(tmp, args.scale, args.seed)
+        report["corpus"]["images"] = len(files)
+        report["corpus"]["bytes"] = sum(os.path.getsize(path) for path in files)
+
+        for output_format, quality, preset, effort, workers in itertools.product(
+                matrix["formats"], matrix["qualities"], matrix["presets"], matrix["efforts"],
+                matrix["workers"]):
+            name = case_name(output_format, quality, preset, effort, workers)
+            case = run_case(files, output_format, quality, preset, effort, workers, args.repeat)
+            report["cases"][name] = case
+            print(f"{name:<40} {case['images_per_sec']:>8.2f} img/s {case['mb_per_sec']:>8.2f} MB/s "
+                  f"ratio {case['compression_ratio']:.3f}", file=sys.stderr)
+
+    report["effort_tradeoffs"] = effort_tradeoffs(report["cases"])
+    for name, tradeoff in report["effort_tradeoffs"].items():
+        print(f"{name:<40} {tradeoff['size_vs_max']:.3f}x size, "
+              f"{tradeoff['speedup_vs_max']:.2f}x speed vs max", file=sys.stderr)
+
+    if args.output:
+        write_json(report, args.output)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    if args.save_baseline:
+        write_json(report, args.save_baseline)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print("No regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Resize benchmark: fast (draft + reduce + LANCZOS) vs exact (LANCZOS only).
+
+Generates a synthetic camera-sized JPEG, runs both resize paths of the
+compression engine to the Social, HD and thumbnail presets and reports
+the time taken and how much the fast result differs from the exact one
+(PSNR and SSIM on luma).
+
+    python benchmarks/resize_benchmark.py
+    python benchmarks/resize_benchmark.py --size 6000x4000 --repeat 5
+"""
+
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Allow running from the repository root or from benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from compression_engine import CompressionSettings, prepare_decode, process_image
+import perceptual_quality
+
+PRESETS = {
+    "hd": (1920, 1080),
+    "social": (1200, 1200),
+    "thumbnail": (300, 300),
+}
+
+
+def make_photo(path, width, height, seed=0):
+    """Smooth gradients plus fine noise and edges, saved as a quality 92 JPEG"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    r = 128 + 100 * np.sin(x / 370.0) * np.cos(y / 530.0)
+    g = 128 + 90 * np.sin((x + y) / 610.0)
+    b = 128 + 80 * np.cos(x / 150.0) * np.sin(y / 210.0)
+    pixels = np.stack([r, g, b], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)
+    # Hard-edged stripes so resampling differences show up
+    pixels[(x.astype(int) // 97) % 7 == 0] *= 0.5
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(path, quality=92)
+
+
+def resize_once(path, settings):
+    start = time.perf_counter()
+    with Image.open(path) as img:
+        original_size = prepare_decode(img, settings)
+        result = process_image(img, settings, original_size)
+        result.load()
+    return time.perf_counter() - start, result
+
+
+def psnr(a, b):
+    mse = float(np.mean((a - b) ** 2))
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", default="6000x4000", help="Source size, WIDTHxHEIGHT")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case (median is reported)")
+    args = parser.parse_args(argv)
+
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.jpg")
+        make_photo(source, width, height)
+        print(f"Source: {width}x{height} JPEG, {os.path.getsize(source) / 1e6:.1f} MB")
+        print(f"{'preset':<10} {'exact ms':>9} {'fast ms':>9} {'speedup':>8} {'PSNR dB':>8} {'SSIM':>7}")
+
+        for name, (target_width, target_height) in PRESETS.items():
+            timings = {}
+            images = {}
+            for quality in ("exact", "fast"):
+                settings = CompressionSettings(
+                    output_format="jpeg", resize_enabled=True,
+                    width=target_width, height=target_height, resize_quality=quality)
+                runs = [resize_once(source, settings) for _ in range(args.repeat)]
+                timings[quality] = statistics.median(t for t, _ in runs)
+                images[quality] = runs[-1][1]
+
+            exact = np.asarray(images["exact"].convert("L"), dtype=np.float64)
+            fast = np.asarray(images["fast"].convert("L"), dtype=np.float64)
+            print(f"{name:<10} {timings['exact'] * 1000:>9.0f} {timings['fast'] * 1000:>9.0f} "
+                  f"{timings['exact'] / timings['fast']:>7.1f}x {psnr(exact, fast):>8.1f} "
+                  f"{perceptual_quality.ssim(exact, fast):>7.4f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
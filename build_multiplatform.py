@@ -73,10 +73,14 @@ def check_dependencies():
     
     return True
 
-def build_executable():
-    """Build the executable for the current platform"""
+def build_executable(build_mode='onedir'):
+    """Build the executable for the current platform.
+
+    build_mode 'onedir' starts fastest; 'onefile' is a single executable
+    that unpacks itself on every launch.
+    """
     platform_info = get_platform_info()
-    print(f"\n🔨 Building for platform: {platform_info}")
+    print(f"\n🔨 Building for platform: {platform_info} ({build_mode})")
     
     # Check if spec file exists
     spec_file = 'image_compressor.spec'
@@ -97,7 +101,8 @@ def build_executable():
     try:
         cmd = [sys.executable, '-m', 'PyInstaller', spec_file]
         print(f"Running: {' '.join(cmd)}")
-        result = subprocess.run(cmd, check=True)
+        env = dict(os.environ, IMAGECOMPRESSOR_BUILD_MODE=build_mode)
+        result = subprocess.run(cmd, check=True, env=env)
         
         if result.returncode == 0:
             print(f"✅ Build successful for {platform_info}")
@@ -138,7 +143,8 @@ def main():
         return 1
     
     print("\n🔨 Starting build process...")
-    if build_executable():
+    build_mode = 'onefile' if '--onefile' in sys.argv else 'onedir'
+    if build_executable(build_mode):
         print(f"\n🎉 Build completed successfully for {platform_info}!")
         print("\n📋 Next steps:")
         print("  1. Test your executable in the 'dist' directory")
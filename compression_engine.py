@@ -0,0 +1,1376 @@
+"""
+Headless compression engine for Image Compressor.
+
+Holds the decode/resize/convert/save pipeline that used to live inside
+ImageCompressorApp.compress_images so it can be driven from the GUI, the
+command line or any other script without a display.
+"""
+
+import io
+import os
+import re
+import json
+import logging
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from dataclasses import dataclass, field, asdict, replace
+from functools import partial
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from compression_manifest import CompressionManifest
+from file_scanner import path_key
+from lazy_imports import lazy_module
+import large_image
+import quality_search
+from quality_search import QualityHistory
+import perceptual_quality
+import png_optimizer
+import pipelined_io
+import duplicate_finder
+from stage_timing import StageTimer, TimingReport, measure
+
+# Imported on first use, to keep Pillow out of application start-up
+Image = lazy_module("PIL.Image")
+
+PROFILES_FILE = "compression_profiles.json"
+
+SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.ico')
+
+OUTPUT_FORMATS = ("jpeg", "png", "webp", "ico")
+
+# ICO format requires specific sizes
+ICO_SIZES = [(16, 16), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]
+
+DEFAULT_PROFILES = {
+    "Web Optimized": {
+        "format": "webp",
+        "quality": 75,
+        "resize": True,
+        "width": 1920,
+        "height": 1080
+    },
+    "Social Media": {
+        "format": "jpeg",
+        "quality": 85,
+        "resize": True,
+        "width": 1200,
+        "height": 1200
+    },
+    "High Quality": {
+        "format": "png",
+        "quality": 95,
+        "resize": False,
+        "width": 0,
+        "height": 0
+    }
+}
+
+
+DEFAULT_RENDITION_PATTERN = "{original_name}-{width}w"
+
+RESIZE_QUALITIES = ("fast", "exact")
+
+# Fast resizing box-reduces (and JPEG draft-decodes) to within this factor
+# of the target before the final LANCZOS pass. Shrink ratios below twice
+# this value take the exact path anyway; see benchmarks/resize_benchmark.py
+RESIZE_REDUCING_GAP = 2.0
+
+# Encoder effort tiers, cheapest first. "max" is the historical behaviour
+EFFORT_TIERS = ("fast", "balanced", "max")
+
+# Per-format Image.save options for each effort tier; see
+# benchmarks/pipeline_benchmark.py --efforts for the size/time trade-off
+EFFORT_SAVE_OPTIONS = {
+    "jpeg": {
+        "fast": {"optimize": False},
+        "balanced": {"optimize": True},
+        "max": {"optimize": True},
+    },
+    "png": {
+        "fast": {"compress_level": 1},
+        "balanced": {"compress_level": 6},
+        "max": {"optimize": True},
+    },
+    "webp": {
+        "fast": {"method": 1},
+        "balanced": {"method": 4},
+        "max": {"method": 6},
+    },
+}
+
+# Bytes per decoded pixel used for memory estimates (RGB is stored as RGBX)
+BYTES_PER_PIXEL = 4
+
+
+def split_list(value):
+    """Split a comma-separated entry (e.g. rendition widths) into its non-empty items"""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+@dataclass
+class CompressionSettings:
+    """Plain settings for one batch, independent of any Tk variables.
+
+    A width or height of 0 means "keep the original dimension". A
+    target_size_kb above 0 searches, per image, for the highest quality
+    up to `quality` whose JPEG/WebP output fits in that many kilobytes.
+    auto_quality instead searches for the lowest quality up to `quality`
+    whose output keeps an SSIM of at least ssim_threshold.
+
+    Non-empty rendition_widths turns one input into a rendition set: every
+    width in every rendition format (default: output_format), named with
+    rendition_pattern. Resize settings are ignored for rendition sets.
+
+    resize_quality "fast" decodes JPEGs at a reduced DCT scale and
+    box-reduces close to the target before LANCZOS; "exact" always runs
+    LANCZOS from the full-resolution frame.
+
+    effort picks the encoder settings from EFFORT_SAVE_OPTIONS: "fast",
+    "balanced" or "max" (smallest files, slowest).
+
+    lossless_png replaces the single PNG save with png_optimizer's search
+    over lossless reductions and zlib settings, capped at
+    png_trial_seconds per image; effort decides how many trials it runs.
+
+    Images with more than max_pixels pixels (0 = no limit) fail with
+    large_image.ImageTooLargeError before anything is decoded.
+    """
+    output_format: str = "webp"
+    quality: int = 85
+    resize_enabled: bool = False
+    width: int = 0
+    height: int = 0
+    maintain_aspect: bool = True
+    preserve_metadata: bool = True
+    rename_enabled: bool = False
+    rename_pattern: str = "{original_name}"
+    start_number: int = 1
+    target_size_kb: int = 0
+    auto_quality: bool = False
+    ssim_threshold: float = perceptual_quality.DEFAULT_SSIM_THRESHOLD
+    rendition_widths: list = field(default_factory=list)
+    rendition_formats: list = field(default_factory=list)
+    rendition_pattern: str = DEFAULT_RENDITION_PATTERN
+    resize_quality: str = "fast"
+    effort: str = "max"
+    lossless_png: bool = False
+    png_trial_seconds: float = png_optimizer.DEFAULT_TRIAL_SECONDS
+    max_pixels: int = large_image.DEFAULT_MAX_PIXELS
+
+    @classmethod
+    def from_profile(cls, profile, **overrides):
+        """Build settings from a compression profile dict"""
+        settings = cls(
+            output_format=profile.get("format", "webp"),
+            quality=int(profile.get("quality", 85)),
+            resize_enabled=bool(profile.get("resize", False)),
+            width=int(profile.get("width") or 0),
+            height=int(profile.get("height") or 0),
+            target_size_kb=int(profile.get("target_size_kb") or 0),
+            resize_quality=profile.get("resize_quality", "fast"),
+            effort=profile.get("effort", "max"),
+            lossless_png=bool(profile.get("lossless_png", False)),
+            auto_quality=bool(profile.get("auto_quality", False)),
+            ssim_threshold=float(profile.get("ssim_threshold",
+                                             perceptual_quality.DEFAULT_SSIM_THRESHOLD)),
+        )
+        renditions = profile.get("renditions") or {}
+        settings.rendition_widths = [int(width) for width in renditions.get("widths", [])]
+        settings.rendition_formats = list(renditions.get("formats", []))
+        settings.rendition_pattern = renditions.get("pattern", DEFAULT_RENDITION_PATTERN)
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(settings, key, value)
+        return settings
+
+    def to_profile(self):
+        """Return the subset of settings stored in compression_profiles.json"""
+        profile = {
+            "format": self.output_format,
+            "quality": self.quality,
+            "resize": self.resize_enabled,
+            "width": self.width,
+            "height": self.height,
+            "resize_quality": self.resize_quality,
+            "effort": self.effort,
+            "lossless_png": self.lossless_png,
+            "target_size_kb": self.target_size_kb,
+            "auto_quality": self.auto_quality,
+            "ssim_threshold": self.ssim_threshold
+        }
+        if self.rendition_widths:
+            profile["renditions"] = {
+                "widths": self.rendition_widths,
+                "formats": self.rendition_formats,
+                "pattern": self.rendition_pattern
+            }
+        return profile
+
+    def cache_key(self):
+        """Stable string identifying every setting that affects the output"""
+        key = asdict(self)
+        # Only decides whether an image is processed at all
+        del key["max_pixels"]
+        # The manifest checks each file's {number} itself
+        del key["start_number"]
+        if not self.rename_enabled:
+            del key["rename_pattern"]
+        return json.dumps(key, sort_keys=True)
+
+    def validate(self):
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {self.output_format}")
+        if not 1 <= self.quality <= 100:
+            raise ValueError(f"Quality must be between 1 and 100, got {self.quality}")
+        if self.width < 0 or self.height < 0:
+            raise ValueError("Invalid dimensions provided")
+        if self.resize_quality not in RESIZE_QUALITIES:
+            raise ValueError(f"Unknown resize quality: {self.resize_quality}")
+        if self.effort not in EFFORT_TIERS:
+            raise ValueError(f"Unknown effort: {self.effort}")
+        if self.png_trial_seconds <= 0:
+            raise ValueError("PNG trial time must be positive")
+        if self.target_size_kb < 0:
+            raise ValueError("Target size must not be negative")
+        if self.auto_quality:
+            if self.target_size_kb:
+                raise ValueError("Target size and auto quality cannot be combined")
+            if not 0 < self.ssim_threshold < 1:
+                raise ValueError(f"SSIM threshold must be between 0 and 1, got {self.ssim_threshold}")
+            if not perceptual_quality.NUMPY_AVAILABLE:
+                raise ValueError("Auto quality requires NumPy (pip install numpy)")
+        if self.max_pixels < 0:
+            raise ValueError("Pixel limit must not be negative")
+        if any(width <= 0 for width in self.rendition_widths):
+            raise ValueError("Rendition widths must be positive")
+        for output_format in self.rendition_formats:
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError(f"Unsupported rendition format: {output_format}")
+
+    @property
+    def target_size_enabled(self):
+        return self.target_size_kb > 0 and self.output_format in quality_search.QUALITY_FORMATS
+
+    @property
+    def renditions_enabled(self):
+        return bool(self.rendition_widths)
+
+    @property
+    def lossless_png_enabled(self):
+        return self.lossless_png and self.output_format == "png"
+
+    @property
+    def auto_quality_enabled(self):
+        return self.auto_quality and self.output_format in quality_search.QUALITY_FORMATS
+
+
+@dataclass
+class CompressionResult:
+    """Outcome of compressing a single file"""
+    input_path: str
+    output_path: str = ""
+    input_bytes: int = 0
+    output_bytes: int = 0
+    error: str = ""
+    skipped: bool = False
+    quality: int = 0
+    trials: int = 0
+    outputs: list = field(default_factory=list)
+    # (stage, format, seconds) samples from stage_timing.StageTimer
+    timings: list = field(default_factory=list)
+    # (output_path, bytes, format) still to be written by a pipelined batch
+    pending_writes: list = field(default_factory=list)
+    # Input kept in place of this one when it was found to be a duplicate
+    duplicate_of: str = ""
+    # Completed by an earlier run of a journaled batch and not redone
+    resumed: bool = False
+
+    @property
+    def ok(self):
+        return not self.error
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def load_profiles(path=PROFILES_FILE):
+    """Return the built-in profiles merged with any saved ones"""
+    profiles = {name: dict(profile) for name, profile in DEFAULT_PROFILES.items()}
+    try:
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                profiles.update(json.load(f))
+            logging.debug("Loaded saved compression profiles")
+    except Exception as e:
+        logging.error(f"Error loading saved profiles: {str(e)}")
+    return profiles
+
+
+def save_profiles(profiles, path=PROFILES_FILE):
+    with open(path, "w") as f:
+        json.dump(profiles, f)
+
+
+def is_valid_image(file_path):
+    return str(file_path).lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def compute_target_size(size, settings):
+    """Return the (width, height) an image of `size` should be resized to"""
+    width, height = size
+    new_width = settings.width or width
+    new_height = settings.height or height
+
+    if settings.maintain_aspect:
+        aspect_ratio = width / height
+        if new_width and new_height:
+            if new_width / new_height > aspect_ratio:
+                new_width = int(new_height * aspect_ratio)
+            else:
+                new_height = int(new_width / aspect_ratio)
+
+    return max(new_width, 1), max(new_height, 1)
+
+
+def generate_filename(original_path, index, settings, size=(0, 0), pattern=None):
+    """Expand the rename pattern (or `pattern`) for the file at position `index` in the batch"""
+    original_name = os.path.splitext(os.path.basename(original_path))[0]
+    date = datetime.now().strftime("%Y%m%d")
+    width, height = size
+
+    number = settings.start_number + index
+
+    pattern = pattern or settings.rename_pattern
+    filename = pattern.format(
+        original_name=original_name,
+        number=f"{number:03d}",
+        date=date,
+        width=width,
+        height=height
+    )
+
+    # Clean filename
+    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    return filename
+
+
+def output_path_for(file_path, index, output_dir, settings, size=(0, 0)):
+    if settings.rename_enabled:
+        filename = generate_filename(file_path, index, settings, size)
+    else:
+        filename = Path(file_path).stem
+    return os.path.join(output_dir, f"{filename}.{settings.output_format}")
+
+
+def rendition_path_for(file_path, index, output_dir, settings, size, output_format):
+    filename = generate_filename(file_path, index, settings, size,
+                                 pattern=settings.rendition_pattern)
+    return os.path.join(output_dir, f"{filename}.{output_format}")
+
+
+def build_save_kwargs(img, settings, source_info=None):
+    """Format-specific keyword arguments for Image.save"""
+    if settings.output_format == 'ico':
+        return {'format': 'ICO', 'sizes': ICO_SIZES}
+
+    save_kwargs = {
+        'format': settings.output_format.upper(),
+        'quality': settings.quality
+    }
+    save_kwargs.update(EFFORT_SAVE_OPTIONS[settings.output_format][settings.effort])
+
+    if settings.preserve_metadata:
+        info = source_info if source_info is not None else img.info
+        if info.get('exif'):
+            save_kwargs['exif'] = info['exif']
+        if info.get('icc_profile'):
+            save_kwargs['icc_profile'] = info['icc_profile']
+
+    if settings.output_format == 'webp':
+        save_kwargs['lossless'] = False
+
+    return save_kwargs
+
+
+def png_compress_level(effort):
+    """zlib level matching an effort tier, for encoders that take only a level"""
+    # optimize=True is Pillow's level 9
+    return EFFORT_SAVE_OPTIONS["png"][effort].get("compress_level", 9)
+
+
+def convert_for_format(img, output_format):
+    # Convert RGBA to RGB if necessary for JPEG
+    if img.mode == 'RGBA' and output_format == 'jpeg':
+        img = img.convert('RGB')
+    return img
+
+
+def decode_target_size(size, settings):
+    """Largest size the pipeline will produce from a source of `size`, or None"""
+    if settings.renditions_enabled:
+        widths = [width for width in settings.rendition_widths if width <= size[0]]
+        if not widths:
+            return None
+        width = max(widths)
+        return width, max(1, round(size[1] * width / size[0]))
+    if settings.resize_enabled:
+        return compute_target_size(size, settings)
+    return None
+
+
+def prepare_decode(img, settings):
+    """Before the first load, let JPEG decode at a reduced DCT scale.
+
+    The decoded frame stays at least RESIZE_REDUCING_GAP times larger than
+    the biggest output. Returns the original (pre-draft) size.
+    """
+    original_size = img.size
+    target = decode_target_size(original_size, settings)
+    if settings.resize_quality == "fast" and target and img.format == 'JPEG':
+        img.draft(None, (int(target[0] * RESIZE_REDUCING_GAP),
+                         int(target[1] * RESIZE_REDUCING_GAP)))
+        if img.size != original_size:
+            logging.debug(f"Draft decoding {original_size} at {img.size} for {target}")
+    return original_size
+
+
+def resize_image(img, size, settings):
+    """Resize to `size` honouring settings.resize_quality"""
+    if img.size == tuple(size):
+        return img
+    if settings.resize_quality == "exact":
+        return img.resize(size, Image.Resampling.LANCZOS)
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+
+
+def process_image(img, settings, original_size=None, timer=None):
+    """Apply resize and mode conversion, returning the image to encode.
+
+    `original_size` is the size before any draft decoding, so the target
+    dimensions do not depend on the DCT scale picked.
+    """
+    source = img
+    if settings.resize_enabled:
+        target = compute_target_size(original_size or img.size, settings)
+        with measure(timer, "resize", settings.output_format):
+            img = resize_image(img, target, settings)
+    with measure(timer, "convert", settings.output_format):
+        converted = convert_for_format(img, settings.output_format)
+    if converted is not img and img is not source:
+        # Release the resized frame now rather than whenever GC gets to it
+        img.close()
+    return converted
+
+
+def rendition_chain(img, widths, settings, source_size=None, timer=None):
+    """Yield (width, image) per rendition width, largest first.
+
+    Each size is downscaled from the next larger one rather than from the
+    original, so the full-resolution frame is resampled only once. Widths
+    larger than the source are skipped; if none fit, the source size is
+    the only rendition. `source_size` is the size before draft decoding.
+    A frame is closed as soon as the next smaller one has been made from
+    it, so the caller must be done with each image before advancing.
+    """
+    source_width, source_height = source_size or img.size
+    current = img
+    produced = False
+    for width in sorted(set(widths), reverse=True):
+        if width > source_width:
+            logging.debug(f"Skipping {width}w rendition, source is only {source_width}px wide")
+            continue
+        height = max(1, round(source_height * width / source_width))
+        with measure(timer, "resize"):
+            resized = resize_image(current, (width, height), settings)
+        if current is not img and resized is not current:
+            current.close()
+        current = resized
+        produced = True
+        yield width, current
+    if current is not img:
+        current.close()
+    if not produced:
+        yield img.width, img
+
+
+def _write_via_temp(output_path, write):
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_atomic(img, output_path, **save_kwargs):
+    """Save to a temporary file next to `output_path` and rename it into place.
+
+    An interrupted or failed save never leaves a truncated output behind.
+    """
+    _write_via_temp(output_path, lambda tmp_path: img.save(tmp_path, **save_kwargs))
+
+
+def write_bytes_atomic(data, output_path):
+    """Write already-encoded bytes with the same guarantees as save_atomic"""
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+    _write_via_temp(output_path, write)
+
+
+def link_atomic(source_path, output_path):
+    """Hard-link an existing output into place as `output_path`; copies where links are unsupported"""
+    def link(tmp_path):
+        try:
+            os.link(source_path, tmp_path)
+        except OSError:
+            shutil.copyfile(source_path, tmp_path)
+    _write_via_temp(output_path, link)
+
+
+def encode_for_target_size(img, settings, save_kwargs, quality_hint=None):
+    """Search quality in memory until the output fits settings.target_size_kb.
+
+    Returns (quality, data, trials).
+    """
+    max_bytes = settings.target_size_kb * 1024
+    quality, data, trials, met = quality_search.search_quality_for_size(
+        img, save_kwargs, max_bytes, settings.quality, hint=quality_hint)
+    if not met:
+        logging.warning(
+            f"Could not reach {settings.target_size_kb} KB, "
+            f"wrote {len(data) // 1024} KB at quality {quality}")
+    return quality, data, trials
+
+
+def encode_for_ssim(img, settings, save_kwargs, quality_hint=None):
+    """Search the lowest quality that keeps settings.ssim_threshold.
+
+    Returns (quality, data, trials).
+    """
+    quality, data, trials, met, score = perceptual_quality.search_quality_for_ssim(
+        img, save_kwargs, settings.ssim_threshold, settings.quality, hint=quality_hint)
+    if not met:
+        logging.warning(
+            f"SSIM {score:.4f} below {settings.ssim_threshold} even at quality {quality}")
+    return quality, data, trials
+
+
+def encode_image(img, output_path, settings, save_kwargs, quality_hint=None, timer=None,
+                 write=None):
+    """Encode `img` to `output_path` using the settings' quality mode.
+
+    Encoding happens in memory so it can be timed apart from the disk
+    write. A `write(data, output_path, output_format)` callable takes
+    over the write, e.g. to defer it to a writer thread. Returns
+    (quality, trials).
+    """
+    output_format = settings.output_format
+    with measure(timer, "encode", output_format):
+        if settings.target_size_enabled:
+            quality, data, trials = encode_for_target_size(img, settings, save_kwargs, quality_hint)
+        elif settings.auto_quality_enabled:
+            quality, data, trials = encode_for_ssim(img, settings, save_kwargs, quality_hint)
+        elif settings.lossless_png_enabled:
+            metadata = {key: save_kwargs[key] for key in ("icc_profile", "exif") if key in save_kwargs}
+            data, trials = png_optimizer.optimize(
+                img, metadata, settings.effort, settings.png_trial_seconds)
+            quality = settings.quality
+        else:
+            with io.BytesIO() as buffer:
+                img.save(buffer, **save_kwargs)
+                quality, data, trials = settings.quality, buffer.getvalue(), 1
+    if write is not None:
+        write(data, output_path, output_format)
+    else:
+        with measure(timer, "write", output_format):
+            write_bytes_atomic(data, output_path)
+    return quality, trials
+
+
+def compress_renditions(img, file_path, index, output_dir, settings, source_info,
+                        quality_hint=None, source_size=None, timer=None, write=None):
+    """Decode-once rendition set: every width x format from one source image.
+
+    Returns (output_paths, quality of the first output, total trials). If an
+    encode fails, the renditions this call wrote are removed again.
+    """
+    formats = settings.rendition_formats or [settings.output_format]
+    outputs = []
+    first_quality = 0
+    trials = 0
+    try:
+        for width, rendition in rendition_chain(img, settings.rendition_widths, settings,
+                                                source_size, timer):
+            for output_format in formats:
+                format_settings = replace(settings, output_format=output_format)
+                with measure(timer, "convert", output_format):
+                    converted = convert_for_format(rendition, output_format)
+                output_path = rendition_path_for(
+                    file_path, index, output_dir, settings, rendition.size, output_format)
+                try:
+                    quality, format_trials = encode_image(
+                        converted, output_path, format_settings,
+                        build_save_kwargs(converted, format_settings, source_info), quality_hint,
+                        timer, write)
+                finally:
+                    if converted is not rendition:
+                        converted.close()
+                first_quality = first_quality or quality
+                trials += format_trials
+                outputs.append(output_path)
+    except BaseException:
+        # With a `write` callable nothing is on disk yet, and a file that
+        # is there may be a valid output of an earlier run
+        if write is None:
+            for output_path in outputs:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+        raise
+    return outputs, first_quality, trials
+
+
+def estimate_memory(file_path, settings):
+    """Rough peak bytes of decoded pixels compress_file holds for `file_path`.
+
+    Only the header is read: the decoded frame after any draft or strip
+    reduction, plus the resized and converted frames made from it. Pillow stores
+    multi-band pixels in 4 bytes, so that is used throughout. Returns 0 if
+    the header cannot be read; compress_file will report the error.
+    """
+    try:
+        with large_image.open_image(file_path, settings.max_pixels) as img:
+            original_size = prepare_decode(img, settings)
+            reduce_factor = strip_reduce_factor(img, original_size, settings)
+            if not reduce_factor and _streams_to_png(img, settings):
+                # A strip, its filtered copy and the compressor's output
+                return 3 * large_image.STRIP_BYTES
+            decoded = img.width * img.height * BYTES_PER_PIXEL
+    except Exception:
+        return 0
+    if reduce_factor:
+        decoded = decoded // (reduce_factor * reduce_factor) + 2 * large_image.STRIP_BYTES
+    target = decode_target_size(original_size, settings)
+    derived = target[0] * target[1] * BYTES_PER_PIXEL if target else decoded
+    return decoded + 2 * derived
+
+
+def strip_reduce_factor(img, original_size, settings):
+    """Box-reduce factor for reading a large PNG in strips, or 0 to decode it whole.
+
+    Strips are used when the image is large enough and the pipeline
+    shrinks it by at least twice RESIZE_REDUCING_GAP; the final LANCZOS
+    pass then starts from the reduced frame.
+    """
+    if not large_image.PngStripReader.supports(img):
+        return 0
+    target = decode_target_size(original_size, settings)
+    if target is None:
+        return 0
+    scale = min(original_size[0] / target[0], original_size[1] / target[1])
+    factor = int(scale / RESIZE_REDUCING_GAP)
+    return factor if factor >= 2 else 0
+
+
+def _streams_to_png(img, settings):
+    # Full-resolution PNG to PNG can be re-encoded strip by strip
+    return (settings.output_format == "png" and not settings.renditions_enabled
+            and decode_target_size(img.size, settings) in (None, img.size)
+            and large_image.PngStripReader.supports(img))
+
+
+def _compress_decoded(img, file_path, index, output_dir, settings, source_info,
+                      quality_hint, original_size, timer, write=None):
+    """Resize, convert and encode a decoded image; returns (outputs, quality, trials)"""
+    if settings.renditions_enabled:
+        return compress_renditions(
+            img, file_path, index, output_dir, settings, source_info, quality_hint,
+            original_size, timer, write)
+    processed = process_image(img, settings, original_size, timer)
+    try:
+        output_path = output_path_for(file_path, index, output_dir, settings, original_size)
+        quality, trials = encode_image(
+            processed, output_path, settings,
+            build_save_kwargs(processed, settings, source_info), quality_hint, timer, write)
+    finally:
+        if processed is not img:
+            processed.close()
+    return [output_path], quality, trials
+
+
+def _open_source(file_path, source, max_pixels):
+    """Open prefetched `source` bytes, or `file_path` when there are none"""
+    if source is None:
+        return large_image.open_image(file_path, max_pixels)
+    img = large_image.open_image(io.BytesIO(source), max_pixels)
+    if img.format == "PNG" and img.width * img.height > large_image.LARGE_IMAGE_PIXELS:
+        # Large PNGs may be read in strips, which works from the file
+        img.close()
+        return large_image.open_image(file_path, max_pixels)
+    return img
+
+
+def compress_file(file_path, output_dir, settings, index=0, quality_hint=None,
+                  source=None, defer_writes=False):
+    """Compress a single image and return a CompressionResult.
+
+    `quality_hint` seeds the target-size or auto-quality search with what
+    earlier images in the batch needed. Errors are captured on the result
+    instead of raised so batch callers can keep going.
+
+    `source` is the file's content if it was already read. With
+    `defer_writes` the encoded outputs are left on result.pending_writes
+    for the caller to write instead of being written here.
+    """
+    result = CompressionResult(input_path=str(file_path))
+    timer = StageTimer()
+
+    def defer(data, output_path, output_format):
+        result.pending_writes.append((output_path, data, output_format))
+
+    write = defer if defer_writes else None
+    try:
+        result.input_bytes = len(source) if source is not None else os.path.getsize(file_path)
+        with timer.measure("open"):
+            img = _open_source(file_path, source, settings.max_pixels)
+        with img:
+            source_format = (img.format or "").lower()
+            source_info = dict(img.info)
+            original_size = prepare_decode(img, settings)
+            reduce_factor = strip_reduce_factor(img, original_size, settings)
+            if not reduce_factor and _streams_to_png(img, settings):
+                output_path = output_path_for(
+                    file_path, index, output_dir, settings, original_size)
+                with timer.measure("encode", "png"):
+                    large_image.write_png_strips(
+                        file_path, output_path,
+                        source_info if settings.preserve_metadata else None,
+                        compress_level=png_compress_level(settings.effort))
+                result.outputs, result.quality, result.trials = [output_path], settings.quality, 1
+            else:
+                with timer.measure("decode", source_format):
+                    if reduce_factor:
+                        decoded = large_image.reduce_png(file_path, reduce_factor)
+                    else:
+                        img.load()
+                        decoded = img
+                try:
+                    result.outputs, result.quality, result.trials = _compress_decoded(
+                        decoded, file_path, index, output_dir, settings, source_info,
+                        quality_hint, original_size, timer, write)
+                finally:
+                    if decoded is not img:
+                        decoded.close()
+        result.output_path = result.outputs[0]
+        deferred = {path: len(data) for path, data, _ in result.pending_writes}
+        result.output_bytes = sum(deferred[path] if path in deferred else os.path.getsize(path)
+                                  for path in result.outputs)
+    except Exception as e:
+        logging.error(f"Error processing {file_path}: {str(e)}")
+        result.error = str(e)
+        result.pending_writes = []
+    result.timings = timer.samples
+    return result
+
+
+def default_workers():
+    """Default worker process count: one per CPU core"""
+    return os.cpu_count() or 1
+
+
+def peak_rss_mb():
+    """Peak resident set size in MB of this process or any finished worker.
+
+    This is the largest single process, not the sum across workers; with
+    a memory budget the sum stays near the budget plus each worker's
+    interpreter overhead. Returns None where the resource module is unavailable (Windows).
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports KiB, macOS bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+class BatchControl:
+    """Thread-safe cancel and pause/resume switches for a running batch.
+
+    The batch checks them between files, so a file that has started is
+    always finished (or fails) before the batch stops or pauses.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._paused_at = None
+        self.paused_seconds = 0.0
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wake up a paused batch so it can stop
+        self.resume()
+
+    def pause(self):
+        if not self.paused:
+            self._paused_at = time.monotonic()
+            self._running.clear()
+
+    def resume(self):
+        if self.paused:
+            self.paused_seconds += time.monotonic() - self._paused_at
+            self._paused_at = None
+            self._running.set()
+
+    def checkpoint(self):
+        """Block while paused; return False if the batch should stop"""
+        self._running.wait()
+        return not self.cancelled
+
+
+class EffortScheduler:
+    """Lower the encoder effort when a batch is falling behind its deadline.
+
+    Throughput is measured over the files encoded at the current effort
+    tier; when the remaining files would not finish within `deadline`
+    seconds (excluding time spent paused) at that rate, the rest of the
+    batch drops to the next cheaper tier. Effort is never raised again.
+    """
+
+    def __init__(self, settings, deadline, total, control, min_samples=3):
+        self.settings = settings
+        self.deadline = deadline
+        self.total = total
+        self.control = control
+        self.min_samples = min_samples
+        self.started = time.monotonic()
+        self._tier_started = 0.0
+        self._tier_done = 0
+        self._warned = False
+
+    def _elapsed(self):
+        return time.monotonic() - self.started - self.control.paused_seconds
+
+    def record(self, done, settings_used):
+        """Account for an encoded file; `done` counts all finished files so far"""
+        if settings_used.effort != self.settings.effort:
+            return
+        self._tier_done += 1
+        if self._tier_done < self.min_samples:
+            return
+        elapsed = self._elapsed()
+        rate = self._tier_done / max(elapsed - self._tier_started, 1e-6)
+        projected = elapsed + (self.total - done) / rate
+        if projected <= self.deadline:
+            return
+        tier = EFFORT_TIERS.index(self.settings.effort)
+        if tier == 0:
+            if not self._warned:
+                logging.warning(f"Batch will miss its {self.deadline:.0f}s deadline even at "
+                                f"the fastest effort (projected {projected:.0f}s)")
+                self._warned = True
+            return
+        logging.info(f"Projected finish {projected:.0f}s is past the {self.deadline:.0f}s deadline "
+                     f"after {done} of {self.total} files; lowering effort from "
+                     f"{self.settings.effort} to {EFFORT_TIERS[tier - 1]}")
+        self.settings = replace(self.settings, effort=EFFORT_TIERS[tier - 1])
+        self._tier_started = elapsed
+        self._tier_done = 0
+
+
+def compress_batch(files, output_dir, settings, progress_callback=None, workers=None,
+                   control=None, incremental=False, memory_limit=None, deadline=None,
+                   pipeline_depth=0, dedup=None,
+                   dedup_distance=duplicate_finder.DEFAULT_MAX_DISTANCE, journal=None,
+                   output_subdirs=None, numbers=None):
+    """Compress `files` into `output_dir`.
+
+    With more than one worker the decode/resize/encode/write of each file
+    runs in a pool of worker processes (workers=None or 0 uses one per
+    core). Every file keeps its position in `files` as its index, so the
+    {number} rename variable does not depend on completion order.
+
+    progress_callback(done, total, result) is called in the calling
+    process after every file, in completion order. An optional
+    BatchControl lets another thread pause or cancel the batch between
+    files. With `incremental` the output directory's manifest is used to
+    skip files whose content and settings have not changed.
+
+    `memory_limit` (bytes) bounds the estimated decoded pixel memory of
+    the files in flight across all workers: a file is only handed to the
+    pool when its estimate fits next to the ones already running. A file
+    larger than the whole budget runs on its own.
+
+    With a `deadline` (seconds) an EffortScheduler lowers the effort tier
+    for the rest of the batch whenever the measured throughput says the
+    batch would otherwise finish late. Each file is recorded in the
+    manifest with the effort it was actually encoded at.
+
+    A `pipeline_depth` above 0 overlaps I/O with compression for slow
+    (e.g. network) storage: the next `pipeline_depth` inputs are read
+    ahead into memory, and encoded outputs go through a bounded queue to
+    a writer thread that writes each with temp-file-plus-rename.
+
+    A `dedup` policy from duplicate_finder.DEDUP_POLICIES first clusters
+    exact and near-duplicate inputs (dHash at most `dedup_distance` bits
+    apart) and compresses one file per cluster: "skip" keeps the first
+    file in the queue, "keep-largest" the one with the most pixels, and
+    "hardlink" also keeps the largest but gives every other file in the
+    cluster hard links to its outputs. Redundant files come back as
+    skipped results with `duplicate_of` set.
+
+    With a job_journal.JobJournal every finished file is journaled, files
+    the journal lists as completed by an earlier run come back as skipped
+    results with `resumed` set, without being touched, and the journal is marked finished
+    (and closed) when the batch runs to the end.
+
+    `output_subdirs`, if given, holds a directory relative to `output_dir`
+    for each file ("" for the top), so a source tree can be kept instead
+    of flattened. A file whose output name an earlier file in the batch
+    already takes fails instead of overwriting that output. `numbers`, if
+    given, is the {number} of each file instead of its position counted
+    from settings.start_number.
+
+    Returns the CompressionResults of the processed files in input order;
+    per-file errors are recorded on the results rather than raised.
+    """
+    settings.validate()
+    os.makedirs(output_dir, exist_ok=True)
+
+    files = list(files)
+    total = len(files)
+    output_dirs = _output_dirs(output_dir, output_subdirs, total)
+    name_indexes = _name_indexes(numbers, settings, total)
+    collisions = _output_collisions(files, output_dirs, name_indexes, settings)
+    if control is None:
+        control = BatchControl()
+    if not workers or workers < 0:
+        workers = default_workers()
+    workers = min(workers, total)
+
+    manifest = CompressionManifest.load(output_dir) if incremental else None
+    duplicates = (duplicate_finder.find_duplicates(files, dedup, dedup_distance, workers,
+                                                   settings.max_pixels, control)
+                  if dedup else None)
+    scheduler = (EffortScheduler(settings, deadline, total, control, min_samples=max(3, workers))
+                 if deadline else None)
+    read_ahead = pipelined_io.ReadAhead(files, pipeline_depth) if pipeline_depth else None
+    writer = (pipelined_io.AsyncWriter(write_bytes_atomic, pipeline_depth)
+              if pipeline_depth else None)
+    link = partial(_link_duplicate, output_dirs=output_dirs, name_indexes=name_indexes,
+                   settings=settings)
+    batch = _BatchProgress(total, manifest, scheduler, progress_callback, writer, duplicates, link,
+                           journal, collisions, name_indexes)
+    try:
+        if workers <= 1:
+            _compress_sequential(files, output_dirs, settings, control, batch, read_ahead)
+        else:
+            _compress_parallel(files, output_dirs, settings, control, batch, workers,
+                               memory_limit, read_ahead)
+        results = batch.close()
+        if journal is not None and not control.cancelled:
+            journal.finish()
+        return results
+    finally:
+        # Outputs must be on disk before the manifest records them
+        batch.close()
+        if read_ahead is not None:
+            read_ahead.close()
+        if manifest is not None:
+            manifest.save()
+        if journal is not None:
+            journal.close()
+
+
+def _output_dirs(output_dir, output_subdirs, total):
+    """Output directory of each file, created as needed"""
+    if not output_subdirs:
+        return [output_dir] * total
+    if len(output_subdirs) != total:
+        raise ValueError("output_subdirs must give one directory per file")
+    output_dirs = [os.path.normpath(os.path.join(output_dir, subdir)) for subdir in output_subdirs]
+    for directory in set(output_dirs):
+        os.makedirs(directory, exist_ok=True)
+    return output_dirs
+
+
+def _name_indexes(numbers, settings, total):
+    """Index each file's output name is generated with, so that its {number} is numbers[i]"""
+    if numbers is None:
+        return list(range(total))
+    if len(numbers) != total:
+        raise ValueError("numbers must give one number per file")
+    return [number - settings.start_number for number in numbers]
+
+
+def _output_collisions(files, output_dirs, name_indexes, settings):
+    """Index -> earlier file with the same output path, for names known before decoding.
+
+    Rendition names and {width}/{height} patterns depend on the decoded
+    size, so those are not checked.
+    """
+    if settings.renditions_enabled or (settings.rename_enabled and (
+            "{width" in settings.rename_pattern or "{height" in settings.rename_pattern)):
+        return {}
+    owners = {}
+    collisions = {}
+    for i, file_path in enumerate(files):
+        key = path_key(output_path_for(file_path, name_indexes[i], output_dirs[i], settings))
+        owner = owners.setdefault(key, i)
+        if owner != i:
+            collisions[i] = files[owner]
+    if collisions:
+        logging.warning(f"{len(collisions)} files would overwrite the output of another file "
+                        f"in the batch and are not compressed")
+    return collisions
+
+
+def _manifest_number(settings, index):
+    # Only patterns can make the output name depend on the {number}
+    if settings.rename_enabled or settings.renditions_enabled:
+        return settings.start_number + index
+    return None
+
+
+def _skip_unchanged(manifest, file_path, settings, index):
+    """Return a skipped CompressionResult if the manifest says `file_path` is up to date"""
+    if manifest is None:
+        return None
+    try:
+        entry = manifest.lookup(file_path, settings.cache_key(), _manifest_number(settings, index))
+    except OSError:
+        return None
+    if entry is None:
+        return None
+    return CompressionResult(
+        input_path=str(file_path),
+        output_path=entry["output_path"],
+        input_bytes=entry["size"],
+        output_bytes=entry["output_bytes"],
+        outputs=entry.get("outputs") or [entry["output_path"]],
+        skipped=True)
+
+
+def _record_result(manifest, result, settings, index):
+    if manifest is None or not result.ok or result.skipped:
+        return
+    try:
+        manifest.record(result, settings.cache_key(), _manifest_number(settings, index))
+    except OSError as e:
+        logging.warning(f"Could not record {result.input_path} in manifest: {str(e)}")
+
+
+def _duplicate_output_path(kept_output, file_path, index, output_dir, settings, size):
+    """Where `file_path` would have written the output that `kept_output` stands in for"""
+    if settings.renditions_enabled:
+        with Image.open(kept_output) as img:
+            rendition_size = img.size
+        return rendition_path_for(file_path, index, output_dir, settings, rendition_size,
+                                  os.path.splitext(kept_output)[1][1:])
+    return output_path_for(file_path, index, output_dir, settings, size or (0, 0))
+
+
+def _link_duplicate(kept, file_path, index, size, output_dirs, name_indexes, settings):
+    """Result for a redundant file whose outputs are hard links to those of `kept`"""
+    result = CompressionResult(input_path=str(file_path), skipped=True, duplicate_of=kept.input_path)
+    if not kept.ok:
+        result.error = f"Duplicate of {os.path.basename(kept.input_path)}, which failed"
+        return result
+    try:
+        result.input_bytes = os.path.getsize(file_path)
+        for kept_output in kept.outputs:
+            output_path = _duplicate_output_path(
+                kept_output, file_path, name_indexes[index], output_dirs[index], settings, size)
+            if output_path != kept_output:
+                link_atomic(kept_output, output_path)
+            result.outputs.append(output_path)
+        result.output_path = result.outputs[0]
+        result.output_bytes = sum(os.path.getsize(path) for path in result.outputs)
+    except Exception as e:
+        logging.error(f"Error linking duplicate {file_path}: {str(e)}")
+        result.error = str(e)
+    return result
+
+
+class _BatchProgress:
+    """Finish results in completion order: manifest, effort scheduler, progress.
+
+    With an AsyncWriter a result whose outputs are still to be written is
+    only finished once the writer is done with it, so the manifest and the
+    progress callback never see a file that is not on disk yet. Files a
+    DuplicatePlan makes redundant are skipped, or with the "hardlink"
+    policy linked through `link` once every output is written. Finished
+    files are appended to the JobJournal, if any. Files in `collisions`
+    (index -> earlier file with the same output path) fail. Output names
+    and the manifest use name_indexes[i] for files[i].
+    """
+
+    def __init__(self, total, manifest, scheduler, progress_callback, writer=None,
+                 duplicates=None, link=None, journal=None, collisions=None, name_indexes=None):
+        self.total = total
+        self.manifest = manifest
+        self.scheduler = scheduler
+        self.progress_callback = progress_callback
+        self.writer = writer
+        self.duplicates = duplicates
+        self.link = link
+        self.journal = journal
+        self.collisions = collisions or {}
+        self.name_indexes = name_indexes if name_indexes is not None else list(range(total))
+        self.history = QualityHistory()
+        self.results = [None] * total
+        self.done = 0
+        self._to_link = []
+
+    def skipped(self, index, result):
+        self._finish(result, index, None)
+
+    def resumed(self, index, file_path):
+        """Finish files[index] from the journal if an earlier run completed it"""
+        entry = self.journal.completed.get(index) if self.journal is not None else None
+        if entry is None:
+            return False
+        outputs = [path for path, _ in entry["outputs"]]
+        self._finish(CompressionResult(input_path=str(file_path),
+                                       output_path=outputs[0] if outputs else "",
+                                       input_bytes=entry["input_bytes"],
+                                       output_bytes=entry["output_bytes"],
+                                       outputs=outputs, skipped=True, resumed=True),
+                     index, None, journaled=True)
+        return True
+
+    def collides(self, index, file_path):
+        """Fail files[index] if an earlier file has its output path; returns False otherwise"""
+        earlier = self.collisions.get(index)
+        if earlier is None:
+            return False
+        self._finish(CompressionResult(
+            input_path=str(file_path),
+            error=f"Output name is already used by {earlier}"), index, None)
+        return True
+
+    def duplicate(self, index):
+        """Take care of files[index] if it is redundant; returns False for files to compress"""
+        keeper = self.duplicates.keeper(index) if self.duplicates is not None else None
+        if keeper is None:
+            return False
+        if self.duplicates.policy == "hardlink":
+            self._to_link.append((index, keeper))
+        else:
+            self._finish(CompressionResult(input_path=str(self.duplicates.files[index]), skipped=True,
+                                           duplicate_of=str(self.duplicates.files[keeper])),
+                         index, None)
+        return True
+
+    def computed(self, index, result, file_settings):
+        self.history.add(result.quality)
+        if self.writer is not None and result.pending_writes:
+            # Blocks while the writer is `depth` results behind
+            self.writer.submit(result, (index, file_settings))
+        else:
+            self._finish(result, index, file_settings)
+        if self.writer is not None:
+            for written, (written_index, written_settings) in self.writer.completed():
+                self._finish(written, written_index, written_settings)
+
+    def _finish(self, result, index, file_settings, journaled=False):
+        self.results[index] = result
+        self.done += 1
+        if self.journal is not None and not journaled:
+            self.journal.record(index, result)
+        if file_settings is not None:
+            _record_result(self.manifest, result, file_settings, self.name_indexes[index])
+            if self.scheduler:
+                self.scheduler.record(self.done, file_settings)
+        if self.progress_callback:
+            self.progress_callback(self.done, self.total, result)
+
+    def close(self):
+        """Wait for outstanding writes; return the finished results in input order"""
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            for written, (written_index, written_settings) in writer.close():
+                self._finish(written, written_index, written_settings)
+        to_link, self._to_link = self._to_link, []
+        for index, keeper in to_link:
+            # A cancelled batch may never have reached the kept file
+            if self.results[keeper] is not None:
+                self._finish(self.link(self.results[keeper], self.duplicates.files[index], index,
+                                       self.duplicates.image_sizes[index]),
+                             index, None)
+        return [result for result in self.results if result is not None]
+
+
+def _read_source(read_ahead, index):
+    """Prefetched bytes of files[index] and the read time, or (None, 0) without read-ahead"""
+    if read_ahead is None:
+        return None, 0.0
+    return read_ahead.take(index)
+
+
+def _add_read_timing(result, read_seconds):
+    if read_seconds:
+        result.timings.insert(0, ("read", "", read_seconds))
+
+
+def _compress_sequential(files, output_dirs, settings, control, batch, read_ahead=None):
+    total = len(files)
+    for i, file_path in enumerate(files):
+        if not control.checkpoint():
+            logging.info(f"Batch cancelled after {i} of {total} files")
+            break
+        if batch.resumed(i, file_path) or batch.collides(i, file_path) or batch.duplicate(i):
+            continue
+        result = _skip_unchanged(batch.manifest, file_path, settings, batch.name_indexes[i])
+        if result is not None:
+            batch.skipped(i, result)
+            continue
+        file_settings = batch.scheduler.settings if batch.scheduler else settings
+        source, read_seconds = _read_source(read_ahead, i)
+        result = compress_file(file_path, output_dirs[i], file_settings, batch.name_indexes[i],
+                               batch.history.hint(), source, defer_writes=batch.writer is not None)
+        _add_read_timing(result, read_seconds)
+        batch.computed(i, result, file_settings)
+
+
+def _init_worker(trial_workers):
+    png_optimizer.trial_workers = trial_workers
+
+
+def _compress_parallel(files, output_dirs, settings, control, batch, workers,
+                       memory_limit=None, read_ahead=None):
+    # Deferred: the process pool machinery is a noticeable share of app start-up
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    total = len(files)
+    logging.info(f"Compressing {total} images with {workers} worker processes")
+    # Share the cores between the pool and each worker's PNG trial threads
+    # Workers are spawned, not forked: forking the GUI process while the batch,
+    # read-ahead and writer threads hold locks can deadlock the children
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(max(1, default_workers() // workers),)) as executor:
+        # Keep a bounded number of files in flight so pause and cancel take
+        # effect quickly instead of after the whole queue was submitted
+        pending = {}
+        next_index = 0
+        # Memory estimate of files[next_index] once it passed the manifest check
+        next_estimate = None
+        in_flight_bytes = 0
+        peak_in_flight = 0
+        while next_index < total or pending:
+            while next_index < total and len(pending) < workers * 2:
+                if control.paused and pending:
+                    break
+                if not control.checkpoint():
+                    next_index = total
+                    break
+                if next_estimate is None:
+                    if (batch.resumed(next_index, files[next_index])
+                            or batch.collides(next_index, files[next_index])
+                            or batch.duplicate(next_index)):
+                        next_index += 1
+                        continue
+                    skipped = _skip_unchanged(batch.manifest, files[next_index], settings,
+                                              batch.name_indexes[next_index])
+                    if skipped is not None:
+                        batch.skipped(next_index, skipped)
+                        next_index += 1
+                        continue
+                    next_estimate = (estimate_memory(files[next_index], settings)
+                                     if memory_limit else 0)
+                if memory_limit and pending and in_flight_bytes + next_estimate > memory_limit:
+                    # Wait for running files to release memory
+                    break
+                file_settings = batch.scheduler.settings if batch.scheduler else settings
+                source, read_seconds = _read_source(read_ahead, next_index)
+                future = executor.submit(
+                    compress_file, files[next_index], output_dirs[next_index], file_settings,
+                    batch.name_indexes[next_index], batch.history.hint(), source, batch.writer is not None)
+                pending[future] = (next_index, next_estimate, file_settings, read_seconds)
+                in_flight_bytes += next_estimate
+                peak_in_flight = max(peak_in_flight, in_flight_bytes)
+                next_index += 1
+                next_estimate = None
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i, estimate, file_settings, read_seconds = pending.pop(future)
+                in_flight_bytes -= estimate
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Worker crashed (e.g. killed by the OS) before returning a result
+                    logging.error(f"Worker failed on {files[i]}: {str(e)}")
+                    result = CompressionResult(input_path=str(files[i]), error=str(e))
+                _add_read_timing(result, read_seconds)
+                batch.computed(i, result, file_settings)
+
+    if control.cancelled:
+        logging.info(f"Batch cancelled after {batch.done} of {total} files")
+    if memory_limit:
+        logging.info(f"Peak estimated pixel memory in flight: {peak_in_flight / (1024 * 1024):.0f} MB "
+                     f"of {memory_limit / (1024 * 1024):.0f} MB budget")
+
+
+def summarize_results(results):
+    """Aggregate counts and byte totals for a finished batch"""
+    succeeded = [r for r in results if r.ok]
+    duplicates = [r for r in results if r.duplicate_of]
+    resumed = [r for r in results if r.resumed]
+    skipped = [r for r in results if r.skipped and not r.duplicate_of and not r.resumed]
+    input_bytes = sum(r.input_bytes for r in succeeded)
+    output_bytes = sum(r.output_bytes for r in succeeded)
+    return {
+        "total": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "skipped": len(skipped),
+        "duplicates": len(duplicates),
+        "resumed": len(resumed),
+        "encode_trials": sum(r.trials for r in results),
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "saved_bytes": input_bytes - output_bytes,
+    }
+
+
+def timing_report(results):
+    """Aggregate the per-stage timings of a batch into a TimingReport"""
+    report = TimingReport()
+    for result in results:
+        report.add(result.timings)
+    return report
+
+
+def format_failures(results, limit=10):
+    """Human-readable list of failed files for a summary dialog or log"""
+    failed = [r for r in results if not r.ok]
+    lines = [f"{os.path.basename(r.input_path)}: {r.error}" for r in failed[:limit]]
+    if len(failed) > limit:
+        lines.append(f"... and {len(failed) - limit} more")
+    return "\n".join(lines)
@@ -0,0 +1,114 @@
+"""
+Incremental re-compression manifest.
+
+The manifest lives in the output directory and maps every input file to
+its content hash, the effective settings it was compressed with and the
+output it produced. A rerun skips files whose content and settings are
+unchanged and whose output still exists. Content hashes are reused while
+an input's size and mtime are unchanged, so an unchanged tree is checked
+with one stat per file instead of reading every byte.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+MANIFEST_NAME = ".image_compressor_manifest.json"
+MANIFEST_VERSION = 1
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def hash_file(file_path):
+    """SHA-256 of the file's content"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CompressionManifest:
+    """Input hash + settings -> output mapping for one output directory"""
+
+    def __init__(self, output_dir, entries=None):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = entries or {}
+        self._dirty = False
+
+    @classmethod
+    def load(cls, output_dir):
+        path = os.path.join(output_dir, MANIFEST_NAME)
+        entries = {}
+        try:
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    entries = data.get("entries", {})
+                logging.debug(f"Loaded manifest with {len(entries)} entries from {path}")
+        except Exception as e:
+            logging.error(f"Error loading manifest {path}: {str(e)}")
+        return cls(output_dir, entries)
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def content_hash(self, file_path, stat=None):
+        """Hash of `file_path`, reused from the manifest while size and mtime match"""
+        if stat is None:
+            stat = os.stat(file_path)
+        entry = self.entries.get(os.path.abspath(file_path))
+        if (entry and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns):
+            return entry["hash"]
+        return hash_file(file_path)
+
+    def lookup(self, file_path, settings_key, number):
+        """Return the recorded entry if `file_path` can be skipped, else None"""
+        key = os.path.abspath(file_path)
+        entry = self.entries.get(key)
+        if not entry or entry["settings"] != settings_key:
+            return None
+        # Output names with {number} depend on the number the file was given
+        if entry.get("number") is not None and entry["number"] != number:
+            return None
+        outputs = entry.get("outputs") or [entry["output_path"]]
+        if not all(os.path.exists(path) for path in outputs):
+            return None
+        if self.content_hash(file_path) != entry["hash"]:
+            return None
+        return entry
+
+    def number(self, file_path):
+        """The {number} `file_path` was last compressed with, or None"""
+        entry = self.entries.get(os.path.abspath(file_path))
+        return entry.get("number") if entry else None
+
+    def max_number(self):
+        """Highest {number} recorded, or None"""
+        return max((entry["number"] for entry in self.entries.values()
+                    if entry.get("number") is not None), default=None)
+
+    def record(self, result, settings_key, number=None):
+        """Remember a successful CompressionResult"""
+        stat = os.stat(result.input_path)
+        self.entries[os.path.abspath(result.input_path)] = {
+            "hash": self.content_hash(result.input_path, stat),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "settings": settings_key,
+            "number": number,
+            "output_path": result.output_path,
+            "outputs": result.outputs,
+            "output_bytes": result.output_bytes,
+        }
+        self._dirty = True
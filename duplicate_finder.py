@@ -0,0 +1,292 @@
+"""
+Exact and near-duplicate detection for a batch.
+
+Files of equal size are compared by a SHA-256 of their content, so exact
+copies are found without decoding anything. Every remaining file gets a
+64-bit difference hash (dHash): the image is decoded at a reduced scale
+(JPEG DCT scaling, strip reduction for huge PNGs), shrunk to a 9x8
+greyscale thumbnail on a process pool, and the hashes of all thumbnails
+are computed at once with NumPy.
+
+Near duplicates are pairs of hashes at most `max_distance` bits apart.
+Instead of comparing all pairs, the 64 bits are cut into max_distance + 1
+bands: two hashes that close must agree exactly on at least one band, so
+only files sharing a band value are compared. Flat or featureless images
+hash to (nearly) all zeros or all ones whatever their content, so such
+hashes are never near matches, and a candidate pair must also agree on
+mean colour and aspect ratio. Pairs are merged into clusters with a
+union-find.
+"""
+
+import logging
+import os
+import time
+from collections import defaultdict
+
+from compression_manifest import hash_file
+from image_preview import apply_orientation
+from image_probe import EXIF_ORIENTATION_TAG, read_exif
+import large_image
+from lazy_imports import lazy_module
+
+# Imported on first use
+Image = lazy_module("PIL.Image")
+np = lazy_module("numpy")
+NUMPY_AVAILABLE = np is not None
+
+DEDUP_POLICIES = ("skip", "keep-largest", "hardlink")
+
+# Hamming distance (of 64 bits) up to which two images count as the same
+DEFAULT_MAX_DISTANCE = 4
+# Hashes with fewer set (or unset) bits carry too little detail to compare
+_MIN_HASH_BITS = 8
+# Largest per-channel difference of mean colour (0-255) between near duplicates
+_MAX_MEAN_DIFFERENCE = 16
+# Largest relative difference of aspect ratio between near duplicates
+_MAX_ASPECT_DIFFERENCE = 0.05
+
+_HASH_WIDTH, _HASH_HEIGHT = 9, 8
+# Intermediate size the orientation is applied at
+_THUMBNAIL_SIZE = (32, 32)
+# Hashes compared at once within one band bucket
+_COMPARE_BLOCK = 1024
+_CHUNKSIZE = 64
+
+
+def thumbnail(file_path, max_pixels=large_image.DEFAULT_MAX_PIXELS):
+    """(9x8 greyscale thumbnail bytes, stored size, mean RGB) of an image.
+
+    All three are None if the image cannot be read.
+    """
+    try:
+        with large_image.open_image(file_path, max_pixels) as img:
+            size = img.size
+            orientation = read_exif(img).get(EXIF_ORIENTATION_TAG, 1)
+            if img.format == "JPEG":
+                # libjpeg decodes at 1/8 scale
+                img.draft("RGB", _THUMBNAIL_SIZE)
+            elif (large_image.PngStripReader.supports(img)
+                    and img.width * img.height > large_image.LARGE_IMAGE_PIXELS):
+                factor = max(1, min(img.width // _THUMBNAIL_SIZE[0], img.height // _THUMBNAIL_SIZE[1]))
+                with large_image.reduce_png(file_path, factor) as reduced:
+                    small = reduced.convert("RGB").resize(_THUMBNAIL_SIZE, Image.Resampling.BOX)
+                return _hash_thumbnail(small, orientation), size, _mean_colour(small)
+            small = img.convert("RGB").resize(_THUMBNAIL_SIZE, Image.Resampling.BOX)
+        return _hash_thumbnail(small, orientation), size, _mean_colour(small)
+    except Exception as e:
+        logging.debug(f"Cannot hash {file_path}: {str(e)}")
+        return None, None, None
+
+
+def _hash_thumbnail(small, orientation):
+    small = apply_orientation(small.convert("L"), orientation)
+    return small.resize((_HASH_WIDTH, _HASH_HEIGHT), Image.Resampling.BOX).tobytes()
+
+
+def _mean_colour(small):
+    return small.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+
+
+def dhashes(thumbnails):
+    """uint64 dHash of each 9x8 thumbnail: bit set where a pixel is brighter than its left neighbour"""
+    pixels = np.frombuffer(b"".join(thumbnails), dtype=np.uint8).reshape(-1, _HASH_HEIGHT, _HASH_WIDTH)
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(pixels), -1), axis=1)
+    return packed.view(">u8").ravel().astype(np.uint64)
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(values.shape + (8,)), axis=-1).sum(axis=-1)
+
+
+def _bands(max_distance):
+    """(shift, mask) of the max_distance + 1 bit bands of a 64-bit hash"""
+    count = min(max_distance + 1, 64)
+    edges = [64 * i // count for i in range(count + 1)]
+    return [(low, (1 << (high - low)) - 1) for low, high in zip(edges, edges[1:])]
+
+
+def near_pairs(hashes, max_distance=DEFAULT_MAX_DISTANCE):
+    """Set of index pairs (i, j), i < j, whose hashes differ in at most `max_distance` bits.
+
+    Hashes with fewer than _MIN_HASH_BITS set or unset bits are left out.
+    """
+    bits = _popcount(hashes)
+    detailed = np.flatnonzero((bits >= _MIN_HASH_BITS) & (bits <= 64 - _MIN_HASH_BITS))
+    hashes = hashes[detailed]
+    pairs = set()
+    for shift, mask in _bands(max_distance):
+        keys = (hashes >> np.uint64(shift)) & np.uint64(mask)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        ends = np.append(starts[1:], len(keys))
+        shared = ends - starts > 1
+        for start, end in zip(starts[shared], ends[shared]):
+            members = order[start:end]
+            bucket = hashes[members]
+            # Row blocks keep a bucket of identical hashes from needing n^2 memory
+            for first in range(0, len(members), _COMPARE_BLOCK):
+                block = bucket[first:first + _COMPARE_BLOCK]
+                close = _popcount(block[:, None] ^ bucket[None, first:]) <= max_distance
+                rows, cols = np.nonzero(close)
+                rows += first
+                cols += first
+                keep = rows < cols
+                pairs.update(zip(members[rows[keep]].tolist(), members[cols[keep]].tolist()))
+    return {(int(detailed[i]), int(detailed[j])) for i, j in pairs}
+
+
+def _alike(colour_a, colour_b, size_a, size_b):
+    """Cheap check that two images with close hashes can be the same picture"""
+    if max(abs(a - b) for a, b in zip(colour_a, colour_b)) > _MAX_MEAN_DIFFERENCE:
+        return False
+    # Sides are compared sorted, as an EXIF rotation swaps them
+    aspect_a = min(size_a) / max(size_a)
+    aspect_b = min(size_b) / max(size_b)
+    return abs(aspect_a - aspect_b) <= _MAX_ASPECT_DIFFERENCE * max(aspect_a, aspect_b)
+
+
+def _clusters(pairs, count):
+    """Connected components with more than one member, each in index order"""
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    groups = defaultdict(list)
+    for i in range(count):
+        groups[find(i)].append(i)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _content_duplicates(files, file_sizes):
+    """Pairs (i, j) of files with identical content; only equal sizes are hashed"""
+    by_size = defaultdict(list)
+    for i, size in enumerate(file_sizes):
+        if size is not None:
+            by_size[size].append(i)
+    pairs = []
+    for indexes in by_size.values():
+        if len(indexes) < 2:
+            continue
+        first_by_hash = {}
+        for i in indexes:
+            try:
+                digest = hash_file(files[i])
+            except OSError:
+                continue
+            first = first_by_hash.setdefault(digest, i)
+            if first != i:
+                pairs.append((first, i))
+    return pairs
+
+
+def _map_thumbnails(paths, max_pixels, workers, control=None):
+    if workers <= 1 or len(paths) < _CHUNKSIZE:
+        return [thumbnail(path, max_pixels) for path in paths]
+    # Deferred like the batch's own pool, and spawned like it
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    found = []
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        for item in executor.map(partial(thumbnail, max_pixels=max_pixels), paths,
+                                 chunksize=_CHUNKSIZE):
+            found.append(item)
+            if control is not None and len(found) % _CHUNKSIZE == 0 and not control.checkpoint():
+                executor.shutdown(wait=False, cancel_futures=True)
+                break
+    return found
+
+
+class DuplicatePlan:
+    """Which files of a batch are redundant, and the file kept for each"""
+
+    def __init__(self, files, policy, clusters, image_sizes, file_sizes):
+        self.files = files
+        self.policy = policy
+        self.clusters = clusters
+        self.image_sizes = image_sizes
+        # Redundant file index -> index of the file that is compressed instead
+        self.keepers = {}
+        for cluster in clusters:
+            if policy == "skip":
+                keeper = cluster[0]
+            else:
+                # Most pixels, then most bytes; the earliest file wins ties
+                keeper = max(cluster, key=lambda i: (_pixels(image_sizes[i]), file_sizes[i] or 0, -i))
+            for i in cluster:
+                if i != keeper:
+                    self.keepers[i] = keeper
+
+    def __len__(self):
+        return len(self.keepers)
+
+    def keeper(self, index):
+        return self.keepers.get(index)
+
+
+def _pixels(size):
+    return size[0] * size[1] if size else 0
+
+
+def find_duplicates(files, policy="skip", max_distance=DEFAULT_MAX_DISTANCE, workers=1,
+                    max_pixels=large_image.DEFAULT_MAX_PIXELS, control=None):
+    """Cluster exact and near-duplicate `files` and return a DuplicatePlan for `policy`.
+
+    A negative `max_distance` only finds exact copies, as does a missing
+    NumPy. Thumbnails are decoded on `workers` processes. An optional
+    BatchControl can cancel the scan, which then finds fewer duplicates.
+    """
+    if policy not in DEDUP_POLICIES:
+        raise ValueError(f"Unknown duplicate policy: {policy}")
+    start = time.perf_counter()
+    files = list(files)
+    file_sizes = []
+    for file_path in files:
+        try:
+            file_sizes.append(os.path.getsize(file_path))
+        except OSError:
+            file_sizes.append(None)
+    pairs = _content_duplicates(files, file_sizes)
+    copies = {j for _, j in pairs}
+
+    image_sizes = [None] * len(files)
+    if max_distance >= 0 and not NUMPY_AVAILABLE:
+        logging.warning("NumPy is not installed; only exact duplicates are detected")
+    elif max_distance >= 0:
+        # One thumbnail per distinct content
+        hashed = [i for i in range(len(files)) if i not in copies and file_sizes[i] is not None]
+        thumbnails = _map_thumbnails([files[i] for i in hashed], max_pixels, workers, control)
+        readable = []
+        for i, (pixels, size, colour) in zip(hashed, thumbnails):
+            image_sizes[i] = size
+            if pixels is not None:
+                readable.append((i, pixels, colour))
+        if readable:
+            hashes = dhashes([pixels for _, pixels, _ in readable])
+            for a, b in sorted(near_pairs(hashes, max_distance)):
+                (i, _, colour_i), (j, _, colour_j) = readable[a], readable[b]
+                if _alike(colour_i, colour_j, image_sizes[i], image_sizes[j]):
+                    pairs.append((i, j))
+    for first, copy in pairs:
+        if image_sizes[copy] is None:
+            image_sizes[copy] = image_sizes[first]
+
+    plan = DuplicatePlan(files, policy, _clusters(pairs, len(files)), image_sizes, file_sizes)
+    logging.info(f"Duplicate scan of {len(files)} files: {len(plan.clusters)} groups, "
+                 f"{len(plan)} redundant files ({len(copies)} exact copies) "
+                 f"in {time.perf_counter() - start:.1f}s")
+    return plan
@@ -0,0 +1,185 @@
+"""
+Virtualized file list for the desktop app.
+
+A ttk.Treeview that only ever holds the rows currently on screen. The
+scrollbar and keyboard navigation move a window over the FileQueue view,
+so adding, filtering or selecting stays instant with 100k+ queued files.
+"""
+
+from tkinter import ttk
+
+import file_queue
+
+_STATUS_LABELS = {
+    file_queue.QUEUED: "Queued",
+    file_queue.RUNNING: "Running",
+    file_queue.DONE: "Done",
+    file_queue.FAILED: "Failed",
+    file_queue.SKIPPED: "Unchanged",
+}
+
+
+class VirtualFileList(ttk.Frame):
+    """Scrollable window of rows over a FileQueue.
+
+    `on_select(path)` is called when the focused row changes.
+    """
+
+    def __init__(self, parent, queue, rows=8, on_select=None, **kwargs):
+        ttk.Frame.__init__(self, parent, **kwargs)
+        self.queue = queue
+        self.rows = rows
+        self.on_select = on_select
+        self.offset = 0
+        self.selected = []
+        self.focus_path = None
+        self._rendering = False
+
+        self.tree = ttk.Treeview(
+            self, columns=("name", "status", "saved"), show="headings",
+            height=rows, selectmode="extended")
+        self.tree.heading("name", text="File")
+        self.tree.heading("status", text="Status")
+        self.tree.heading("saved", text="Saved")
+        self.tree.column("name", width=260, stretch=True)
+        self.tree.column("status", width=80, stretch=False)
+        self.tree.column("saved", width=80, stretch=False, anchor="e")
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<Up>", lambda e: self.move_focus(-1))
+        self.tree.bind("<Down>", lambda e: self.move_focus(1))
+        self.tree.bind("<Prior>", lambda e: self.move_focus(-self.rows))
+        self.tree.bind("<Next>", lambda e: self.move_focus(self.rows))
+        self.tree.bind("<Home>", lambda e: self.move_focus(-len(self.queue)))
+        self.tree.bind("<End>", lambda e: self.move_focus(len(self.queue)))
+
+    def refresh(self):
+        """Re-render the visible window after the queue changed"""
+        view = self.queue.view()
+        max_offset = max(0, len(view) - self.rows)
+        self.offset = min(self.offset, max_offset)
+
+        self._rendering = True
+        try:
+            self.tree.delete(*self.tree.get_children())
+            visible = view[self.offset:self.offset + self.rows]
+            selected = set(self.selected)
+            for item in visible:
+                self.tree.insert("", "end", iid=item.path, values=self._row_values(item))
+            self.tree.selection_set([item.path for item in visible if item.path in selected])
+            if self.focus_path and self.tree.exists(self.focus_path):
+                self.tree.focus(self.focus_path)
+        finally:
+            self._rendering = False
+
+        if view:
+            self.scrollbar.set(self.offset / len(view),
+                               min(1.0, (self.offset + self.rows) / len(view)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def update_rows(self, paths):
+        """Refresh the values of rows that are currently on screen"""
+        for file_path in paths:
+            if self.tree.exists(file_path):
+                item = self.queue.get(file_path)
+                if item is not None:
+                    self.tree.item(file_path, values=self._row_values(item))
+
+    def _row_values(self, item):
+        # Imported on first use to keep it out of application start-up
+        import humanize
+        saved = humanize.naturalsize(item.bytes_saved) if item.status == file_queue.DONE else ""
+        return (item.name, _STATUS_LABELS.get(item.status, item.status), saved)
+
+    def scroll(self, delta):
+        self.offset = max(0, self.offset + delta)
+        self.refresh()
+        return "break"
+
+    def _on_scrollbar(self, *args):
+        view_length = len(self.queue.view())
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * view_length)
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            self.offset += amount * (self.rows if args[2] == "pages" else 1)
+        self.offset = max(0, self.offset)
+        self.refresh()
+
+    def _on_mousewheel(self, event):
+        return self.scroll(-1 * int(event.delta / 120) * 3)
+
+    def _on_tree_select(self, event):
+        if self._rendering:
+            return
+        self.selected = list(self.tree.selection())
+        focus = self.tree.focus() or (self.selected[0] if self.selected else None)
+        if focus and focus != self.focus_path:
+            self.focus_path = focus
+            if self.on_select:
+                self.on_select(focus)
+
+    def move_focus(self, delta):
+        """Move the selection by `delta` rows, scrolling the window as needed"""
+        view = self.queue.view()
+        if not view:
+            return "break"
+        index = self.index_of(self.focus_path)
+        index = 0 if index is None else min(max(index + delta, 0), len(view) - 1)
+        self.select_index(index)
+        return "break"
+
+    def select_index(self, index):
+        view = self.queue.view()
+        file_path = view[index].path
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.rows:
+            self.offset = index - self.rows + 1
+        self.selected = [file_path]
+        self.focus_path = file_path
+        self.refresh()
+        if self.on_select:
+            self.on_select(file_path)
+
+    def index_of(self, file_path):
+        """Position of `file_path` in the current view, or None"""
+        if file_path is None:
+            return None
+        # Check the visible window first; fall back to a scan of the view
+        view = self.queue.view()
+        for index in range(self.offset, min(self.offset + self.rows, len(view))):
+            if view[index].path == file_path:
+                return index
+        for index, item in enumerate(view):
+            if item.path == file_path:
+                return index
+        return None
+
+    def neighbors(self, file_path, count=3):
+        """Paths of up to `count` rows on either side of `file_path`, nearest first"""
+        view = self.queue.view()
+        index = self.index_of(file_path)
+        if index is None:
+            return []
+        paths = []
+        for offset in range(1, count + 1):
+            for i in (index + offset, index - offset):
+                if 0 <= i < len(view):
+                    paths.append(view[i].path)
+        return paths
+
+    def selection(self):
+        return [file_path for file_path in self.selected if file_path in self.queue]
+
+    def clear_selection(self):
+        self.selected = []
+        self.focus_path = None
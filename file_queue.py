@@ -0,0 +1,152 @@
+"""
+File queue model for the desktop app.
+
+Keeps the ordered list of queued images with a per-file status, supports
+append and remove without rebuilding anything, O(1) duplicate checks and
+a cached, optionally filtered view that the virtualized list renders a
+window of. Filters match on file names and statuses and, optionally, on a
+set of paths selected from the metadata index. Contains no Tk code.
+"""
+
+import os
+from dataclasses import dataclass
+
+from file_scanner import path_key
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+STATUSES = (QUEUED, RUNNING, DONE, FAILED, SKIPPED)
+
+# Statuses a new batch picks up
+PENDING_STATUSES = (QUEUED, FAILED)
+
+
+@dataclass
+class QueueItem:
+    path: str
+    name: str
+    status: str = QUEUED
+    bytes_saved: int = 0
+    error: str = ""
+
+
+class FileQueue:
+    """Ordered, de-duplicated set of queued image paths"""
+
+    def __init__(self):
+        # Dicts keep insertion order, so this is both the index and the order
+        self._items = {}
+        self._filter = ""
+        self._matching_keys = None
+        self._view = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, file_path):
+        return path_key(file_path) in self._items
+
+    def add(self, paths):
+        """Append new paths; returns the number actually added"""
+        added = 0
+        for file_path in paths:
+            key = path_key(file_path)
+            if key in self._items:
+                continue
+            item = QueueItem(path=file_path, name=os.path.basename(file_path))
+            self._items[key] = item
+            # Extend the cached view instead of rebuilding it
+            if self._view is not None and self._matches(key, item):
+                self._view.append(item)
+            added += 1
+        return added
+
+    def remove(self, paths):
+        """Remove paths; returns the number actually removed"""
+        removed = 0
+        for file_path in paths:
+            if self._items.pop(path_key(file_path), None) is not None:
+                removed += 1
+        if removed:
+            self._view = None
+        return removed
+
+    def clear(self):
+        self._items.clear()
+        self._view = None
+
+    def keys(self):
+        return self._items.keys()
+
+    def paths(self, statuses=None):
+        """Queued paths in order, optionally only those with one of `statuses`"""
+        return [item.path for item in self._items.values()
+                if statuses is None or item.status in statuses]
+
+    def get(self, file_path):
+        return self._items.get(path_key(file_path))
+
+    def set_status(self, file_path, status, bytes_saved=0, error=""):
+        item = self._items.get(path_key(file_path))
+        if item is None:
+            return None
+        item.status = status
+        item.bytes_saved = bytes_saved
+        item.error = error
+        if self._filter:
+            # Filters can match on status
+            self._view = None
+        return item
+
+    def requeue(self):
+        """Put every finished or failed file back to queued; returns how many changed"""
+        changed = 0
+        for item in self._items.values():
+            if item.status in (QUEUED, RUNNING):
+                continue
+            item.status = QUEUED
+            item.bytes_saved = 0
+            item.error = ""
+            changed += 1
+        if changed and self._filter:
+            self._view = None
+        return changed
+
+    def status_counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        for item in self._items.values():
+            counts[item.status] += 1
+        return counts
+
+    @property
+    def filter_text(self):
+        return self._filter
+
+    def set_filter(self, text, matching_keys=None):
+        """Show items whose name contains `text` (or whose status is `text`).
+
+        `matching_keys`, when given, is a set of path keys (for example from
+        a metadata query) that visible items must also be in.
+        """
+        text = text.strip().lower()
+        if text != self._filter or matching_keys is not None or self._matching_keys is not None:
+            self._filter = text
+            self._matching_keys = matching_keys
+            self._view = None
+
+    def view(self):
+        """Items visible under the current filter, in queue order (cached)"""
+        if self._view is None:
+            self._view = [item for key, item in self._items.items() if self._matches(key, item)]
+        return self._view
+
+    def _matches(self, key, item):
+        if self._matching_keys is not None and key not in self._matching_keys:
+            return False
+        if not self._filter:
+            return True
+        return self._filter in item.name.lower() or self._filter == item.status
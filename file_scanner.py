@@ -0,0 +1,155 @@
+"""
+Streaming discovery of input images.
+
+Walks dropped or chosen folders with an os.scandir generator, identifies
+images by their magic bytes rather than their extension, and drops
+duplicates. FolderScanner runs the walk on a background thread and hands
+results over in batches so the file list can fill in while the scan is
+still going.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+# Leading bytes of each supported input format
+_MAGIC = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\x00\x00\x01\x00", "ico"),
+)
+
+SNIFF_BYTES = 12
+
+SCAN_BATCH_SIZE = 500
+SCAN_BATCH_SECONDS = 0.25
+
+
+def sniff_image_format(file_path):
+    """Return 'jpeg', 'png', 'webp' or 'ico' from the file's header, else None"""
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(SNIFF_BYTES)
+    except OSError:
+        return None
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    for magic, image_format in _MAGIC:
+        if header.startswith(magic):
+            return image_format
+    return None
+
+
+def iter_files(root):
+    """Yield every regular file below `root`, one directory listing at a time.
+
+    Files come in name order within each directory, so the order does not
+    depend on the file system.
+
+    Directory symlinks are not followed, so link loops cannot trap the walk.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                files = []
+                subdirectories = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.warning(f"Cannot scan {directory}: {str(e)}")
+            continue
+        # Files, then subdirectories, in name order: scandir order depends on
+        # the file system and can change when a file is added, and the queue
+        # position decides {number} renames and manifest and journal indexes
+        yield from sorted(files)
+        stack.extend(sorted(subdirectories, reverse=True))
+
+
+def path_key(file_path):
+    """Identity used for de-duplication"""
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+def iter_image_files(paths, seen=None):
+    """Yield image files from `paths` (files or directories), once each.
+
+    `seen` is a set of path_key values to skip and is updated in place, so
+    callers can pass the keys of files already queued.
+    """
+    if seen is None:
+        seen = set()
+    for path in paths:
+        candidates = iter_files(path) if os.path.isdir(path) else [path]
+        for candidate in candidates:
+            key = path_key(candidate)
+            if key in seen:
+                continue
+            if sniff_image_format(candidate) is None:
+                continue
+            seen.add(key)
+            yield candidate
+
+
+class FolderScanner(threading.Thread):
+    """Scan files and folders in the background, reporting batches on a queue.
+
+    Messages on `self.messages` are dicts with a "type" key:
+      - "batch": files (a list of new image paths)
+      - "finished": count, cancelled
+    """
+
+    def __init__(self, paths, seen=None, batch_size=SCAN_BATCH_SIZE):
+        super().__init__(daemon=True)
+        self.paths = list(paths)
+        self.seen = set(seen or ())
+        self.batch_size = batch_size
+        self.messages = queue.Queue()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        count = 0
+        batch = []
+        last_flush = time.monotonic()
+        try:
+            for file_path in iter_image_files(self.paths, self.seen):
+                if self._cancelled.is_set():
+                    break
+                batch.append(file_path)
+                count += 1
+                now = time.monotonic()
+                if len(batch) >= self.batch_size or now - last_flush >= SCAN_BATCH_SECONDS:
+                    self.messages.put({"type": "batch", "files": batch})
+                    batch = []
+                    last_flush = now
+        except Exception as e:
+            logging.error(f"Folder scan failed: {str(e)}")
+        if batch:
+            self.messages.put({"type": "batch", "files": batch})
+        logging.info(f"Folder scan found {count} images")
+        self.messages.put({
+            "type": "finished",
+            "count": count,
+            "cancelled": self._cancelled.is_set()
+        })
+
+    def drain(self):
+        """Return all queued messages without blocking"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
@@ -0,0 +1,320 @@
+"""
+Watch input folders for new or changed images.
+
+FolderWatcher follows one or more directory trees on a background thread
+and reports files once they have stopped growing, in batches. On Linux it
+uses inotify (through ctypes, no extra dependency), so only the changed
+paths are ever looked at; elsewhere, or when inotify is unavailable, it
+polls directory modification times and lists only the directories that
+changed. Directories created later are picked up automatically.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+from file_scanner import iter_files, path_key, sniff_image_format
+
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_BATCH_SECONDS = 2.0
+DEFAULT_POLL_SECONDS = 1.0
+MAX_BATCH_SIZE = 500
+
+# inotify(7) constants
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_excluded(path, excluded):
+    key = path_key(path)
+    return any(key == prefix or key.startswith(prefix + os.sep) for prefix in excluded)
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+class InotifyBackend:
+    """Changed paths from the kernel; one watch per directory"""
+
+    def __init__(self, roots, excluded=()):
+        self.libc = _load_libc()
+        if self.libc is None:
+            raise OSError("inotify is not available")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.excluded = excluded
+        self.roots = list(roots)
+        self.directories = {}
+        for root in self.roots:
+            self._watch_tree(root)
+
+    def _add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), _IN_WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                logging.warning("inotify watch limit reached; raise "
+                                "fs.inotify.max_user_watches to watch more folders")
+            else:
+                logging.warning(f"Cannot watch {directory}: {os.strerror(error)}")
+            return False
+        self.directories[wd] = directory
+        return True
+
+    def _watch_tree(self, root):
+        """Watch `root` and every directory below it"""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            if _is_excluded(directory, self.excluded) or not self._add_watch(directory):
+                continue
+            try:
+                with os.scandir(directory) as entries:
+                    stack.extend(entry.path for entry in entries
+                                 if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def poll(self, timeout):
+        """Wait up to `timeout` seconds; return the file paths that changed"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b"\0"))
+            offset += name_length
+
+            if mask & _IN_Q_OVERFLOW:
+                # Events were dropped; fall back to one full listing
+                logging.warning("inotify queue overflowed, rescanning watched folders")
+                for root in self.roots:
+                    changed.extend(iter_files(root))
+                continue
+            directory = self.directories.get(wd)
+            if mask & _IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO) and not _is_excluded(path, self.excluded):
+                    # Files may have landed before the watch existed
+                    self._watch_tree(path)
+                    changed.extend(iter_files(path))
+                continue
+            changed.append(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingBackend:
+    """Portable fallback: re-lists only directories whose mtime changed.
+
+    Creating, renaming or deleting an entry updates its directory's mtime,
+    so an idle tree costs one stat per directory per poll.
+    """
+
+    def __init__(self, roots, excluded=()):
+        self.roots = list(roots)
+        self.excluded = excluded
+        self.directories = {}
+        self.files = {}
+        for root in self.roots:
+            self._scan_tree(root, report=False)
+
+    def _scan_directory(self, directory):
+        """Re-list `directory`; return (changed files, new subdirectories)"""
+        changed = []
+        subdirectories = []
+        try:
+            self.directories[directory] = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.path not in self.directories:
+                                subdirectories.append(entry.path)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            signature = (stat.st_size, stat.st_mtime_ns)
+                            if self.files.get(entry.path) != signature:
+                                self.files[entry.path] = signature
+                                changed.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            self.directories.pop(directory, None)
+        return changed, subdirectories
+
+    def _scan_tree(self, root, report=True):
+        changed = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            if _is_excluded(directory, self.excluded):
+                continue
+            files, subdirectories = self._scan_directory(directory)
+            if report:
+                changed.extend(files)
+            stack.extend(subdirectories)
+        return changed
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+        changed = []
+        for directory, mtime_ns in list(self.directories.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                self.directories.pop(directory, None)
+                continue
+            if current != mtime_ns:
+                files, subdirectories = self._scan_directory(directory)
+                changed.extend(files)
+                for subdirectory in subdirectories:
+                    changed.extend(self._scan_tree(subdirectory))
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_backend(roots, excluded=(), polling=False):
+    """InotifyBackend where available (unless `polling`), else PollingBackend"""
+    if not polling:
+        try:
+            return InotifyBackend(roots, excluded)
+        except OSError as e:
+            logging.info(f"Using polling folder watcher: {str(e)}")
+    return PollingBackend(roots, excluded)
+
+
+class FolderWatcher(threading.Thread):
+    """Report new or changed images below `paths` once they are complete.
+
+    A file is ready when its size and mtime have not changed for
+    `settle_seconds`. Ready files are collected for `batch_seconds` after
+    the first one (or until MAX_BATCH_SIZE) and put on `self.messages` as
+    {"type": "batch", "files": [...]}. Paths under `exclude` (for example
+    the output directory) are ignored.
+    """
+
+    def __init__(self, paths, exclude=(), settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 batch_seconds=DEFAULT_BATCH_SECONDS, poll_seconds=DEFAULT_POLL_SECONDS,
+                 polling=False):
+        super().__init__(daemon=True)
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.excluded = [path_key(path) for path in exclude]
+        self.settle_seconds = settle_seconds
+        self.batch_seconds = batch_seconds
+        self.poll_seconds = poll_seconds
+        self.backend = create_backend(self.paths, self.excluded, polling)
+        self.messages = queue.Queue()
+        self._stopped = threading.Event()
+        # path -> (size, mtime_ns, monotonic time of the last change)
+        self._pending = {}
+        # Ordered set of ready paths; a file rewritten within one batch window is listed once
+        self._batch = {}
+        self._batch_started = None
+
+    @property
+    def backend_name(self):
+        return "inotify" if isinstance(self.backend, InotifyBackend) else "polling"
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        try:
+            while not self._stopped.is_set():
+                for path in self.backend.poll(self.poll_seconds):
+                    if not _is_excluded(path, self.excluded):
+                        self._touch(path)
+                self._settle()
+                self._flush()
+        except Exception as e:
+            logging.error(f"Folder watcher stopped: {str(e)}")
+        finally:
+            self.backend.close()
+            self._flush(force=True)
+            self.messages.put({"type": "finished"})
+
+    def _touch(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._pending.pop(path, None)
+            return
+        entry = self._pending.get(path)
+        if entry is None or entry[:2] != (stat.st_size, stat.st_mtime_ns):
+            self._pending[path] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+
+    def _settle(self):
+        now = time.monotonic()
+        for path, (size, mtime_ns, changed_at) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                # Still being written
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - changed_at >= self.settle_seconds:
+                del self._pending[path]
+                if sniff_image_format(path) is not None:
+                    if not self._batch:
+                        self._batch_started = now
+                    self._batch[path] = None
+
+    def _flush(self, force=False):
+        if not self._batch:
+            return
+        if (force or len(self._batch) >= MAX_BATCH_SIZE
+                or time.monotonic() - self._batch_started >= self.batch_seconds):
+            self.messages.put({"type": "batch", "files": list(self._batch)})
+            self._batch = {}
+
+    def get_batch(self, timeout=None):
+        """Block for the next message; returns None on timeout"""
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
@@ -1,38 +1,41 @@
+import time
+# Start of application start-up, for the start-up timing log
+STARTUP_STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-from PIL import Image, ImageTk
 import os
 from pathlib import Path
-import humanize
 import json
-from PIL.ExifTags import TAGS
-import piexif
-import re
-from splash_screen import SplashScreen
-from datetime import datetime
+from splash_screen import StartupProgress
+import compression_engine
+from compression_engine import CompressionSettings, split_list
+import image_preview
+import file_scanner
+import perceptual_quality
+import large_image
+import pipelined_io
+import duplicate_finder
+from image_probe import ProbeCache
+import file_queue
+from file_queue import FileQueue
+from file_list_view import VirtualFileList
+from stage_timing import StageTimer, TimingReport
 import logging
 import traceback
 import sys
-import time
+import multiprocessing
+from lazy_imports import lazy_module
+
+# Imported on first use: only needed once a batch runs or the queue is filtered
+batch_worker = lazy_module("batch_worker")
+metadata_index = lazy_module("metadata_index")
+job_journal = lazy_module("job_journal")
 
-# Try to import tkinterdnd2 with fallback
+# Set in main() once tkinterdnd2 has been tried
 DRAG_DROP_AVAILABLE = False
-try:
-    from tkinterdnd2 import DND_FILES, TkinterDnD
-    DRAG_DROP_AVAILABLE = True
-    print("Drag and drop functionality available")
-except ImportError as e:
-    print(f"Drag and drop not available: {e}")
-    # Fallback to regular tkinter
-    class TkinterDnD:
-        @staticmethod
-        def Tk():
-            return tk.Tk()
-    DND_FILES = None
 
 # Set up logging
-import tempfile
-from pathlib import Path
 
 # Create log file in user's home directory for packaged app
 if hasattr(sys, '_MEIPASS'):
@@ -44,6 +47,13 @@ else:
     # Running in development - use current directory
     log_file = 'app.log'
 
+# Stage timings of the most recent batch
+TIMING_REPORT_FILE = Path(log_file).parent / 'last_batch_timings.json'
+# Header and EXIF records of queued images, for metadata filters
+METADATA_INDEX_FILE = Path(log_file).parent / 'metadata_index.sqlite'
+# Progress of the running batch, for resuming after a crash
+JOB_JOURNAL_FILE = Path(log_file).parent / 'job_journal.jsonl'
+
 logging.basicConfig(
     level=logging.DEBUG,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -53,6 +63,9 @@ logging.basicConfig(
     ]
 )
 
+# End of module imports, for the start-up timing log
+IMPORTS_FINISHED = time.perf_counter()
+
 class CollapsibleFrame(ttk.Frame):
     """A frame that can be collapsed and expanded"""
     def __init__(self, parent, text="", *args, **kwargs):
@@ -82,8 +95,10 @@ class CollapsibleFrame(ttk.Frame):
             self.sub_frame.grid_remove()
 
 class ImageCompressorApp:
-    def __init__(self, root):
+    def __init__(self, root, progress=None):
         logging.info("Initializing ImageCompressorApp")
+        # progress(fraction, message) is told about each start-up step
+        self.report_progress = progress or (lambda fraction, message: None)
         self.root = root
         self.root.title("Image Compressor")
         self.root.geometry("1200x800")
@@ -91,8 +106,15 @@ class ImageCompressorApp:
         # Initialize variables
         self.output_format = tk.StringVar(value="webp")
         self.quality = tk.IntVar(value=85)
+        self.target_size_kb = tk.StringVar(value="")
+        self.auto_quality = tk.BooleanVar(value=False)
+        self.rendition_widths = tk.StringVar(value="")
+        self.rendition_formats = tk.StringVar(value="")
+        self.rendition_pattern = tk.StringVar(value=compression_engine.DEFAULT_RENDITION_PATTERN)
+        self.ssim_threshold = tk.StringVar(value=str(perceptual_quality.DEFAULT_SSIM_THRESHOLD))
         self.resize_enabled = tk.BooleanVar(value=False)
         self.maintain_aspect = tk.BooleanVar(value=True)
+        self.exact_resize = tk.BooleanVar(value=False)
         self.width = tk.StringVar(value="")
         self.height = tk.StringVar(value="")
         self.selected_preset = tk.StringVar(value="custom")
@@ -101,6 +123,15 @@ class ImageCompressorApp:
         self.rename_enabled = tk.BooleanVar(value=False)
         self.rename_pattern = tk.StringVar(value="{original_name}")
         self.start_number = tk.IntVar(value=1)
+        self.workers = tk.IntVar(value=compression_engine.default_workers())
+        self.incremental = tk.BooleanVar(value=False)
+        self.memory_limit_mb = tk.StringVar(value="")
+        self.effort = tk.StringVar(value="max")
+        self.lossless_png = tk.BooleanVar(value=False)
+        self.deadline_minutes = tk.StringVar(value="")
+        self.pipelined_io = tk.BooleanVar(value=False)
+        self.dedup_policy = tk.StringVar(value="off")
+        self.max_megapixels = tk.StringVar(value=str(large_image.DEFAULT_MAX_PIXELS // 1_000_000))
         self.supported_formats = {
             "JPEG": ".jpg",
             "PNG": ".png",
@@ -109,45 +140,24 @@ class ImageCompressorApp:
         }
         
         # Initialize compression profiles
-        self.profiles = {
-            "Web Optimized": {
-                "format": "webp",
-                "quality": 75,
-                "resize": True,
-                "width": 1920,
-                "height": 1080
-            },
-            "Social Media": {
-                "format": "jpeg",
-                "quality": 85,
-                "resize": True,
-                "width": 1200,
-                "height": 1200
-            },
-            "High Quality": {
-                "format": "png",
-                "quality": 95,
-                "resize": False,
-                "width": 0,
-                "height": 0
-            }
-        }
+        self.report_progress(0.05, "Loading profiles")
+        self.profiles = compression_engine.load_profiles()
         
         # Initialize image references
         self.preview_photo = None
         self._photo_references = set()
         self._is_closing = False
-        self.files_to_compress = []
-        
-        # Try to load saved profiles
-        try:
-            if os.path.exists("compression_profiles.json"):
-                with open("compression_profiles.json", "r") as f:
-                    saved_profiles = json.load(f)
-                    self.profiles.update(saved_profiles)
-                logging.debug("Loaded saved compression profiles")
-        except Exception as e:
-            logging.error(f"Error loading saved profiles: {str(e)}")
+        self.file_queue = FileQueue()
+        self.file_filter = tk.StringVar(value="")
+        self.batch_worker = None
+        # cache_key of the settings the queue's finished files were compressed with
+        self._queue_settings_key = None
+        self.folder_scanners = []
+        self.metadata_indexers = []
+        self._metadata_index = None
+        self.preview_cache = image_preview.PreviewCache()
+        self.probe_cache = ProbeCache()
+        self.preview_timings = TimingReport()
         
         # Ensure root is ready
         self.root.update_idletasks()
@@ -157,8 +167,11 @@ class ImageCompressorApp:
         
         try:
             self.setup_ui()
+            self.report_progress(0.95, "Enabling drag and drop")
             self.setup_drag_drop()
             logging.info("Application initialized successfully")
+            # Once the main window is up
+            self.root.after(500, self.offer_resume)
         except Exception as e:
             logging.error(f"Error during initialization: {str(e)}")
             logging.error(traceback.format_exc())
@@ -201,6 +214,7 @@ class ImageCompressorApp:
         style.configure('Horizontal.TScale', 
                        sliderlength=15)
         
+        self.report_progress(0.1, "Building main window")
         # Main container with padding
         main_frame = ttk.Frame(self.root, padding=10)
         main_frame.pack(fill="both", expand=True)
@@ -215,7 +229,7 @@ class ImageCompressorApp:
         
         self.drop_label = ttk.Label(
             self.drop_frame, 
-            text="Drop images here or click to browse",
+            text="Drop images or folders here or click to browse",
             font=('Helvetica', 10))
         self.drop_label.pack(pady=20)
         
@@ -235,33 +249,48 @@ class ImageCompressorApp:
         list_frame = ttk.LabelFrame(left_panel, text="Selected Files", padding=5)
         list_frame.pack(padx=5, pady=5, fill="both")  # Reduced size
         
-        # Modern scrollbar
-        scrollbar = ttk.Scrollbar(list_frame)
-        scrollbar.pack(side="right", fill="y")
-        
-        # Modern listbox with selection binding
-        self.file_listbox = tk.Listbox(
-            list_frame, 
-            yscrollcommand=scrollbar.set,
-            font=('Helvetica', 9),
-            selectmode='extended',
-            activestyle='none',
-            borderwidth=0,
-            height=6,  # Reduced height
-            highlightthickness=0)
-        self.file_listbox.pack(fill="both", expand=True)
-        scrollbar.config(command=self.file_listbox.yview)
-        
-        # Bind selection event
-        self.file_listbox.bind('<<ListboxSelect>>', self.on_select_file)
+        # Filter box: matches file names, a status such as "failed" and
+        # metadata terms such as "width>4000 model:x100 year=2026"
+        filter_row = ttk.Frame(list_frame)
+        filter_row.pack(fill="x", pady=(0, 5))
+        ttk.Label(filter_row, text="Filter:").pack(side="left")
+        filter_entry = ttk.Entry(filter_row, textvariable=self.file_filter)
+        filter_entry.pack(side="left", fill="x", expand=True, padx=5)
+        self.file_filter.trace_add("write", self.on_filter_changed)
+        
+        # Virtualized list: only the visible rows exist as widgets
+        self.file_list = VirtualFileList(
+            list_frame,
+            self.file_queue,
+            rows=8,
+            on_select=self.on_select_file)
+        self.file_list.pack(fill="both", expand=True)
+        self.file_list.tree.bind('<Delete>', self.remove_selected_files)
         
         # Clear button with modern look
+        button_row = ttk.Frame(left_panel)
+        button_row.pack(pady=5)
+        
+        self.add_folder_btn = ttk.Button(
+            button_row,
+            text="Add Folder",
+            command=self.browse_folder,
+            style='TButton')
+        self.add_folder_btn.pack(side="left", padx=2)
+        
+        self.remove_btn = ttk.Button(
+            button_row,
+            text="Remove Selected",
+            command=self.remove_selected_files,
+            style='TButton')
+        self.remove_btn.pack(side="left", padx=2)
+        
         self.clear_btn = ttk.Button(
-            left_panel, 
+            button_row, 
             text="Clear All Files",
             command=self.clear_files,  # Added command
             style='TButton')
-        self.clear_btn.pack(pady=5)
+        self.clear_btn.pack(side="left", padx=2)
         
         # Right scrollable panel
         right_panel = ttk.Frame(main_frame)
@@ -296,10 +325,13 @@ class ImageCompressorApp:
             ("Compression Profiles", self.setup_profile_section),
             ("Metadata Options", self.setup_metadata_section),
             ("Batch Rename", self.setup_rename_section),
+            ("Responsive Renditions", self.setup_rendition_section),
+            ("Performance", self.setup_performance_section),
             ("Progress", self.setup_progress_section)
         ]
         
-        for title, setup_func in sections:
+        for i, (title, setup_func) in enumerate(sections):
+            self.report_progress(0.2 + 0.7 * i / len(sections), f"Building {title}")
             frame = CollapsibleFrame(scrollable_frame, text=title)
             frame.pack(fill="x", pady=2)
             setup_func(frame.sub_frame)
@@ -312,14 +344,60 @@ class ImageCompressorApp:
             command=self.compress_images)
         self.compress_btn.pack(pady=10)
 
-    def on_select_file(self, event):
+    def on_select_file(self, file_path):
         """Handle file selection and update preview"""
-        selection = self.file_listbox.curselection()
-        if selection:
-            index = selection[0]
-            file_path = self.files_to_compress[index]
-            self.show_preview(file_path)
-            self.update_file_info(file_path)
+        self.show_preview(file_path)
+        self.update_file_info(file_path)
+        self.prefetch_neighbors(file_path)
+    
+    def prefetch_neighbors(self, file_path, count=3):
+        """Warm the preview cache for the files around `file_path`"""
+        self.preview_cache.prefetch(self.file_list.neighbors(file_path, count))
+        self.preview_cache.log_stats()
+    
+    def on_filter_changed(self, *args):
+        """Apply the filter box; metadata terms are answered by the index"""
+        text = self.file_filter.get()
+        matching_keys = None
+        try:
+            condition, params, text = metadata_index.parse_query(text)
+            if condition:
+                matching_keys = self.metadata_index.select(condition, params)
+        except ValueError as e:
+            logging.debug(f"Metadata filter not applied: {str(e)}")
+            text = self.file_filter.get()
+        self.file_queue.set_filter(text, matching_keys)
+        self.file_list.refresh()
+    
+    @property
+    def metadata_index(self):
+        """The metadata index, opened on first use"""
+        if self._metadata_index is None:
+            self._metadata_index = metadata_index.MetadataIndex(METADATA_INDEX_FILE)
+        return self._metadata_index
+    
+    def index_metadata(self, files):
+        """Read headers and EXIF of newly queued files into the index in the background"""
+        indexer = metadata_index.MetadataIndexer(self.metadata_index, files)
+        self.metadata_indexers.append(indexer)
+        indexer.start()
+        if len(self.metadata_indexers) == 1:
+            self.root.after(250, self.poll_metadata_indexers)
+    
+    def poll_metadata_indexers(self):
+        """Re-run a metadata filter as more of the queue gets indexed"""
+        if self._is_closing:
+            return
+        indexed = False
+        for indexer in list(self.metadata_indexers):
+            for message in indexer.drain():
+                indexed = indexed or message["indexed"] > 0
+                if message["type"] == "finished":
+                    self.metadata_indexers.remove(indexer)
+        if indexed and self.file_filter.get():
+            self.on_filter_changed()
+        if self.metadata_indexers:
+            self.root.after(250, self.poll_metadata_indexers)
     
     def show_preview(self, file_path):
         """Show image preview and update info"""
@@ -328,23 +406,23 @@ class ImageCompressorApp:
             self.clear_preview()
             
             if not self._is_closing:
-                with Image.open(file_path) as img:
-                    logging.debug(f"Image opened: {img.size}, {img.mode}")
-                    aspect_ratio = img.width / img.height
-                    preview_height = 300
-                    preview_width = int(preview_height * aspect_ratio)
-                    
-                    img_resized = img.resize((preview_width, preview_height), Image.Resampling.LANCZOS)
-                    logging.debug("Image resized successfully")
-                    
+                timer = StageTimer()
+                with timer.measure("preview"):
+                    probe = self.probe_cache.get(file_path)
+                    preview = self.preview_cache.get(file_path, probe)
+                logging.debug(f"Preview generated: {preview.size}, {preview.mode}")
+                
+                with timer.measure("display"):
+                    from PIL import ImageTk
                     # Create new PhotoImage and add to references
-                    self.preview_photo = ImageTk.PhotoImage(img_resized)
+                    self.preview_photo = ImageTk.PhotoImage(preview)
                     self._photo_references.add(self.preview_photo)
                     logging.debug("PhotoImage created and added to references")
                     
                     # Update label
                     self.preview_label.config(image=self.preview_photo)
                     logging.debug("Preview label updated")
+                self.preview_timings.add(timer.samples)
         
         except Exception as e:
             logging.error(f"Error showing preview: {str(e)}")
@@ -368,107 +446,263 @@ class ImageCompressorApp:
     
     def update_file_info(self, file_path):
         """Update file information display"""
+        import humanize
         try:
-            file_size = os.path.getsize(file_path)
-            with Image.open(file_path) as img:
-                info_text = (
-                    f"Filename: {os.path.basename(file_path)}\n"
-                    f"Size: {humanize.naturalsize(file_size)}\n"
-                    f"Dimensions: {img.width}x{img.height}\n"
-                    f"Format: {img.format}"
-                )
-                self.file_info_label.config(text=info_text)
+            probe = self.probe_cache.get(file_path)
+            info_text = (
+                f"Filename: {os.path.basename(file_path)}\n"
+                f"Size: {humanize.naturalsize(probe.file_size)}\n"
+                f"Dimensions: {probe.width}x{probe.height}\n"
+                f"Format: {probe.format}"
+            )
+            self.file_info_label.config(text=info_text)
         except Exception as e:
             self.file_info_label.config(text=f"Error reading file info: {str(e)}")
 
+    def get_compression_settings(self):
+        """Snapshot the current UI state into a CompressionSettings"""
+        settings = CompressionSettings(
+            output_format=self.output_format.get(),
+            quality=self.quality.get(),
+            resize_enabled=self.resize_enabled.get(),
+            width=int(self.width.get()) if self.width.get() else 0,
+            height=int(self.height.get()) if self.height.get() else 0,
+            maintain_aspect=self.maintain_aspect.get(),
+            resize_quality="exact" if self.exact_resize.get() else "fast",
+            effort=self.effort.get(),
+            lossless_png=self.lossless_png.get(),
+            preserve_metadata=self.preserve_metadata.get(),
+            rename_enabled=self.rename_enabled.get(),
+            rename_pattern=self.rename_pattern.get(),
+            start_number=self.start_number.get(),
+            target_size_kb=int(self.target_size_kb.get()) if self.target_size_kb.get() else 0,
+            auto_quality=self.auto_quality.get(),
+            ssim_threshold=float(self.ssim_threshold.get()),
+            rendition_widths=[int(width) for width in split_list(self.rendition_widths.get())],
+            rendition_formats=split_list(self.rendition_formats.get().lower()),
+            rendition_pattern=self.rendition_pattern.get() or compression_engine.DEFAULT_RENDITION_PATTERN,
+            max_pixels=int(float(self.max_megapixels.get() or 0) * 1_000_000)
+        )
+        settings.validate()
+        return settings
+
     def compress_images(self):
-        if not self.files_to_compress:
+        if not len(self.file_queue):
             messagebox.showwarning("Warning", "Please select images first!")
             return
         
+        try:
+            settings = self.get_compression_settings()
+        except (ValueError, tk.TclError) as e:
+            messagebox.showerror("Error", f"Invalid settings: {str(e)}")
+            return
+        
+        # Finished files only count as done for the settings they were compressed with
+        if settings.cache_key() != self._queue_settings_key and self.file_queue.requeue():
+            self.file_list.refresh()
+        # Queued files plus earlier failures; finished files are not redone
+        files = self.file_queue.paths(file_queue.PENDING_STATUSES)
+        if not files:
+            if not messagebox.askyesno(
+                    "Compress Again",
+                    "All queued images have already been compressed with these settings.\n"
+                    "Compress them again?"):
+                return
+            self.file_queue.requeue()
+            self.file_list.refresh()
+            files = self.file_queue.paths(file_queue.PENDING_STATUSES)
+        
         output_dir = filedialog.askdirectory(title="Select Output Directory")
         if not output_dir:
             return
         
-        total_files = len(self.files_to_compress)
-        self.progress_bar['maximum'] = total_files
+        try:
+            workers = self.workers.get()
+        except tk.TclError:
+            workers = 0
+        try:
+            memory_limit = int(self.memory_limit_mb.get() or 0) * 1024 * 1024 or None
+        except ValueError:
+            messagebox.showerror("Error", "Memory budget must be a whole number of MB")
+            return
+        try:
+            deadline = float(self.deadline_minutes.get() or 0) * 60 or None
+        except ValueError:
+            messagebox.showerror("Error", "Finish-within time must be a number of minutes")
+            return
         
-        for i, file_path in enumerate(self.files_to_compress):
-            try:
-                # Open image
-                img = Image.open(file_path)
-                
-                # Handle resize if enabled
-                if self.resize_enabled.get():
-                    try:
-                        new_width = int(self.width.get()) if self.width.get() else img.width
-                        new_height = int(self.height.get()) if self.height.get() else img.height
-                        
-                        if self.maintain_aspect.get():
-                            aspect_ratio = img.width / img.height
-                            if new_width and new_height:
-                                if new_width / new_height > aspect_ratio:
-                                    new_width = int(new_height * aspect_ratio)
-                                else:
-                                    new_height = int(new_width / aspect_ratio)
-                        
-                        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    except ValueError:
-                        messagebox.showerror("Error", "Invalid dimensions provided")
-                        return
-                
-                # Convert RGBA to RGB if necessary for JPEG
-                if img.mode == 'RGBA' and self.output_format.get() == 'jpeg':
-                    img = img.convert('RGB')
-                
-                # Generate output filename
-                if self.rename_enabled.get():
-                    filename = self.generate_filename(file_path, i)
-                else:
-                    filename = Path(file_path).stem
-                
-                output_path = os.path.join(output_dir, 
-                    f"{filename}.{self.output_format.get()}")
-                
-                # Special handling for ICO format
-                if self.output_format.get() == 'ico':
-                    # ICO format requires specific sizes
-                    sizes = [(16,16), (32,32), (48,48), (64,64), (128,128), (256,256)]
-                    img.save(output_path, format='ICO', sizes=sizes)
-                else:
-                    # Save with format-specific options
-                    save_kwargs = {
-                        'quality': self.quality.get(),
-                        'optimize': True
-                    }
-                    
-                    if self.preserve_metadata.get():
-                        try:
-                            if img.info.get('exif'):
-                                save_kwargs['exif'] = img.info['exif']
-                            if img.info.get('icc_profile'):
-                                save_kwargs['icc_profile'] = img.info['icc_profile']
-                        except:
-                            pass
-                    
-                    # Format-specific options
-                    if self.output_format.get() == 'webp':
-                        save_kwargs['method'] = 6
-                        save_kwargs['lossless'] = False
-                    
-                    img.save(output_path, format=self.output_format.get().upper(), **save_kwargs)
-                
-                # Update progress
-                self.progress_bar['value'] = i + 1
-                self.root.update_idletasks()
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Error processing {file_path}: {str(e)}")
+        options = {
+            "workers": workers,
+            "incremental": self.incremental.get(),
+            "memory_limit": memory_limit,
+            "deadline": deadline,
+            "pipeline_depth": pipelined_io.DEFAULT_DEPTH if self.pipelined_io.get() else 0,
+            "dedup": None if self.dedup_policy.get() == "off" else self.dedup_policy.get(),
+        }
+        try:
+            journal = job_journal.JobJournal.start(JOB_JOURNAL_FILE, files, output_dir, settings, options)
+        except OSError as e:
+            logging.warning(f"Batch will not be resumable: {str(e)}")
+            journal = None
+        self.start_batch(files, output_dir, settings, options, journal)
+    
+    def start_batch(self, files, output_dir, settings, options, journal=None):
+        """Run a batch on the background worker; `options` are compress_batch arguments"""
+        self.progress_bar['maximum'] = len(files)
+        self.progress_bar['value'] = 0
+        self.progress_label.config(text="Starting...")
+        self._queue_settings_key = settings.cache_key()
+        
+        for file_path in files:
+            self.file_queue.set_status(file_path, file_queue.RUNNING)
+        self.file_list.refresh()
         
-        messagebox.showinfo("Success", "Images compressed successfully!")
+        self.batch_worker = batch_worker.BatchWorker(files, output_dir, settings, journal=journal, **options)
+        self.batch_worker.start()
+        self.set_batch_controls(running=True)
+        self.root.after(100, self.poll_batch_worker)
+    
+    def offer_resume(self):
+        """Offer to continue a batch that was interrupted by a crash or reboot"""
+        job = job_journal.load(JOB_JOURNAL_FILE)
+        if job is None or job.finished or self._is_closing or self.batch_worker:
+            return
+        if not messagebox.askyesno(
+                "Resume Batch",
+                f"A batch of {len(job.files)} images to {job.output_dir} was interrupted "
+                f"after {job.done_count} images.\n\nResume it with its original settings?"):
+            job_journal.discard(JOB_JOURNAL_FILE)
+            return
+        try:
+            settings = job.compression_settings()
+            settings.validate()
+        except (TypeError, ValueError) as e:
+            messagebox.showerror("Error", f"Cannot resume the batch: {str(e)}")
+            return
+        self.add_files(job.files)
+        self.start_batch(job.files, job.output_dir, settings, job.options,
+                         job_journal.JobJournal.resume(job))
+
+    def poll_batch_worker(self):
+        """Apply queued progress messages from the background batch"""
+        worker = self.batch_worker
+        if worker is None or self._is_closing:
+            return
+        
+        updated = []
+        for message in worker.drain():
+            if message["type"] == "progress":
+                if message["error"]:
+                    status = file_queue.FAILED
+                elif message["skipped"] and not message["resumed"]:
+                    status = file_queue.SKIPPED
+                else:
+                    status = file_queue.DONE
+                self.file_queue.set_status(
+                    message["current"], status,
+                    bytes_saved=message["bytes_saved"], error=message["error"])
+                updated.append(message["current"])
+                self.progress_bar['value'] = message["done"]
+                eta = message["eta_seconds"]
+                eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "--"
+                self.progress_label.config(text=(
+                    f"{message['done']}/{message['total']}: "
+                    f"{os.path.basename(message['current'])}\n"
+                    f"{message['images_per_sec']:.1f} img/s, "
+                    f"{message['mb_per_sec']:.1f} MB/s, ETA {eta_text}"))
+            elif message["type"] == "finished":
+                self.finish_batch(message["results"], message["cancelled"])
+                return
+            elif message["type"] == "error":
+                self.reset_running_files()
+                self.batch_worker = None
+                self.set_batch_controls(running=False)
+                self.progress_bar['value'] = 0
+                self.progress_label.config(text="")
+                messagebox.showerror("Error", f"Compression failed: {message['error']}")
+                return
+        
+        if self.file_queue.filter_text:
+            self.file_list.refresh()
+        else:
+            self.file_list.update_rows(updated)
+        self.root.after(100, self.poll_batch_worker)
+
+    def finish_batch(self, results, cancelled):
+        self.reset_running_files()
+        self.batch_worker = None
+        self.set_batch_controls(running=False)
         self.progress_bar['value'] = 0
-        self.files_to_compress = []
-        self.update_file_list()
+        self.progress_label.config(text="")
+        
+        summary = compression_engine.summarize_results(results)
+        logging.info(
+            f"Batch finished: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+            f"{summary['skipped']} skipped, {summary['resumed']} resumed, "
+            f"{summary['duplicates']} duplicates, "
+            f"{summary['encode_trials']} encode trials")
+        peak_rss = compression_engine.peak_rss_mb()
+        if peak_rss is not None:
+            logging.info(f"Peak RSS: {peak_rss:.0f} MB (largest process)")
+        self.save_timing_report(compression_engine.timing_report(results))
+        if summary["failed"]:
+            messagebox.showerror(
+                "Error",
+                f"Compressed {summary['succeeded']} of {summary['total']} images.\n"
+                f"{summary['failed']} failed:\n\n"
+                f"{compression_engine.format_failures(results)}")
+        elif cancelled:
+            messagebox.showinfo(
+                "Cancelled",
+                f"Compression cancelled after {summary['succeeded']} images.")
+        elif summary["skipped"] or summary["resumed"] or summary["duplicates"]:
+            messagebox.showinfo(
+                "Success",
+                f"Images compressed successfully!\n"
+                f"{summary['skipped']} unchanged images were skipped.\n"
+                f"{summary['resumed']} images were already done by the interrupted batch.\n"
+                f"{summary['duplicates']} duplicate images were not compressed again.")
+        else:
+            messagebox.showinfo("Success", "Images compressed successfully!")
+    
+    def save_timing_report(self, report):
+        """Log the batch's stage timings and keep the last report next to the log"""
+        report.log_summary()
+        if not report:
+            return
+        try:
+            report.save(str(TIMING_REPORT_FILE))
+            logging.info(f"Stage timings written to {TIMING_REPORT_FILE}")
+        except OSError as e:
+            logging.warning(f"Could not write timing report: {str(e)}")
+    
+    def reset_running_files(self):
+        """Put files a batch never reached (cancelled or crashed) back in the queue"""
+        for file_path in self.file_queue.paths([file_queue.RUNNING]):
+            self.file_queue.set_status(file_path, file_queue.QUEUED)
+        self.file_list.refresh()
+        self.update_drop_label()
+
+    def set_batch_controls(self, running):
+        self.compress_btn.config(state="disabled" if running else "normal")
+        self.cancel_btn.config(state="normal" if running else "disabled")
+        self.pause_btn.config(state="normal" if running else "disabled", text="Pause")
+
+    def cancel_batch(self):
+        if self.batch_worker:
+            self.progress_label.config(text="Cancelling after current files...")
+            self.batch_worker.cancel()
+
+    def toggle_pause_batch(self):
+        if not self.batch_worker:
+            return
+        if self.batch_worker.paused:
+            self.batch_worker.resume()
+            self.pause_btn.config(text="Pause")
+        else:
+            self.batch_worker.pause()
+            self.pause_btn.config(text="Resume")
+            self.progress_label.config(text="Paused")
 
     def setup_drag_drop(self):
         global DRAG_DROP_AVAILABLE
@@ -490,35 +724,91 @@ class ImageCompressorApp:
         self.drop_label.bind("<Button-1>", self.browse_files)
     
     def handle_drop(self, event):
-        files = self.drop_frame.tk.splitlist(event.data)
-        valid_files = [f for f in files if self.is_valid_image(f)]
-        self.files_to_compress.extend(valid_files)
-        self.update_file_list()
+        paths = self.drop_frame.tk.splitlist(event.data)
+        self.scan_paths(paths)
+    
+    def scan_paths(self, paths):
+        """Add files and (recursively) folders to the queue from a background scan"""
+        if not paths:
+            return
+        seen = set(self.file_queue.keys())
+        scanner = file_scanner.FolderScanner(paths, seen=seen)
+        self.folder_scanners.append(scanner)
+        scanner.start()
+        self.drop_label.config(text="Scanning for images...")
+        if len(self.folder_scanners) == 1:
+            self.root.after(100, self.poll_folder_scanners)
+    
+    def poll_folder_scanners(self):
+        """Append batches found by running folder scans"""
+        if self._is_closing:
+            return
+        for scanner in list(self.folder_scanners):
+            for message in scanner.drain():
+                if message["type"] == "batch":
+                    self.add_files(message["files"])
+                elif message["type"] == "finished":
+                    self.folder_scanners.remove(scanner)
+        if self.folder_scanners:
+            self.root.after(100, self.poll_folder_scanners)
+        else:
+            self.update_drop_label()
+    
+    def add_files(self, files):
+        """Append files to the queue; only the visible rows are redrawn"""
+        if self.file_queue.add(files):
+            self.file_list.refresh()
+            self.index_metadata(files)
+        self.update_drop_label()
+    
+    def remove_selected_files(self, event=None):
+        """Drop the selected rows from the queue"""
+        if self.batch_worker:
+            return
+        selection = self.file_list.selection()
+        if not selection:
+            return
+        self.file_queue.remove(selection)
+        self.file_list.clear_selection()
+        self.file_list.refresh()
+        self.update_drop_label()
+        self.clear_preview()
     
     def is_valid_image(self, file_path):
-        return file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.ico'))
+        return compression_engine.is_valid_image(file_path)
     
     def clear_files(self):
         """Clear all files and preview"""
-        self.files_to_compress = []
-        self.update_file_list()
-        self.clear_preview()
-    
-    def update_file_list(self):
-        self.file_listbox.delete(0, tk.END)
-        for file_path in self.files_to_compress:
-            filename = os.path.basename(file_path)
-            self.file_listbox.insert(tk.END, filename)
+        for scanner in self.folder_scanners:
+            scanner.cancel()
+        self.folder_scanners = []
+        for indexer in self.metadata_indexers:
+            indexer.cancel()
+        self.metadata_indexers = []
+        self.file_queue.clear()
+        self.file_list.clear_selection()
+        self.probe_cache.clear()
+        self.file_list.refresh()
         self.update_drop_label()
+        self.clear_preview()
     
     def browse_files(self, event=None):
         files = filedialog.askopenfilenames(
-            filetypes=[("Image files", "*.png *.jpg *.jpeg *.webp")])
-        self.files_to_compress.extend(files)
-        self.update_file_list()
+            filetypes=[("Image files", "*.png *.jpg *.jpeg *.webp *.ico"), ("All files", "*")])
+        self.scan_paths(files)
+    
+    def browse_folder(self):
+        folder = filedialog.askdirectory(title="Select Folder of Images")
+        if folder:
+            self.scan_paths([folder])
     
     def update_drop_label(self):
-        self.drop_label.config(text=f"{len(self.files_to_compress)} images selected")
+        counts = self.file_queue.status_counts()
+        text = f"{len(self.file_queue)} images selected"
+        finished = counts[file_queue.DONE] + counts[file_queue.SKIPPED]
+        if finished or counts[file_queue.FAILED]:
+            text += f" ({finished} done, {counts[file_queue.FAILED]} failed)"
+        self.drop_label.config(text=text)
 
     def apply_preset(self):
         preset = self.selected_preset.get()
@@ -541,6 +831,19 @@ class ImageCompressorApp:
             profile = self.profiles[profile_name]
             self.output_format.set(profile["format"])
             self.quality.set(profile["quality"])
+            target_size_kb = profile.get("target_size_kb", 0)
+            self.target_size_kb.set(str(target_size_kb) if target_size_kb else "")
+            self.auto_quality.set(profile.get("auto_quality", False))
+            self.ssim_threshold.set(str(profile.get(
+                "ssim_threshold", perceptual_quality.DEFAULT_SSIM_THRESHOLD)))
+            renditions = profile.get("renditions") or {}
+            self.rendition_widths.set(", ".join(str(width) for width in renditions.get("widths", [])))
+            self.rendition_formats.set(", ".join(renditions.get("formats", [])))
+            self.rendition_pattern.set(renditions.get(
+                "pattern", compression_engine.DEFAULT_RENDITION_PATTERN))
+            self.exact_resize.set(profile.get("resize_quality") == "exact")
+            self.effort.set(profile.get("effort", "max"))
+            self.lossless_png.set(profile.get("lossless_png", False))
             self.resize_enabled.set(profile["resize"])
             if profile["resize"]:
                 self.width.set(str(profile["width"]))
@@ -554,20 +857,32 @@ class ImageCompressorApp:
                 "quality": self.quality.get(),
                 "resize": self.resize_enabled.get(),
                 "width": int(self.width.get()) if self.width.get().isdigit() else 0,
-                "height": int(self.height.get()) if self.height.get().isdigit() else 0
+                "height": int(self.height.get()) if self.height.get().isdigit() else 0,
+                "resize_quality": "exact" if self.exact_resize.get() else "fast",
+                "effort": self.effort.get(),
+                "lossless_png": self.lossless_png.get(),
+                "target_size_kb": int(self.target_size_kb.get()) if self.target_size_kb.get().isdigit() else 0,
+                "auto_quality": self.auto_quality.get(),
+                "ssim_threshold": float(self.ssim_threshold.get() or perceptual_quality.DEFAULT_SSIM_THRESHOLD)
             }
+            widths = [int(width) for width in split_list(self.rendition_widths.get()) if width.isdigit()]
+            if widths:
+                self.profiles[name]["renditions"] = {
+                    "widths": widths,
+                    "formats": split_list(self.rendition_formats.get().lower()),
+                    "pattern": self.rendition_pattern.get() or compression_engine.DEFAULT_RENDITION_PATTERN
+                }
             # Save profiles to file
-            with open("compression_profiles.json", "w") as f:
-                json.dump(self.profiles, f)
+            compression_engine.save_profiles(self.profiles)
             messagebox.showinfo("Success", f"Profile '{name}' saved successfully!")
 
     def view_metadata(self):
-        selection = self.file_listbox.curselection()
+        selection = self.file_list.selection()
         if not selection:
             messagebox.showwarning("Warning", "Please select an image first!")
             return
             
-        file_path = self.files_to_compress[selection[0]]
+        file_path = selection[0]
         try:
             metadata = self.get_image_metadata(file_path)
             
@@ -599,59 +914,23 @@ class ImageCompressorApp:
     def get_image_metadata(self, image_path):
         metadata = {}
         try:
-            with Image.open(image_path) as img:
-                # Get basic image info
-                metadata["Format"] = img.format
-                metadata["Mode"] = img.mode
-                metadata["Size"] = f"{img.width}x{img.height}"
-                
-                # Get EXIF data
-                if hasattr(img, '_getexif') and img._getexif():
-                    exif = img._getexif()
-                    for tag_id in exif:
-                        tag = TAGS.get(tag_id, tag_id)
-                        data = exif.get(tag_id)
-                        if isinstance(data, bytes):
-                            data = data.decode(errors='replace')
-                        metadata[tag] = data
-                
-                # Get other image info
-                if hasattr(img, 'info'):
-                    for key, value in img.info.items():
-                        if isinstance(value, (str, int, float)):
-                            metadata[key] = value
+            # The index only reads the file when it changed since it was indexed
+            record = self.metadata_index.get(image_path)
+            if record["error"]:
+                raise ValueError(record["error"])
+            # Get basic image info
+            metadata["Format"] = record["format"]
+            metadata["Mode"] = record["mode"]
+            metadata["Size"] = f"{record['width']}x{record['height']}"
+            
+            # EXIF and other info chunks
+            metadata.update(json.loads(record["metadata"]))
                 
         except Exception as e:
             metadata["Error"] = str(e)
             
         return metadata
 
-    def generate_filename(self, original_path, index):
-        original_name = os.path.splitext(os.path.basename(original_path))[0]
-        date = datetime.now().strftime("%Y%m%d")
-        
-        try:
-            with Image.open(original_path) as img:
-                width, height = img.size
-        except:
-            width, height = 0, 0
-        
-        # Replace variables in pattern
-        pattern = self.rename_pattern.get()
-        number = self.start_number.get() + index
-        
-        filename = pattern.format(
-            original_name=original_name,
-            number=f"{number:03d}",
-            date=date,
-            width=width,
-            height=height
-        )
-        
-        # Clean filename
-        filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-        return filename
-
     def show_about(self):
         about_window = tk.Toplevel(self.root)
         about_window.title("About Image Compressor")
@@ -682,8 +961,14 @@ class ImageCompressorApp:
         logging.info("Application closing")
         try:
             self._is_closing = True
+            if self.batch_worker:
+                self.batch_worker.cancel()
+            for indexer in self.metadata_indexers:
+                indexer.cancel()
             self.clear_preview()
             self._photo_references.clear()
+            self.preview_cache.shutdown()
+            self.preview_timings.log_summary("Preview timings")
             logging.debug("Cleaned up photo references")
             
             # Schedule destroy after a short delay
@@ -718,6 +1003,8 @@ class ImageCompressorApp:
         for fmt in ["JPEG", "PNG", "WebP", "ICO"]:  # Added ICO to format options
             ttk.Radiobutton(parent, text=fmt, value=fmt.lower(),
                            variable=self.output_format).pack(padx=10, pady=2)
+        ttk.Checkbutton(parent, text="Lossless PNG Optimization (slower)",
+                       variable=self.lossless_png).pack(padx=10, pady=(5, 2))
 
     def setup_quality_section(self, parent):
         ttk.Label(parent, text="Quality:").pack(padx=10, pady=2)
@@ -726,6 +1013,20 @@ class ImageCompressorApp:
             variable=self.quality, 
             orient="horizontal")
         self.quality_slider.pack(padx=10, pady=5, fill="x")
+        
+        target_frame = ttk.Frame(parent)
+        target_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(target_frame, text="Target Size (KB):").pack(side="left")
+        ttk.Entry(target_frame, textvariable=self.target_size_kb, width=8).pack(side="left", padx=5)
+        ttk.Label(parent, text="JPEG/WebP only; quality above is the maximum.\nLeave empty to disable.",
+                 justify="left").pack(padx=10)
+        
+        ttk.Checkbutton(parent, text="Auto Quality (SSIM)",
+                       variable=self.auto_quality).pack(padx=10, pady=(5, 2))
+        ssim_frame = ttk.Frame(parent)
+        ssim_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(ssim_frame, text="Min. SSIM:").pack(side="left")
+        ttk.Entry(ssim_frame, textvariable=self.ssim_threshold, width=8).pack(side="left", padx=5)
 
     def setup_resize_section(self, parent):
         ttk.Checkbutton(parent, text="Enable Resize",
@@ -741,6 +1042,8 @@ class ImageCompressorApp:
         
         ttk.Checkbutton(parent, text="Maintain Aspect Ratio",
                        variable=self.maintain_aspect).pack(padx=10, pady=2)
+        ttk.Checkbutton(parent, text="Exact Resampling (slower)",
+                       variable=self.exact_resize).pack(padx=10, pady=2)
         
         ttk.Label(parent, text="Presets:").pack(padx=10, pady=2)
         for text, value in [
@@ -788,15 +1091,84 @@ class ImageCompressorApp:
         ttk.Label(number_frame, text="Start Number:").pack(side="left")
         ttk.Entry(number_frame, textvariable=self.start_number, width=8).pack(side="left", padx=5)
 
+    def setup_rendition_section(self, parent):
+        ttk.Label(parent, text="Widths (e.g. 320, 640, 1280):").pack(padx=10, pady=(5,0))
+        ttk.Entry(parent, textvariable=self.rendition_widths).pack(padx=10, pady=(0,5), fill="x")
+        
+        ttk.Label(parent, text="Formats (e.g. webp, jpeg):").pack(padx=10, pady=(5,0))
+        ttk.Entry(parent, textvariable=self.rendition_formats).pack(padx=10, pady=(0,5), fill="x")
+        
+        ttk.Label(parent, text="Pattern:").pack(padx=10, pady=(5,0))
+        ttk.Entry(parent, textvariable=self.rendition_pattern).pack(padx=10, pady=(0,5), fill="x")
+        
+        ttk.Label(parent,
+                 text="Each image is decoded once and saved at\nevery width in every format. Leave widths\nempty to disable.",
+                 justify="left").pack(padx=10)
+
+    def setup_performance_section(self, parent):
+        worker_frame = ttk.Frame(parent)
+        worker_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(worker_frame, text="Worker Processes:").pack(side="left")
+        ttk.Spinbox(worker_frame, from_=1, to=max(64, compression_engine.default_workers()),
+                    textvariable=self.workers, width=6).pack(side="left", padx=5)
+        memory_frame = ttk.Frame(parent)
+        memory_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(memory_frame, text="Memory Budget (MB):").pack(side="left")
+        ttk.Entry(memory_frame, textvariable=self.memory_limit_mb, width=8).pack(side="left", padx=5)
+        pixel_frame = ttk.Frame(parent)
+        pixel_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(pixel_frame, text="Pixel Limit (MP):").pack(side="left")
+        ttk.Entry(pixel_frame, textvariable=self.max_megapixels, width=8).pack(side="left", padx=5)
+        effort_frame = ttk.Frame(parent)
+        effort_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(effort_frame, text="Encoder Effort:").pack(side="left")
+        ttk.OptionMenu(effort_frame, self.effort, self.effort.get(),
+                       *compression_engine.EFFORT_TIERS).pack(side="left", padx=5)
+        deadline_frame = ttk.Frame(parent)
+        deadline_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(deadline_frame, text="Finish Within (min):").pack(side="left")
+        ttk.Entry(deadline_frame, textvariable=self.deadline_minutes, width=8).pack(side="left", padx=5)
+        dedup_frame = ttk.Frame(parent)
+        dedup_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(dedup_frame, text="Duplicates:").pack(side="left")
+        ttk.OptionMenu(dedup_frame, self.dedup_policy, self.dedup_policy.get(),
+                       "off", *duplicate_finder.DEDUP_POLICIES).pack(side="left", padx=5)
+        ttk.Checkbutton(parent, text="Skip Unchanged Files",
+                       variable=self.incremental).pack(padx=10, pady=2)
+        ttk.Checkbutton(parent, text="Pipelined I/O (network storage)",
+                       variable=self.pipelined_io).pack(padx=10, pady=2)
+
     def setup_progress_section(self, parent):
         self.progress_bar = ttk.Progressbar(parent, mode='determinate')
         self.progress_bar.pack(padx=10, pady=5, fill="x")
+        
+        self.progress_label = ttk.Label(parent, text="", justify="left")
+        self.progress_label.pack(padx=10, pady=2, fill="x")
+        
+        button_frame = ttk.Frame(parent)
+        button_frame.pack(padx=10, pady=2)
+        self.pause_btn = ttk.Button(button_frame, text="Pause",
+                                    command=self.toggle_pause_batch, state="disabled")
+        self.pause_btn.pack(side="left", padx=2)
+        self.cancel_btn = ttk.Button(button_frame, text="Cancel",
+                                     command=self.cancel_batch, state="disabled")
+        self.cancel_btn.pack(side="left", padx=2)
 
 def main():
     global DRAG_DROP_AVAILABLE
     logging.info("Starting application")
     root = None
     try:
+        # Try to import tkinterdnd2 with fallback to regular tkinter; it is
+        # imported here so the module import stays fast
+        try:
+            from tkinterdnd2 import TkinterDnD
+            DRAG_DROP_AVAILABLE = True
+            print("Drag and drop functionality available")
+        except ImportError as e:
+            print(f"Drag and drop not available: {e}")
+            TkinterDnD = tk
+
         # Initialize tkdnd only if available
         if DRAG_DROP_AVAILABLE and hasattr(sys, '_MEIPASS'):
             try:
@@ -818,17 +1190,17 @@ def main():
         root.withdraw()
         logging.debug("Main window created")
         
-        # Show splash screen
-        splash = SplashScreen(root)  # Pass root as parent
-        splash.progress_bar()
-        logging.debug("Splash screen displayed")
+        # The splash only appears if start-up turns out to be slow, and
+        # its progress bar follows the real initialization steps
+        startup = StartupProgress(root, STARTUP_STARTED)
         
         # Initialize app
-        app = ImageCompressorApp(root)
+        app = ImageCompressorApp(root, progress=startup.step)
         logging.debug("App initialized")
+        ui_built = time.perf_counter()
         
         # Destroy splash screen and show main window
-        splash.destroy()
+        startup.close()
         root.deiconify()
         
         # Ensure window appears prominently
@@ -839,6 +1211,16 @@ def main():
         root.after(100, lambda: root.attributes('-topmost', False))  # Remove topmost after 100ms
         
         logging.debug("Main window displayed")
+        first_frame = time.perf_counter()
+        logging.info(
+            f"Startup: imports {(IMPORTS_FINISHED - STARTUP_STARTED) * 1000:.0f} ms, "
+            f"UI build {(ui_built - IMPORTS_FINISHED) * 1000:.0f} ms, "
+            f"first frame {(first_frame - ui_built) * 1000:.0f} ms, "
+            f"total {(first_frame - STARTUP_STARTED) * 1000:.0f} ms"
+            + (" (splash shown)" if startup.shown else ""))
+        if "--measure-startup" in sys.argv:
+            # For tracking start-up time from scripts: exit once the window is up
+            root.after(0, app.on_closing)
         
         root.mainloop()
         
@@ -853,6 +1235,8 @@ def main():
         raise
 
 if __name__ == "__main__":
+    # Required for the compression process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
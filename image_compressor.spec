@@ -69,6 +69,18 @@ except ImportError:
 
 block_cipher = None
 
+# Startup mode. "onedir" (the default) starts fastest: the app runs from an
+# unpacked folder, so nothing is extracted at launch. "onefile" is a single
+# executable that unpacks itself to a temporary folder on every launch.
+#   IMAGECOMPRESSOR_BUILD_MODE=onefile pyinstaller image_compressor.spec
+build_mode = os.environ.get('IMAGECOMPRESSOR_BUILD_MODE', 'onedir').lower()
+if build_mode not in ('onedir', 'onefile'):
+    raise SystemExit(f"Unknown IMAGECOMPRESSOR_BUILD_MODE: {build_mode}")
+# UPX-packed libraries are decompressed every time they load; only worth it
+# to shrink a one-file download
+use_upx = build_mode == 'onefile'
+print(f"Building in {build_mode} mode")
+
 # Define platform-specific settings
 if sys.platform == 'win32':
     icon_file = 'assets/logo.ico'
@@ -93,6 +105,8 @@ a = Analysis(
         'tkinterdnd2',
         'humanize',
         'piexif',
+        # Imported through lazy_imports.lazy_module, which analysis cannot see
+        'numpy',
         'tkinter',
         'tkinter.ttk',
         'tkinter.messagebox',
@@ -110,16 +124,12 @@ a = Analysis(
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    [],
-    exclude_binaries=True,
+exe_options = dict(
     name='ImageCompressor',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=use_upx,
     console=console_mode,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -129,19 +139,41 @@ exe = EXE(
     icon=icon_file,
 )
 
-coll = COLLECT(
-    exe,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    name='ImageCompressor',
-)
+if build_mode == 'onefile':
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        [],
+        runtime_tmpdir=None,
+        **exe_options,
+    )
+    bundled = exe
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        **exe_options,
+    )
+
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        strip=False,
+        upx=use_upx,
+        upx_exclude=[],
+        name='ImageCompressor',
+    )
+    bundled = coll
 
 app = BUNDLE(
-    coll,
+    bundled,
     name='ImageCompressor.app',
     icon='assets/logo.ico',
     bundle_identifier='com.mehdiharzallah.imagecompressor',
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Command-line interface for Image Compressor.
+
+Runs the same compression engine as the desktop app without a display, e.g.
+
+    python image_compressor_cli.py "photos/**/*.jpg" -o out --format webp --quality 80
+    python image_compressor_cli.py shots/ -o out --profile "Social Media"
+    python image_compressor_cli.py -o out --resume
+    python image_compressor_cli.py shots/ -o out --on-interrupted restart
+"""
+
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+from dataclasses import replace
+
+import compression_engine
+import duplicate_finder
+import file_scanner
+import folder_watcher
+import job_journal
+import large_image
+import perceptual_quality
+import pipelined_io
+import png_optimizer
+from compression_engine import CompressionSettings, split_list
+from compression_manifest import CompressionManifest
+from file_scanner import path_key
+
+
+def expand_inputs(patterns):
+    """Expand files, directories and glob patterns into a list of image paths.
+
+    Directories are walked recursively and their files identified by
+    content; explicit files and glob matches are filtered by extension.
+    """
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(file_scanner.iter_image_files([pattern], seen))
+            continue
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+
+        for path in matches:
+            key = file_scanner.path_key(path)
+            if key in seen or not compression_engine.is_valid_image(path):
+                continue
+            if not os.path.isfile(path):
+                logging.warning(f"Skipping missing file: {path}")
+                continue
+            seen.add(key)
+            files.append(path)
+    return files
+
+
+def _input_root(pattern):
+    """Directory the files matched by `pattern` are placed relative to, or None"""
+    if os.path.isdir(pattern):
+        return pattern
+    if not glob.has_magic(pattern):
+        return None
+    # The leading directories before the first wildcard
+    parts = []
+    for part in pattern.replace(os.sep, "/").split("/"):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return "/".join(parts) or os.curdir
+
+
+def output_subdirs(files, patterns):
+    """Output subdirectory of each of `files`, as expanded from `patterns`.
+
+    A file found under a directory input, or under a glob's leading
+    directories, keeps its folder relative to that root, so files of the
+    same name in different folders do not overwrite each other. Other
+    files go to the top of the output directory.
+    """
+    roots = [os.path.abspath(root) for root in map(_input_root, patterns) if root is not None]
+    subdirs = []
+    for file_path in files:
+        directory = os.path.abspath(os.path.dirname(file_path) or os.curdir)
+        subdir = ""
+        for root in roots:
+            if os.path.commonpath([path_key(root), path_key(directory)]) == path_key(root):
+                relative = os.path.relpath(directory, root)
+                subdir = "" if relative == os.curdir else relative
+                break
+        subdirs.append(subdir)
+    return subdirs
+
+
+# What a run does about an interrupted job in its output directory
+ON_INTERRUPTED = ("resume", "restart", "fail")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Compress, convert and resize images without the GUI.",
+        epilog="Exit status: 0 when every image succeeded, 1 when some failed, 2 for invalid "
+               "arguments or inputs, or for an interrupted job in the output directory with "
+               "--on-interrupted fail.")
+    parser.add_argument("inputs", nargs="*",
+                        help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", required=True,
+                        help="Directory to write compressed images to; the folders below a "
+                             "directory input are kept")
+    parser.add_argument("-p", "--profile",
+                        help="Profile name from compression_profiles.json or the built-in profiles")
+    parser.add_argument("--profiles-file", default=compression_engine.PROFILES_FILE,
+                        help="Path to the saved profiles file")
+    parser.add_argument("-f", "--format", dest="output_format",
+                        choices=compression_engine.OUTPUT_FORMATS)
+    parser.add_argument("-q", "--quality", type=int)
+    parser.add_argument("--target-size", type=int, metavar="KB",
+                        help="Search JPEG/WebP quality (up to --quality) so each output fits in KB kilobytes")
+    parser.add_argument("--auto-quality", action="store_true",
+                        help="Pick the lowest JPEG/WebP quality (up to --quality) that keeps --ssim")
+    parser.add_argument("--ssim", type=float,
+                        help="SSIM threshold for --auto-quality (default: "
+                             f"{perceptual_quality.DEFAULT_SSIM_THRESHOLD})")
+    parser.add_argument("--width", type=int,
+                        help="Target width in pixels (enables resize)")
+    parser.add_argument("--height", type=int,
+                        help="Target height in pixels (enables resize)")
+    parser.add_argument("--renditions", metavar="WIDTHS",
+                        help="Comma-separated widths for a responsive rendition set, e.g. 320,640,1280,1920")
+    parser.add_argument("--rendition-formats", metavar="FORMATS",
+                        help="Comma-separated formats for every rendition (default: --format)")
+    parser.add_argument("--rendition-pattern",
+                        help="Rendition name pattern (default: "
+                             f"'{compression_engine.DEFAULT_RENDITION_PATTERN}')")
+    parser.add_argument("--exact-resize", action="store_true",
+                        help="Resample from the full-resolution frame instead of the fast reduce path")
+    parser.add_argument("--effort", choices=compression_engine.EFFORT_TIERS,
+                        help="Encoder effort: fast, balanced or max (default: max, smallest files)")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="Try to finish each batch within SECONDS by lowering --effort "
+                             "for the remaining files when throughput falls behind")
+    parser.add_argument("--lossless-png", action="store_true",
+                        help="For PNG output, try lossless reductions (palette, greyscale, "
+                             "opaque alpha) and zlib settings and keep the smallest file")
+    parser.add_argument("--png-trial-seconds", type=float, metavar="SECONDS",
+                        help="Time cap for --lossless-png trials per image (default: "
+                             f"{png_optimizer.DEFAULT_TRIAL_SECONDS:g})")
+    parser.add_argument("--no-aspect", action="store_true",
+                        help="Do not maintain the aspect ratio when resizing")
+    parser.add_argument("--strip-metadata", action="store_true",
+                        help="Do not copy EXIF/ICC data to the output")
+    parser.add_argument("--rename",
+                        help="Rename pattern, e.g. '{original_name}_{number}' "
+                             "(variables: {original_name}, {number}, {date}, {width}, {height})")
+    parser.add_argument("--start-number", type=int, default=1)
+    parser.add_argument("-j", "--workers", type=int, default=0,
+                        help="Worker processes (default: one per CPU core, 1 = no pool)")
+    parser.add_argument("--max-pixels", type=float, metavar="MP",
+                        help="Refuse images above this many megapixels, 0 for no limit "
+                             f"(default: {large_image.DEFAULT_MAX_PIXELS // 1_000_000})")
+    parser.add_argument("--memory-limit", type=int, default=0, metavar="MB",
+                        help="Budget for decoded image memory across workers; new files wait "
+                             "until there is room (default: unlimited)")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="N",
+                        help="Overlap I/O with compression for slow or network storage: read N "
+                             f"files ahead and write outputs in the background (e.g. {pipelined_io.DEFAULT_DEPTH})")
+    parser.add_argument("--dedup", choices=duplicate_finder.DEDUP_POLICIES,
+                        help="Find exact and near-duplicate inputs and compress one per group: skip "
+                             "the rest, keep the largest, or keep the largest and hard-link its output")
+    parser.add_argument("--dedup-distance", type=int, default=duplicate_finder.DEFAULT_MAX_DISTANCE,
+                        metavar="BITS",
+                        help="Perceptual hash bits two images may differ in to count as duplicates, "
+                             f"-1 for exact copies only (default: {duplicate_finder.DEFAULT_MAX_DISTANCE})")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the interrupted job journaled in the output directory with "
+                             "its original inputs and settings")
+    parser.add_argument("--on-interrupted", choices=ON_INTERRUPTED,
+                        help="When the output directory has an interrupted job and --resume is not "
+                             "given: resume it, restart and discard its journal, or fail with exit "
+                             "status 2 (default: fail when run from a terminal, otherwise resume, "
+                             "so scheduled reruns finish the job)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip files whose content and settings are unchanged since the last run")
+    parser.add_argument("--timing-report", metavar="PATH",
+                        help="Write per-stage timings to PATH (.csv for CSV, otherwise JSON)")
+    parser.add_argument("--watch", action="store_true",
+                        help="After the initial run, keep watching the input folders and "
+                             "compress new or changed images as they arrive (Ctrl+C to stop)")
+    parser.add_argument("--settle", type=float, default=folder_watcher.DEFAULT_SETTLE_SECONDS,
+                        metavar="SECONDS",
+                        help="With --watch, how long a file must stop changing before it is compressed")
+    parser.add_argument("--poll", action="store_true",
+                        help="With --watch, poll instead of using inotify (e.g. for network shares)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser
+
+
+def settings_from_args(args):
+    if args.profile:
+        profiles = compression_engine.load_profiles(args.profiles_file)
+        if args.profile not in profiles:
+            raise ValueError(f"Unknown profile '{args.profile}'. "
+                             f"Available: {', '.join(sorted(profiles))}")
+        settings = CompressionSettings.from_profile(profiles[args.profile])
+    else:
+        settings = CompressionSettings()
+
+    if args.output_format:
+        settings.output_format = args.output_format
+    if args.quality is not None:
+        settings.quality = args.quality
+    if args.target_size is not None:
+        settings.target_size_kb = args.target_size
+    if args.auto_quality:
+        settings.auto_quality = True
+    if args.ssim is not None:
+        settings.ssim_threshold = args.ssim
+    if args.width is not None or args.height is not None:
+        settings.resize_enabled = True
+        settings.width = args.width or 0
+        settings.height = args.height or 0
+    if args.renditions:
+        settings.rendition_widths = [int(width) for width in split_list(args.renditions)]
+    if args.rendition_formats:
+        settings.rendition_formats = split_list(args.rendition_formats.lower())
+    if args.rendition_pattern:
+        settings.rendition_pattern = args.rendition_pattern
+    if args.exact_resize:
+        settings.resize_quality = "exact"
+    if args.effort:
+        settings.effort = args.effort
+    if args.lossless_png:
+        settings.lossless_png = True
+    if args.png_trial_seconds is not None:
+        settings.png_trial_seconds = args.png_trial_seconds
+    settings.maintain_aspect = not args.no_aspect
+    settings.preserve_metadata = not args.strip_metadata
+    if args.rename:
+        settings.rename_enabled = True
+        settings.rename_pattern = args.rename
+    settings.start_number = args.start_number
+    if args.max_pixels is not None:
+        settings.max_pixels = int(args.max_pixels * 1_000_000)
+
+    settings.validate()
+    return settings
+
+
+def batch_options(args):
+    """compress_batch keyword arguments from the command line"""
+    return {
+        "workers": args.workers,
+        "incremental": args.incremental or args.watch,
+        "memory_limit": args.memory_limit * 1024 * 1024 or None,
+        "deadline": args.deadline,
+        "pipeline_depth": args.pipeline,
+        "dedup": args.dedup,
+        "dedup_distance": args.dedup_distance,
+    }
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        stream=sys.stdout
+    )
+
+    journal_path = os.path.join(args.output_dir, job_journal.JOURNAL_NAME)
+    job = job_journal.load(journal_path)
+    if args.resume:
+        return resume(job, args)
+    if job is not None and not job.finished:
+        action = args.on_interrupted or ("fail" if sys.stdin and sys.stdin.isatty() else "resume")
+        progress = f"{job.done_count} of {len(job.files)} files done"
+        if action == "fail":
+            logging.error(f"{args.output_dir} has an interrupted job ({progress}). Run with "
+                          f"--resume to continue it or --on-interrupted restart to start over.")
+            return 2
+        if action == "resume":
+            logging.info(f"{args.output_dir} has an interrupted job ({progress}); resuming it "
+                         f"instead of starting a new one")
+            return resume(job, args)
+        logging.info(f"Discarding the interrupted job in {args.output_dir} ({progress})")
+
+    if not args.inputs:
+        logging.error("No inputs given")
+        return 2
+    try:
+        settings = settings_from_args(args)
+    except ValueError as e:
+        logging.error(str(e))
+        return 2
+
+    files = expand_inputs(args.inputs)
+    if not files and not args.watch:
+        logging.error("No images matched the given inputs")
+        return 2
+
+    status = 0
+    if files:
+        os.makedirs(args.output_dir, exist_ok=True)
+        options = dict(batch_options(args), output_subdirs=output_subdirs(files, args.inputs))
+        journal = job_journal.JobJournal.start(journal_path, files, args.output_dir, settings, options)
+        status = run_batch(files, args, settings, options, journal)
+    if args.watch:
+        # Numbers continue after the initial batch's files
+        return watch(args, replace(settings, start_number=settings.start_number + len(files)))
+    return status
+
+
+def resume(job, args):
+    """Continue an interrupted job with its journaled inputs, settings and options"""
+    if job is None or job.finished:
+        logging.error(f"No interrupted job to resume in {args.output_dir}")
+        return 2
+    try:
+        settings = job.compression_settings()
+        settings.validate()
+    except (TypeError, ValueError) as e:
+        logging.error(f"Cannot resume job: {str(e)}")
+        return 2
+    return run_batch(job.files, args, settings, job.options, job_journal.JobJournal.resume(job))
+
+
+def run_batch(files, args, settings, options, journal=None):
+    """Compress `files` and log the outcome; returns the exit status"""
+    logging.info(f"Compressing {len(files)} images to {args.output_dir}")
+
+    def report(done, total, result):
+        if result.ok:
+            logging.debug(f"[{done}/{total}] {result.input_path} -> {result.output_path} "
+                          f"(quality {result.quality}, {result.trials} encode trials)")
+
+    results = compression_engine.compress_batch(
+        files, args.output_dir, settings, progress_callback=report, journal=journal, **options)
+
+    summary = compression_engine.summarize_results(results)
+    logging.info(
+        f"Done: {summary['succeeded']} succeeded ({summary['skipped']} unchanged, "
+        f"{summary['resumed']} resumed, {summary['duplicates']} duplicates), "
+        f"{summary['failed']} failed, "
+        f"{summary['input_bytes']} -> {summary['output_bytes']} bytes")
+    if settings.target_size_enabled or settings.auto_quality_enabled:
+        encoded = summary["succeeded"] - summary["skipped"] - summary["resumed"] - summary["duplicates"]
+        logging.info(f"Quality search: {summary['encode_trials']} encode trials "
+                     f"for {encoded} images ({summary['encode_trials'] / max(encoded, 1):.1f} per image)")
+    peak_rss = compression_engine.peak_rss_mb()
+    if peak_rss is not None:
+        logging.info(f"Peak RSS: {peak_rss:.0f} MB (largest process)")
+    timings = compression_engine.timing_report(results)
+    timings.log_summary()
+    if args.timing_report:
+        timings.save(args.timing_report)
+        logging.info(f"Stage timings written to {args.timing_report}")
+    if summary["failed"]:
+        logging.error("Failed files:\n" + compression_engine.format_failures(results, limit=50))
+    return 1 if summary["failed"] else 0
+
+
+def watch_numbers(files, output_dir, next_number):
+    """({number} of each of `files`, next free number) for a watch batch.
+
+    Files in the output directory's manifest keep their recorded number;
+    new files are numbered from `next_number`, or after the highest
+    recorded number if that is larger.
+    """
+    manifest = CompressionManifest.load(output_dir)
+    highest = manifest.max_number()
+    if highest is not None:
+        next_number = max(next_number, highest + 1)
+    numbers = []
+    for file_path in files:
+        number = manifest.number(file_path)
+        if number is None:
+            number = next_number
+            next_number += 1
+        numbers.append(number)
+    return numbers, next_number
+
+
+def watch(args, settings):
+    """Compress images arriving in the input folders until interrupted.
+
+    Watch mode always uses the incremental manifest, so a file that is
+    rewritten with new content is compressed again and one that is only
+    touched is skipped.
+
+    A file the manifest already knows keeps the {number} it was given, and
+    new files continue the sequence after the highest number used so far,
+    so a rename pattern never gives a new file the output name of an
+    earlier one.
+    """
+    directories = [path for path in args.inputs if os.path.isdir(path)]
+    if not directories:
+        logging.error("--watch needs at least one input directory")
+        return 2
+
+    watcher = folder_watcher.FolderWatcher(
+        directories, exclude=[args.output_dir], settle_seconds=args.settle, polling=args.poll)
+    watcher.start()
+    logging.info(f"Watching {', '.join(directories)} ({watcher.backend_name}); press Ctrl+C to stop")
+    try:
+        while True:
+            message = watcher.get_batch(timeout=1.0)
+            if message is None:
+                continue
+            if message["type"] == "finished":
+                return 1
+            files = message["files"]
+            numbers, next_number = watch_numbers(files, args.output_dir, settings.start_number)
+            options = dict(batch_options(args), output_subdirs=output_subdirs(files, directories),
+                           numbers=numbers)
+            run_batch(files, args, settings, options)
+            settings = replace(settings, start_number=next_number)
+    except KeyboardInterrupt:
+        logging.info("Stopping watch")
+    finally:
+        watcher.stop()
+        watcher.join()
+    return 0
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Fast preview generation for the desktop app.
+
+Decodes only about as many pixels as the preview needs: JPEG files use
+DCT scaling through Image.draft, other formats shrink with reduce() via
+thumbnail's reducing_gap before the final LANCZOS pass.
+
+PreviewCache keeps recently shown previews in memory and prefetches the
+neighbours of the selected file on background threads.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from image_probe import EXIF_ORIENTATION_TAG, read_exif
+import large_image
+from lazy_imports import lazy_module
+
+# Imported on first use
+Image = lazy_module("PIL.Image")
+
+PREVIEW_HEIGHT = 300
+
+# Same mapping as ImageOps.exif_transpose, as Image.Transpose member names
+ORIENTATION_TRANSPOSE = {
+    2: "FLIP_LEFT_RIGHT",
+    3: "ROTATE_180",
+    4: "FLIP_TOP_BOTTOM",
+    5: "TRANSPOSE",
+    6: "ROTATE_270",
+    7: "TRANSVERSE",
+    8: "ROTATE_90",
+}
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Modes ImageTk.PhotoImage displays without surprises
+_DISPLAY_MODES = ('RGB', 'RGBA', 'L')
+
+
+def load_preview(file_path, height=PREVIEW_HEIGHT, probe=None):
+    """Return a preview image `height` pixels tall, upright per EXIF orientation.
+
+    Passing the file's ImageProbe skips re-parsing the EXIF block.
+    """
+    with large_image.open_image(file_path) as img:
+        if probe is not None:
+            orientation = probe.orientation
+        else:
+            orientation = read_exif(img).get(EXIF_ORIENTATION_TAG, 1)
+        transposed = orientation in (5, 6, 7, 8)
+
+        # Work out the preview size as displayed, then map it back onto the
+        # stored (pre-rotation) frame for decoding
+        display_width, display_height = (img.height, img.width) if transposed else img.size
+        preview_width = max(1, int(height * display_width / display_height))
+        target = (height, preview_width) if transposed else (preview_width, height)
+
+        if img.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, never below target
+            img.draft('RGB', target)
+            logging.debug(f"Preview draft decode at {img.size} for target {target}")
+        elif large_image.PngStripReader.supports(img):
+            # Huge PNGs are box-reduced strip by strip instead of decoded whole
+            factor = int(min(img.width / target[0], img.height / target[1]) / 2)
+            if factor >= 2:
+                with large_image.reduce_png(file_path, factor) as reduced:
+                    reduced.thumbnail(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+                    preview = reduced.resize(target, Image.Resampling.LANCZOS)
+                return _display_ready(preview, orientation)
+
+        if img.width > target[0] or img.height > target[1]:
+            img.thumbnail(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            preview = img.resize(target, Image.Resampling.LANCZOS) if img.size != target else img.copy()
+        else:
+            # Small images are scaled up to the preview height
+            preview = img.resize(target, Image.Resampling.LANCZOS)
+
+    return _display_ready(preview, orientation)
+
+
+def apply_orientation(img, orientation):
+    """`img` turned upright for an EXIF orientation value"""
+    if orientation in ORIENTATION_TRANSPOSE:
+        return img.transpose(Image.Transpose[ORIENTATION_TRANSPOSE[orientation]])
+    return img
+
+
+def _display_ready(preview, orientation):
+    preview = apply_orientation(preview, orientation)
+
+    if preview.mode not in _DISPLAY_MODES:
+        has_alpha = preview.mode in ('LA', 'PA') or 'transparency' in preview.info
+        preview = preview.convert('RGBA' if has_alpha else 'RGB')
+    return preview
+
+
+def _cache_key(file_path, probe=None):
+    if probe is not None:
+        return (os.path.abspath(file_path), probe.mtime_ns, probe.file_size)
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+def _image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+class PreviewCache:
+    """Size-bounded LRU cache of preview images.
+
+    Entries are keyed by path + mtime + size, so an edited file is decoded
+    again. Values are PIL images; PhotoImage objects are still created on
+    the Tk thread by the caller.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, height=PREVIEW_HEIGHT, prefetch_workers=2):
+        self.max_bytes = max_bytes
+        self.height = height
+        self.hits = 0
+        self.misses = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=prefetch_workers,
+                                            thread_name_prefix="preview-prefetch")
+        self._prefetch_futures = []
+
+    def get(self, file_path, probe=None):
+        """Return the preview for `file_path`, decoding it on a miss"""
+        key = _cache_key(file_path, probe)
+        with self._lock:
+            preview = self._entries.get(key)
+            if preview is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return preview
+            self.misses += 1
+
+        preview = load_preview(file_path, self.height, probe)
+        self._store(key, preview)
+        return preview
+
+    def prefetch(self, file_paths):
+        """Decode `file_paths` in the background; drops older pending requests"""
+        for future in self._prefetch_futures:
+            future.cancel()
+        self._prefetch_futures = [
+            self._executor.submit(self._prefetch_one, file_path)
+            for file_path in file_paths
+        ]
+
+    def _prefetch_one(self, file_path):
+        try:
+            key = _cache_key(file_path)
+            with self._lock:
+                if key in self._entries:
+                    return
+            self._store(key, load_preview(file_path, self.height))
+        except Exception as e:
+            logging.debug(f"Preview prefetch failed for {file_path}: {str(e)}")
+
+    def _store(self, key, preview):
+        size = _image_bytes(preview)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = preview
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= _image_bytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.debug(
+            f"Preview cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['entries']} entries, {stats['bytes'] / (1024 * 1024):.1f} MB")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.clear()
@@ -0,0 +1,116 @@
+"""
+Per-file probe records.
+
+A probe reads only the image header once and keeps what the preview,
+file info, metadata and rename code need, so the same file is not opened
+again by every caller. Records are invalidated when the file's mtime or
+size changes.
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+import large_image
+from lazy_imports import lazy_module
+
+# Imported on first use
+Image = lazy_module("PIL.Image")
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def read_exif(img):
+    """EXIF from the header only; PNG's getexif() would decode the whole image"""
+    if img.format == "PNG":
+        exif = Image.Exif()
+        if img.info.get("exif"):
+            exif.load(img.info["exif"])
+        return exif
+    return img.getexif()
+
+
+@dataclass
+class ImageProbe:
+    """Header-level facts about one image file"""
+    path: str
+    width: int
+    height: int
+    format: str
+    mode: str
+    file_size: int
+    mtime_ns: int
+    orientation: int = 1
+    has_icc: bool = False
+    has_exif: bool = False
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    @property
+    def display_size(self):
+        """Dimensions after applying the EXIF orientation"""
+        if self.orientation in (5, 6, 7, 8):
+            return (self.height, self.width)
+        return self.size
+
+
+def probe_image(file_path, stat=None):
+    """Open `file_path` once and read its header into an ImageProbe"""
+    if stat is None:
+        stat = os.stat(file_path)
+    with large_image.open_image(file_path) as img:
+        exif = read_exif(img)
+        return ImageProbe(
+            path=str(file_path),
+            width=img.width,
+            height=img.height,
+            format=img.format or "",
+            mode=img.mode,
+            file_size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            orientation=exif.get(EXIF_ORIENTATION_TAG, 1),
+            has_icc=bool(img.info.get('icc_profile')),
+            has_exif=bool(exif),
+        )
+
+
+class ProbeCache:
+    """Thread-safe cache of ImageProbe records keyed by absolute path"""
+
+    def __init__(self):
+        self._probes = {}
+        self._lock = threading.Lock()
+        self.opens = 0
+
+    def get(self, file_path):
+        """Return a fresh probe, re-reading the header only if the file changed"""
+        key = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        with self._lock:
+            probe = self._probes.get(key)
+        if (probe is not None and probe.mtime_ns == stat.st_mtime_ns
+                and probe.file_size == stat.st_size):
+            return probe
+
+        probe = probe_image(file_path, stat)
+        with self._lock:
+            self._probes[key] = probe
+            self.opens += 1
+        logging.debug(f"Probed {file_path}: {probe.width}x{probe.height} {probe.format}")
+        return probe
+
+    def peek(self, file_path):
+        """Return the cached probe without touching the file system"""
+        with self._lock:
+            return self._probes.get(os.path.abspath(file_path))
+
+    def invalidate(self, file_path):
+        with self._lock:
+            self._probes.pop(os.path.abspath(file_path), None)
+
+    def clear(self):
+        with self._lock:
+            self._probes.clear()
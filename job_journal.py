@@ -0,0 +1,172 @@
+"""
+Crash-resumable batch journal.
+
+The journal is an append-only JSON-lines file. The first line records
+the job (output directory, settings, batch options and the queued files),
+then one line follows per finished file with its state, its input's size
+and mtime and the size of every output, and a last line once the batch
+completed. Every line is flushed and fsynced, so after a crash or a
+reboot the journal still says which files are done; a torn last line is
+ignored.
+
+Resuming checks finished files cheaply: their input's size and mtime and
+each output's size must still match, otherwise the file is done again.
+Failed files are always retried.
+"""
+
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+
+from compression_engine import CompressionSettings
+
+JOURNAL_NAME = ".image_compressor_job.jsonl"
+JOURNAL_VERSION = 1
+
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """A journaled batch as read back from disk"""
+    path: str
+    output_dir: str
+    settings: dict
+    files: list
+    options: dict
+    # File index -> its latest journal entry
+    entries: dict = field(default_factory=dict)
+    finished: bool = False
+
+    @property
+    def done_count(self):
+        return sum(1 for entry in self.entries.values() if entry["state"] == DONE)
+
+    def compression_settings(self):
+        return CompressionSettings(**self.settings)
+
+    def verified(self):
+        """Entries of done files whose input and outputs are unchanged on disk"""
+        verified = {}
+        for index, entry in self.entries.items():
+            if entry["state"] == DONE and _unchanged(self.files[index], entry):
+                verified[index] = entry
+        return verified
+
+
+def _unchanged(file_path, entry):
+    try:
+        stat = os.stat(file_path)
+        if (stat.st_size, stat.st_mtime_ns) != (entry["input_size"], entry["input_mtime_ns"]):
+            return False
+        return all(os.path.getsize(path) == size for path, size in entry["outputs"])
+    except OSError:
+        return False
+
+
+def load(path):
+    """Read the journal at `path`; None if there is none or it is unreadable"""
+    try:
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    job = None
+    for number, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Only the line being written when the process died can be torn
+            if number < len(lines) - 1:
+                logging.warning(f"Skipping corrupt line {number + 1} in {path}")
+            continue
+        if job is None:
+            if record.get("type") != "job" or record.get("version") != JOURNAL_VERSION:
+                return None
+            job = Job(path=str(path), output_dir=record["output_dir"], settings=record["settings"],
+                      files=record["files"], options=record["options"])
+        elif record["type"] == "file":
+            job.entries[record["index"]] = record
+        elif record["type"] == "finished":
+            job.finished = True
+    return job
+
+
+def discard(path):
+    """Forget the job journaled at `path`"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class JobJournal:
+    """Appends a batch's progress to its journal file.
+
+    `completed` maps the indexes of files already done in an earlier run
+    to their entries; the batch skips them.
+    """
+
+    def __init__(self, path, completed=None):
+        self.path = str(path)
+        self.completed = completed or {}
+        self._file = open(self.path, "a")
+
+    @classmethod
+    def start(cls, path, files, output_dir, settings, options=None):
+        """Begin a new journal at `path`, replacing any earlier one"""
+        with open(path, "w") as f:
+            f.write(json.dumps({
+                "type": "job",
+                "version": JOURNAL_VERSION,
+                "output_dir": output_dir,
+                "settings": asdict(settings),
+                "files": [str(file_path) for file_path in files],
+                "options": options or {},
+            }) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return cls(path)
+
+    @classmethod
+    def resume(cls, job):
+        """Continue `job`'s journal; done files that no longer check out are redone"""
+        completed = job.verified()
+        redone = job.done_count - len(completed)
+        logging.info(f"Resuming job: {len(completed)} of {len(job.files)} files done"
+                     + (f", {redone} changed or missing outputs will be redone" if redone else ""))
+        return cls(job.path, completed)
+
+    def _append(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(self, index, result):
+        """Record the outcome of files[index]"""
+        entry = {"type": "file", "index": index, "state": DONE if result.ok else FAILED}
+        if result.ok:
+            try:
+                stat = os.stat(result.input_path)
+                entry["input_size"], entry["input_mtime_ns"] = stat.st_size, stat.st_mtime_ns
+                entry["outputs"] = [[path, os.path.getsize(path)] for path in result.outputs]
+            except OSError as e:
+                # Unverifiable, so a resumed job does the file again
+                entry["state"] = FAILED
+                entry["error"] = str(e)
+            else:
+                entry["input_bytes"] = result.input_bytes
+                entry["output_bytes"] = result.output_bytes
+        else:
+            entry["error"] = result.error
+        self._append(entry)
+
+    def finish(self):
+        """Mark the batch complete; a finished job is not offered for resuming"""
+        self._append({"type": "finished"})
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
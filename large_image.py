@@ -0,0 +1,308 @@
+"""
+Large-image support for the compression engine.
+
+Replaces Pillow's decompression-bomb guard with an explicit pixel limit,
+and handles very large PNGs a band of rows at a time: PngStripReader
+inflates the IDAT stream incrementally and lets Pillow unfilter each band
+(by re-wrapping it as a small PNG that starts with the previous, already
+decoded row), so the full-resolution frame never exists in memory.
+Bands can be box-reduced as they arrive, or re-encoded straight into a
+PNG written band by band.
+
+Only non-interlaced 8-bit PNGs are read in strips. JPEGs use draft()
+decoding instead, and everything else is decoded normally.
+"""
+
+import io
+import logging
+import math
+import os
+import struct
+import threading
+import warnings
+import zlib
+
+from lazy_imports import lazy_module
+
+# Imported on first use
+Image = lazy_module("PIL.Image")
+np = lazy_module("numpy")
+NUMPY_AVAILABLE = np is not None
+
+DEFAULT_MAX_PIXELS = 1_000_000_000
+
+# PNGs above this many pixels are read in strips when they are downscaled
+LARGE_IMAGE_PIXELS = 64_000_000
+
+# Decoded bytes per strip
+STRIP_BYTES = 32 * 1024 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG colour type -> samples per pixel
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Chunks the decoder needs to interpret the pixel data
+_DECODING_CHUNKS = (b"PLTE", b"tRNS")
+_IDAT_CHUNK_BYTES = 1024 * 1024
+# Pillow mode -> PNG colour type for the strip writer
+_WRITER_COLOR_TYPES = {"L": 0, "RGB": 2, "LA": 4, "RGBA": 6}
+# Held while open_image has Pillow's global limit changed
+_limit_lock = threading.Lock()
+
+
+class ImageTooLargeError(ValueError):
+    """The image has more pixels than the configured limit"""
+
+
+def check_pixel_limit(size, max_pixels):
+    pixels = size[0] * size[1]
+    if max_pixels and pixels > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {pixels / 1e6:.0f} MP ({size[0]}x{size[1]}), "
+            f"above the {max_pixels / 1e6:.0f} MP pixel limit")
+
+
+def open_image(file_path, max_pixels=DEFAULT_MAX_PIXELS):
+    """Image.open with an explicit pixel limit instead of the bomb guard.
+
+    Only the header is read, so the check is made before any decoding.
+    Raises ImageTooLargeError above `max_pixels` (0 means no limit).
+    """
+    # Pillow raises above twice its own limit; keep that out of the way
+    # of ours, and silence its warning for images we have accepted. The
+    # limit is global, so it is only lifted for this header read.
+    with _limit_lock:
+        pillow_limit = Image.MAX_IMAGE_PIXELS
+        if pillow_limit is not None:
+            Image.MAX_IMAGE_PIXELS = max(pillow_limit, max_pixels) if max_pixels else None
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+                img = Image.open(file_path)
+        except Image.DecompressionBombError as e:
+            raise ImageTooLargeError(str(e)) from e
+        finally:
+            Image.MAX_IMAGE_PIXELS = pillow_limit
+    try:
+        check_pixel_limit(img.size, max_pixels)
+    except ImageTooLargeError:
+        img.close()
+        raise
+    return img
+
+
+def _read_chunks(f):
+    """Yield (type, data) for each chunk from the current file position"""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack(">I4s", header)
+        data = f.read(length)
+        f.read(4)  # CRC; zlib and Pillow catch corrupt data
+        yield chunk_type, data
+        if chunk_type == b"IEND":
+            return
+
+
+def png_chunk(chunk_type, data):
+    """Serialize one PNG chunk: length, type, data and CRC"""
+    return (struct.pack(">I", len(data)) + chunk_type + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+class PngStripReader:
+    """Decode a non-interlaced 8-bit PNG as horizontal strips.
+
+    Raises ValueError from the constructor for PNGs it cannot stream.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.extra_chunks = []
+        with open(file_path, "rb") as f:
+            if f.read(8) != PNG_SIGNATURE:
+                raise ValueError("Not a PNG file")
+            for chunk_type, data in _read_chunks(f):
+                if chunk_type == b"IHDR":
+                    self.ihdr = data
+                    (self.width, self.height, bit_depth, self.color_type,
+                     _, _, interlace) = struct.unpack(">IIBBBBB", data)
+                    if bit_depth != 8:
+                        raise ValueError(f"{bit_depth}-bit PNGs are not read in strips")
+                    if interlace:
+                        raise ValueError("Interlaced PNGs are not read in strips")
+                elif chunk_type in _DECODING_CHUNKS:
+                    self.extra_chunks.append((chunk_type, data))
+                elif chunk_type == b"IDAT":
+                    break
+        self.row_bytes = self.width * _PNG_CHANNELS[self.color_type]
+
+    @classmethod
+    def supports(cls, img):
+        """True if `img` (opened, not loaded) is a PNG large enough and streamable"""
+        if img.format != "PNG" or img.width * img.height <= LARGE_IMAGE_PIXELS:
+            return False
+        try:
+            cls(img.filename)
+        except (ValueError, OSError, AttributeError):
+            return False
+        return True
+
+    def rows_per_strip(self, multiple=1):
+        rows = max(1, STRIP_BYTES // max(1, self.width * 4))
+        return max(multiple, rows // multiple * multiple)
+
+    def _idat_data(self):
+        with open(self.file_path, "rb") as f:
+            f.seek(8)
+            seen_idat = False
+            for chunk_type, data in _read_chunks(f):
+                if chunk_type == b"IDAT":
+                    seen_idat = True
+                    yield data
+                elif seen_idat:
+                    return
+
+    def _decode(self, filtered, rows, previous_row):
+        # Wrap the filtered rows in a minimal PNG; a leading unfiltered copy
+        # of the previous row lets "up", "average" and "paeth" rows decode
+        if previous_row is not None:
+            filtered = b"\0" + previous_row + filtered
+            rows += 1
+        ihdr = struct.pack(">II", self.width, rows) + self.ihdr[8:]
+        data = (PNG_SIGNATURE + png_chunk(b"IHDR", ihdr)
+                + b"".join(png_chunk(chunk_type, chunk) for chunk_type, chunk in self.extra_chunks)
+                + png_chunk(b"IDAT", zlib.compress(filtered, 0)) + png_chunk(b"IEND", b""))
+        strip = Image.open(io.BytesIO(data))
+        strip.load()
+        if previous_row is not None:
+            cropped = strip.crop((0, 1, self.width, rows))
+            cropped.info = strip.info
+            strip.close()
+            strip = cropped
+        return strip
+
+    def strips(self, rows):
+        """Yield (top row, strip image) for strips of `rows` rows"""
+        stride = self.row_bytes + 1
+        decompressor = zlib.decompressobj()
+        pending = bytearray()
+        previous_row = None
+        y = 0
+        for data in self._idat_data():
+            while data and y < self.height:
+                # Bound the inflated output: flat images compress 1000:1
+                strip_bytes = min(rows, self.height - y) * stride
+                pending += decompressor.decompress(data, max(strip_bytes - len(pending), 65536))
+                data = decompressor.unconsumed_tail
+                while y < self.height:
+                    count = min(rows, self.height - y)
+                    if len(pending) < count * stride:
+                        break
+                    strip = self._decode(bytes(pending[:count * stride]), count, previous_row)
+                    del pending[:count * stride]
+                    previous_row = strip.crop((0, count - 1, self.width, count)).tobytes()
+                    yield y, strip
+                    y += count
+        if y < self.height:
+            raise ValueError(f"PNG data ended after {y} of {self.height} rows")
+
+
+def _normalize_strip(strip):
+    # Palette and tRNS images cannot be reduced or written as-is
+    if strip.mode == "P" or "transparency" in strip.info:
+        return strip.convert("RGBA" if "transparency" in strip.info else "RGB")
+    return strip
+
+
+def _close_all(*images):
+    closed = []
+    for image in images:
+        if not any(image is other for other in closed):
+            image.close()
+            closed.append(image)
+
+
+def reduce_png(file_path, factor):
+    """Decode `file_path` in strips, box-reducing each by `factor`.
+
+    Strips are a multiple of `factor` rows tall, so the result is the same
+    as Image.reduce(factor) on the whole image.
+    """
+    reader = PngStripReader(file_path)
+    reduced_image = None
+    for y, strip in reader.strips(reader.rows_per_strip(factor)):
+        normalized = _normalize_strip(strip)
+        reduced = normalized.reduce(factor)
+        if reduced_image is None:
+            reduced_image = Image.new(
+                reduced.mode, (math.ceil(reader.width / factor), math.ceil(reader.height / factor)))
+        reduced_image.paste(reduced, (0, y // factor))
+        _close_all(strip, normalized, reduced)
+    logging.debug(f"Strip-reduced {reader.width}x{reader.height} by {factor} "
+                  f"to {reduced_image.size}")
+    return reduced_image
+
+
+def write_png_strips(file_path, output_path, info=None, compress_level=6):
+    """Re-encode a PNG into `output_path` strip by strip.
+
+    `info` may carry 'icc_profile' and 'exif' to copy into the output.
+    Rows use the "up" filter when NumPy is available, otherwise none.
+    Returns the output size in pixels.
+    """
+    reader = PngStripReader(file_path)
+    info = info or {}
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            compressor = zlib.compressobj(compress_level)
+            pending = bytearray()
+            previous = None
+            header_written = False
+            for _, strip in reader.strips(reader.rows_per_strip()):
+                normalized = _normalize_strip(strip)
+                if normalized.mode not in _WRITER_COLOR_TYPES:
+                    normalized = normalized.convert("RGBA" if "A" in normalized.getbands() else "RGB")
+                if not header_written:
+                    mode = normalized.mode
+                    out.write(PNG_SIGNATURE + png_chunk(b"IHDR", struct.pack(
+                        ">IIBBBBB", reader.width, reader.height, 8, _WRITER_COLOR_TYPES[mode], 0, 0, 0)))
+                    if info.get("icc_profile"):
+                        out.write(png_chunk(b"iCCP", b"ICC Profile\0\0" + zlib.compress(info["icc_profile"])))
+                    if info.get("exif"):
+                        out.write(png_chunk(b"eXIf", info["exif"]))
+                    header_written = True
+                elif normalized.mode != mode:
+                    normalized = normalized.convert(mode)
+                filtered, previous = _filter_rows(normalized, previous)
+                pending += compressor.compress(filtered)
+                if len(pending) >= _IDAT_CHUNK_BYTES:
+                    out.write(png_chunk(b"IDAT", bytes(pending)))
+                    pending.clear()
+                _close_all(strip, normalized)
+            pending += compressor.flush()
+            out.write(png_chunk(b"IDAT", bytes(pending)) + png_chunk(b"IEND", b""))
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return reader.width, reader.height
+
+
+def _filter_rows(strip, previous):
+    """PNG-filter a strip's rows; returns (bytes, last raw row)"""
+    raw = strip.tobytes()
+    stride = len(raw) // strip.height
+    if not NUMPY_AVAILABLE:
+        rows = (raw[i:i + stride] for i in range(0, len(raw), stride))
+        return b"".join(b"\0" + row for row in rows), None
+    rows = np.frombuffer(raw, dtype=np.uint8).reshape(strip.height, stride)
+    above = np.empty_like(rows)
+    above[0] = previous if previous is not None else 0
+    above[1:] = rows[:-1]
+    filtered = np.empty((strip.height, stride + 1), dtype=np.uint8)
+    filtered[:, 0] = 2  # "up"
+    np.subtract(rows, above, out=filtered[:, 1:])
+    return filtered.tobytes(), rows[-1].copy()
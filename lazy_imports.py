@@ -0,0 +1,34 @@
+"""
+Deferred imports for heavy optional modules.
+
+lazy_module("numpy") returns a module object whose real import runs on
+first attribute access, so modules can keep a top-level `np` name
+without paying for NumPy (or Pillow) at application start. Returns None
+when the module is not installed, which keeps the usual
+FEATURE_AVAILABLE checks.
+"""
+
+import importlib.util
+import sys
+
+
+def lazy_module(name):
+    """Module `name`, loaded on first attribute access; None if it is not installed"""
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or spec.loader is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    # Submodules are attributes of their package, as after a normal import
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
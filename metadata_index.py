@@ -0,0 +1,311 @@
+"""
+SQLite index of queued images' metadata.
+
+Header facts (format, mode, dimensions) and EXIF are read once per file
+and stored in a local SQLite database keyed by path, together with the
+file's mtime and size; an entry is only re-read after the file changes.
+Queue filters such as "width>4000 model:x100 year=2026" and the metadata
+viewer are then answered from the index without opening the images.
+
+MetadataIndexer fills the index for a whole queue in the background.
+Reading headers is dominated by file-system latency, so it reads several
+files at once on a thread pool and writes each batch in one transaction.
+"""
+
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import large_image
+from file_scanner import path_key
+from image_probe import read_exif
+from lazy_imports import lazy_module
+
+# Imported on first use
+ExifTags = lazy_module("PIL.ExifTags")
+
+INDEX_VERSION = 1
+INDEX_WORKERS = 8
+INDEX_BATCH_SIZE = 500
+
+# SQLite's default limit on bound parameters is 999 in older builds
+_LOOKUP_CHUNK = 500
+
+_EXIF_IFD = 0x8769
+_MAKE, _MODEL, _DATETIME, _ORIENTATION = 0x010F, 0x0110, 0x0132, 0x0112
+_DATETIME_ORIGINAL = 0x9003
+
+_COLUMNS = ("path", "mtime_ns", "file_size", "format", "mode", "width", "height",
+            "make", "model", "taken", "year", "orientation", "metadata", "error")
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS images (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        file_size INTEGER NOT NULL,
+        format TEXT,
+        mode TEXT,
+        width INTEGER,
+        height INTEGER,
+        make TEXT,
+        model TEXT,
+        taken TEXT,
+        year INTEGER,
+        orientation INTEGER,
+        metadata TEXT,
+        error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS images_width ON images (width)",
+    "CREATE INDEX IF NOT EXISTS images_year ON images (year)",
+    "CREATE INDEX IF NOT EXISTS images_model ON images (model)",
+)
+
+# Filter field -> (SQL expression, value type)
+QUERY_FIELDS = {
+    "width": ("width", int),
+    "height": ("height", int),
+    "size": ("file_size", int),
+    "format": ("format", str),
+    "mode": ("mode", str),
+    "make": ("make", str),
+    "model": ("model", str),
+    "camera": ("COALESCE(make, '') || ' ' || COALESCE(model, '')", str),
+    "year": ("year", int),
+    "taken": ("taken", str),
+}
+
+_TERM = re.compile(r"^([a-z]+)(>=|<=|!=|>|<|=|:)(.+)$")
+_SIZE_SUFFIXES = {"k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2, "g": 1024 ** 3, "gb": 1024 ** 3}
+
+
+def _number(value):
+    """Integer filter value; sizes may end in k/m/g (binary units)"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([kmg]b?)?", value)
+    if match is None:
+        raise ValueError(f"Not a number: {value}")
+    number = float(match.group(1)) * _SIZE_SUFFIXES.get(match.group(2) or "", 1)
+    return int(number)
+
+
+def parse_query(text):
+    """Split filter text into (SQL condition, parameters, remaining free text).
+
+    Terms look like `field<op>value` with an op of >, >=, <, <=, =, != or
+    ':' (contains, for text fields). Words that are not terms for a known
+    field are returned as free text. The condition is "" when there are
+    no terms. Raises ValueError for a malformed value.
+    """
+    conditions = []
+    params = []
+    words = []
+    for word in text.strip().lower().split():
+        match = _TERM.match(word)
+        if match is None or match.group(1) not in QUERY_FIELDS:
+            words.append(word)
+            continue
+        field, op, value = match.groups()
+        expression, kind = QUERY_FIELDS[field]
+        if kind is int:
+            conditions.append(f"{expression} {'=' if op == ':' else op} ?")
+            params.append(_number(value))
+        elif op == ":":
+            conditions.append(f"{expression} LIKE ?")
+            params.append(f"%{value}%")
+        else:
+            conditions.append(f"LOWER({expression}) {op} ?")
+            params.append(value)
+    return " AND ".join(conditions), params, " ".join(words)
+
+
+def _plain(value):
+    """JSON-friendly form of an EXIF or info value"""
+    if isinstance(value, bytes):
+        return value.decode(errors="replace").rstrip("\0")
+    if isinstance(value, (str, int, float)) or value is None:
+        return value
+    return str(value)
+
+
+def _exif_date(value):
+    """EXIF 'YYYY:MM:DD HH:MM:SS' -> ISO 'YYYY-MM-DD HH:MM:SS', or None"""
+    if not isinstance(value, str):
+        return None
+    match = re.match(r"(\d{4}):(\d{2}):(\d{2})(.*)", value.strip())
+    if match is None or match.group(1) == "0000":
+        return None
+    return f"{match.group(1)}-{match.group(2)}-{match.group(3)}{match.group(4)}"
+
+
+def extract(file_path, stat=None):
+    """Read one file's header and EXIF into an index row (a dict of _COLUMNS).
+
+    Errors are stored in the row, so a broken file is not re-read until it
+    changes.
+    """
+    if stat is None:
+        stat = os.stat(file_path)
+    row = dict.fromkeys(_COLUMNS)
+    row.update(path=path_key(file_path), mtime_ns=stat.st_mtime_ns, file_size=stat.st_size)
+    try:
+        # Only the header is read, so the pixel limit does not apply
+        with large_image.open_image(file_path, max_pixels=0) as img:
+            exif = read_exif(img)
+            tags = dict(exif)
+            tags.update(exif.get_ifd(_EXIF_IFD))
+            metadata = {}
+            for tag_id, value in tags.items():
+                if tag_id == _EXIF_IFD or isinstance(value, dict):
+                    continue
+                metadata[ExifTags.TAGS.get(tag_id, str(tag_id))] = _plain(value)
+            for key, value in img.info.items():
+                if isinstance(value, (str, int, float)):
+                    metadata.setdefault(key, value)
+            taken = _exif_date(_plain(tags.get(_DATETIME_ORIGINAL) or tags.get(_DATETIME)))
+            row.update(
+                format=img.format or "",
+                mode=img.mode,
+                width=img.width,
+                height=img.height,
+                make=(_plain(tags.get(_MAKE)) or "").strip() or None,
+                model=(_plain(tags.get(_MODEL)) or "").strip() or None,
+                taken=taken,
+                year=int(taken[:4]) if taken else None,
+                orientation=tags.get(_ORIENTATION, 1),
+                metadata=json.dumps(metadata, default=str),
+            )
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+class MetadataIndex:
+    """Path + mtime keyed metadata records in one SQLite file.
+
+    The connection is shared between the indexer thread and the UI thread
+    and guarded by a lock.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                self._conn.execute("DROP TABLE IF EXISTS images")
+                self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stale(self, paths):
+        """(path, stat) for each of `paths` that is missing from the index or has changed"""
+        stale = []
+        for start in range(0, len(paths), _LOOKUP_CHUNK):
+            chunk = paths[start:start + _LOOKUP_CHUNK]
+            keys = [path_key(file_path) for file_path in chunk]
+            placeholders = ",".join("?" * len(keys))
+            with self._lock:
+                stamps = {row["path"]: (row["mtime_ns"], row["file_size"]) for row in self._conn.execute(
+                    f"SELECT path, mtime_ns, file_size FROM images WHERE path IN ({placeholders})", keys)}
+            for file_path, key in zip(chunk, keys):
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                if stamps.get(key) != (stat.st_mtime_ns, stat.st_size):
+                    stale.append((file_path, stat))
+        return stale
+
+    def put(self, rows):
+        """Insert or replace extracted rows in one transaction"""
+        if not rows:
+            return
+        placeholders = ",".join("?" * len(_COLUMNS))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO images ({','.join(_COLUMNS)}) VALUES ({placeholders})",
+                [tuple(row[column] for column in _COLUMNS) for row in rows])
+
+    def get(self, file_path):
+        """The current record for `file_path` as a dict, reading the file only if it is stale"""
+        stat = os.stat(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM images WHERE path = ?", (path_key(file_path),)).fetchone()
+        if row is not None and (row["mtime_ns"], row["file_size"]) == (stat.st_mtime_ns, stat.st_size):
+            return dict(row)
+        row = extract(file_path, stat)
+        self.put([row])
+        return row
+
+    def select(self, condition, params=()):
+        """Path keys of indexed files matching an SQL condition from parse_query"""
+        with self._lock:
+            return {row["path"] for row in self._conn.execute(
+                f"SELECT path FROM images WHERE error IS NULL AND ({condition})", params)}
+
+
+class MetadataIndexer(threading.Thread):
+    """Bring the index up to date for `paths` in the background.
+
+    Messages on `self.messages` are dicts with a "type" key:
+      - "batch": indexed (files read so far), total
+      - "finished": indexed, total, cancelled
+    """
+
+    def __init__(self, index, paths, workers=INDEX_WORKERS, batch_size=INDEX_BATCH_SIZE):
+        super().__init__(daemon=True)
+        self.index = index
+        self.paths = list(paths)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.messages = queue.Queue()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        indexed = 0
+        total = len(self.paths)
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="metadata-index") as executor:
+                for first in range(0, total, self.batch_size):
+                    if self._cancelled.is_set():
+                        break
+                    stale = self.index.stale(self.paths[first:first + self.batch_size])
+                    rows = list(executor.map(lambda item: extract(*item), stale))
+                    self.index.put(rows)
+                    indexed += len(rows)
+                    self.messages.put({"type": "batch", "indexed": indexed, "total": total})
+        except Exception as e:
+            logging.error(f"Metadata indexing failed: {str(e)}")
+        logging.info(f"Indexed metadata of {indexed} of {total} files "
+                     f"in {time.perf_counter() - start:.1f}s")
+        self.messages.put({
+            "type": "finished",
+            "indexed": indexed,
+            "total": total,
+            "cancelled": self._cancelled.is_set()
+        })
+
+    def drain(self):
+        """Return all queued messages without blocking"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
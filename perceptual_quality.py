@@ -0,0 +1,97 @@
+"""
+Perceptual auto-quality for JPEG/WebP.
+
+For every image, finds the lowest quality whose decoded result keeps an
+SSIM score above a threshold versus the (resized) source. The metric is
+computed with vectorized NumPy on a downscaled luma plane, so each trial
+costs little more than the encode itself.
+"""
+
+import io
+import logging
+
+import quality_search
+from lazy_imports import lazy_module
+
+# Imported on first use; NumPy is only needed for auto quality
+Image = lazy_module("PIL.Image")
+np = lazy_module("numpy")
+NUMPY_AVAILABLE = np is not None
+if not NUMPY_AVAILABLE:
+    logging.debug("NumPy not available, auto quality disabled")
+
+DEFAULT_SSIM_THRESHOLD = 0.98
+
+# The luma-only metric does not see chroma artifacts, which dominate at
+# very low qualities on flat colour graphics
+MIN_AUTO_QUALITY = 30
+
+# Longest side of the luma plane the metric is computed on
+METRIC_MAX_SIDE = 512
+
+SSIM_WINDOW_RADIUS = 3
+
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+def luma_plane(img, max_side=METRIC_MAX_SIDE):
+    """Downscaled luma of `img` as a float64 array"""
+    luma = img.convert('L')
+    if max(luma.size) > max_side:
+        luma.thumbnail((max_side, max_side), Image.Resampling.BOX, reducing_gap=2.0)
+    return np.asarray(luma, dtype=np.float64)
+
+
+def _box_mean(plane, radius):
+    """Mean over every (2r+1)^2 window fully inside `plane`, via an integral image"""
+    size = 2 * radius + 1
+    integral = np.pad(plane, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    window_sum = (integral[size:, size:] - integral[:-size, size:]
+                  - integral[size:, :-size] + integral[:-size, :-size])
+    return window_sum / (size * size)
+
+
+def ssim(reference, candidate, radius=SSIM_WINDOW_RADIUS):
+    """Mean SSIM of two equally sized luma planes"""
+    if min(reference.shape) <= 2 * radius:
+        # Too small for local windows: compare global statistics
+        mean = lambda plane: plane.mean()
+    else:
+        mean = lambda plane: _box_mean(plane, radius)
+
+    mu_x = mean(reference)
+    mu_y = mean(candidate)
+    sigma_xx = mean(reference * reference) - mu_x * mu_x
+    sigma_yy = mean(candidate * candidate) - mu_y * mu_y
+    sigma_xy = mean(reference * candidate) - mu_x * mu_y
+
+    score = ((2 * mu_x * mu_y + _C1) * (2 * sigma_xy + _C2)) / \
+            ((mu_x * mu_x + mu_y * mu_y + _C1) * (sigma_xx + sigma_yy + _C2))
+    return float(np.mean(score))
+
+
+def search_quality_for_ssim(img, save_kwargs, threshold, max_quality, hint=None):
+    """Lowest quality <= max_quality whose decoded output keeps SSIM >= threshold.
+
+    Returns (quality, data, trials, met, score).
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("Auto quality requires NumPy (pip install numpy)")
+
+    reference = luma_plane(img)
+    scores = {}
+
+    def trial(quality):
+        data = quality_search.encode_to_bytes(img, save_kwargs, quality)
+        with Image.open(io.BytesIO(data)) as decoded:
+            scores[quality] = ssim(reference, luma_plane(decoded))
+        return scores[quality] >= threshold, data
+
+    min_quality = min(MIN_AUTO_QUALITY, max_quality)
+    if hint is None:
+        # Most images pass near the top; start there and gallop down
+        hint = max_quality
+    quality, data, trials, met = quality_search.search_quality(
+        trial, min_quality, max_quality, hint=hint, highest=False)
+    return quality, data, trials, met, scores[quality]
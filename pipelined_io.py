@@ -0,0 +1,129 @@
+"""
+Pipelined file I/O for batches on slow storage.
+
+ReadAhead reads the next few input files into memory on background
+threads while earlier files are being compressed, and AsyncWriter takes
+the encoded outputs through a bounded queue and writes them on
+background threads. On network storage the compute stage then never
+waits for a read or a write that could have been overlapped.
+
+Outputs are still written to a temporary file and renamed into place,
+so an interrupted batch never leaves a truncated output behind.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_DEPTH = 4
+
+# Larger inputs are not prefetched; the compute stage reads them itself
+MAX_PREFETCH_BYTES = 64 * 1024 * 1024
+
+
+def _read(file_path, max_bytes):
+    start = time.perf_counter()
+    try:
+        if os.path.getsize(file_path) > max_bytes:
+            return None, 0.0
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        # The compute stage reads the file again and reports the error
+        return None, 0.0
+    return data, time.perf_counter() - start
+
+
+class ReadAhead:
+    """Prefetch the bytes of `files` up to `depth` files ahead of the consumer.
+
+    take(index) must be called with increasing indexes; files that are
+    passed over (for example because they are unchanged) are dropped.
+    """
+
+    def __init__(self, files, depth=DEFAULT_DEPTH, max_bytes=MAX_PREFETCH_BYTES):
+        self.files = files
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=depth, thread_name_prefix="read-ahead")
+        self._futures = {}
+        self._next = 0
+
+    def take(self, index):
+        """Return (bytes or None, seconds spent reading) for files[index]"""
+        while self._next < len(self.files) and self._next <= index + self.depth:
+            self._futures[self._next] = self._executor.submit(
+                _read, self.files[self._next], self.max_bytes)
+            self._next += 1
+        for passed in [i for i in self._futures if i < index]:
+            self._futures.pop(passed).cancel()
+        return self._futures.pop(index).result()
+
+    def close(self):
+        self._futures.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncWriter:
+    """Write results' encoded outputs on `depth` background threads.
+
+    Several writes are in flight at once so per-file storage latency
+    overlaps. submit(result, context) blocks while `depth` results are
+    already waiting, which bounds the encoded bytes held in memory. `write(data,
+    path)` must be atomic. Written results come back, with their context,
+    from completed() and close(); a failed write is recorded as the
+    result's error.
+    """
+
+    def __init__(self, write, depth=DEFAULT_DEPTH):
+        self.write = write
+        self._queue = queue.Queue(maxsize=depth)
+        self._completed = queue.Queue()
+        self._threads = [threading.Thread(target=self._run, name=f"async-writer-{i}")
+                         for i in range(depth)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, result, context=None):
+        self._queue.put((result, context))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            result, context = item
+            self._write_result(result)
+            self._completed.put((result, context))
+
+    def _write_result(self, result):
+        try:
+            for output_path, data, output_format in result.pending_writes:
+                start = time.perf_counter()
+                self.write(data, output_path)
+                result.timings.append(("write", output_format, time.perf_counter() - start))
+        except Exception as e:
+            logging.error(f"Error writing output for {result.input_path}: {str(e)}")
+            result.error = str(e)
+        finally:
+            result.pending_writes = []
+
+    def completed(self):
+        """(result, context) pairs written since the last call, without blocking"""
+        finished = []
+        while True:
+            try:
+                finished.append(self._completed.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def close(self):
+        """Write everything still queued and return the remaining completed pairs"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        return self.completed()
@@ -0,0 +1,255 @@
+"""
+Lossless PNG optimization.
+
+Tries lossless reductions of an image and several zlib settings in
+memory and keeps the smallest encoding. The reductions never change a
+pixel:
+
+  - dropping an alpha channel that is fully opaque
+  - RGB(A) whose channels are all equal becomes L(A), unless an ICC
+    profile (which would describe RGB data) is kept
+  - images with at most 256 colours become a palette image (with tRNS
+    for transparent entries); Pillow stores palettes of up to 2, 4 or 16
+    colours at 1, 2 or 4 bits per pixel
+  - black-and-white greyscale becomes a 1-bit image
+
+Every candidate is encoded with Pillow's adaptive row filters under
+several zlib strategies and, with NumPy, with each fixed PNG row filter.
+The trials run on a thread pool (zlib and Pillow's encoder release the
+GIL), and the whole search is capped in time: a trial is only started
+while the trials finished so far say it can end before the cap, and a
+started trial is always finished and counted, so no CPU time goes into
+encodings that are thrown away. The best finished trial wins.
+"""
+
+import io
+import logging
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from large_image import PNG_SIGNATURE, png_chunk
+from lazy_imports import lazy_module
+
+# Imported on first use
+Image = lazy_module("PIL.Image")
+ImageChops = lazy_module("PIL.ImageChops")
+np = lazy_module("numpy")
+NUMPY_AVAILABLE = np is not None
+
+DEFAULT_TRIAL_SECONDS = 10.0
+
+# Threads per image; compression_engine lowers this in each pool worker
+# so a parallel batch does not run cores x cores encoder threads
+trial_workers = os.cpu_count() or 1
+
+# zlib strategies tried with Pillow's adaptive filtering, by effort tier
+_STRATEGIES = {
+    "fast": (zlib.Z_DEFAULT_STRATEGY,),
+    "balanced": (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_RLE),
+    "max": (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_RLE),
+}
+# PNG filter types 0-4; tried as a fixed filter for every row at "max"
+_FILTERS = ("none", "sub", "up", "average", "paeth")
+# Pillow mode -> (PNG colour type, bytes per pixel) for the fixed-filter writer
+_COLOR_TYPES = {"L": (0, 1), "RGB": (2, 3), "P": (3, 1), "LA": (4, 2), "RGBA": (6, 4)}
+
+
+def _drop_opaque_alpha(img):
+    if img.mode in ("RGBA", "LA") and img.getchannel("A").getextrema() == (255, 255):
+        return img.convert(img.mode[:-1])
+    return None
+
+
+def _to_grayscale(img):
+    if img.mode not in ("RGB", "RGBA"):
+        return None
+    r, g, b = img.getchannel("R"), img.getchannel("G"), img.getchannel("B")
+    if ImageChops.difference(r, g).getbbox() or ImageChops.difference(r, b).getbbox():
+        return None
+    return r if img.mode == "RGB" else Image.merge("LA", (r, img.getchannel("A")))
+
+
+def _to_bilevel(img):
+    if img.mode != "L" or img.getcolors(2) is None:
+        return None
+    if any(value not in (0, 255) for _, value in img.getcolors(2)):
+        return None
+    return img.convert("1", dither=Image.Dither.NONE)
+
+
+def _to_palette(img):
+    """Exact palette image for <= 256 colours, or None; returns (image, save options)"""
+    if not NUMPY_AVAILABLE or img.mode not in ("L", "LA", "RGB", "RGBA"):
+        return None
+    if img.getcolors(256) is None:
+        return None
+    rgba = np.asarray(img.convert("RGBA"))
+    keys = np.ascontiguousarray(rgba).view(np.uint32).ravel()
+    colors, inverse = np.unique(keys, return_inverse=True)
+    palette = colors.view(np.uint8).reshape(-1, 4)
+    # Transparent entries first, so tRNS can stop at the last one
+    order = np.argsort(palette[:, 3], kind="stable")
+    palette = palette[order]
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    indices = remap[inverse.ravel()].astype(np.uint8)
+    paletted = Image.frombytes("P", img.size, indices.tobytes())
+    paletted.putpalette(palette[:, :3].tobytes())
+    options = {}
+    translucent = np.flatnonzero(palette[:, 3] < 255)
+    if len(translucent):
+        options["transparency"] = palette[:translucent[-1] + 1, 3].tobytes()
+    return paletted, options
+
+
+def candidates(img, keep_color=False):
+    """(label, image, save options) for `img` and its lossless reductions, most reduced first.
+
+    With `keep_color` RGB data is never turned into greyscale.
+    """
+    found = [("original", img, {})]
+    current = img
+    reductions = [("opaque", _drop_opaque_alpha)]
+    if not keep_color:
+        reductions.append(("gray", _to_grayscale))
+    for label, reduce in reductions:
+        reduced = reduce(current)
+        if reduced is not None:
+            current = reduced
+            found.append((label, current, {}))
+    bilevel = _to_bilevel(current)
+    if bilevel is not None:
+        found.append(("1-bit", bilevel, {}))
+    paletted = _to_palette(current)
+    if paletted is not None:
+        found.append(("palette",) + paletted)
+    return found[::-1]
+
+
+def _encode_pillow(img, options, metadata, strategy):
+    with io.BytesIO() as buffer:
+        img.save(buffer, format="PNG", compress_level=9, compress_type=strategy,
+                 **metadata, **options)
+        return buffer.getvalue()
+
+
+def _filter(rows, bpp, filter_type):
+    """Apply one PNG filter to every row of an (height, stride) uint8 array"""
+    if filter_type == 0:
+        return rows
+    left = np.zeros_like(rows)
+    left[:, bpp:] = rows[:, :-bpp]
+    up = np.zeros_like(rows)
+    up[1:] = rows[:-1]
+    if filter_type == 1:
+        return rows - left
+    if filter_type == 2:
+        return rows - up
+    if filter_type == 3:
+        return rows - ((left.astype(np.uint16) + up) >> 1).astype(np.uint8)
+    upper_left = np.zeros_like(rows)
+    upper_left[1:, bpp:] = rows[:-1, :-bpp]
+    a, b, c = (x.astype(np.int16) for x in (left, up, upper_left))
+    p = a + b - c
+    pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+    predictor = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c)).astype(np.uint8)
+    return rows - predictor
+
+
+def _encode_filtered(img, options, metadata, filter_type):
+    """Write an 8-bit PNG with the same filter on every row"""
+    color_type, bpp = _COLOR_TYPES[img.mode]
+    rows = np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(img.height, img.width * bpp)
+    filtered = np.empty((img.height, rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = filter_type
+    filtered[:, 1:] = _filter(rows, bpp, filter_type)
+
+    chunks = [png_chunk(b"IHDR", struct.pack(">IIBBBBB", img.width, img.height, 8,
+                                             color_type, 0, 0, 0))]
+    if metadata.get("icc_profile"):
+        chunks.append(png_chunk(b"iCCP", b"ICC Profile\0\0" + zlib.compress(metadata["icc_profile"])))
+    if img.mode == "P":
+        chunks.append(png_chunk(b"PLTE", bytes(img.getpalette())))
+        if options.get("transparency"):
+            chunks.append(png_chunk(b"tRNS", options["transparency"]))
+    if metadata.get("exif"):
+        chunks.append(png_chunk(b"eXIf", metadata["exif"]))
+    chunks.append(png_chunk(b"IDAT", zlib.compress(filtered.tobytes(), 9)))
+    chunks.append(png_chunk(b"IEND", b""))
+    return PNG_SIGNATURE + b"".join(chunks)
+
+
+def trials(img, metadata=None, effort="max"):
+    """List of (label, callable returning bytes), most promising first"""
+    metadata = metadata or {}
+    found = []
+    for label, image, options in candidates(img, keep_color=bool(metadata.get("icc_profile"))):
+        for strategy in _STRATEGIES[effort]:
+            found.append((f"{label} adaptive/strategy {strategy}",
+                          partial(_encode_pillow, image, options, metadata, strategy)))
+        # The fixed-filter writer leaves colour-key transparency to Pillow
+        if (effort == "max" and NUMPY_AVAILABLE and image.mode in _COLOR_TYPES
+                and "transparency" not in image.info):
+            for filter_type, name in enumerate(_FILTERS):
+                found.append((f"{label} {name}",
+                              partial(_encode_filtered, image, options, metadata, filter_type)))
+    return found
+
+
+def _timed(encode):
+    started = time.monotonic()
+    return encode(), time.monotonic() - started
+
+
+def optimize(img, metadata=None, effort="max", max_seconds=DEFAULT_TRIAL_SECONDS, workers=None):
+    """Return (smallest PNG bytes, trials run) for `img`.
+
+    `metadata` may carry 'icc_profile' and 'exif' to embed. Once a trial
+    has finished, another is only started if the average trial time so far
+    says it ends within `max_seconds`; the rest are skipped. At least one
+    always finishes.
+    """
+    queued = deque(trials(img, metadata, effort))
+    total = len(queued)
+    workers = max(1, min(workers or trial_workers, total))
+    deadline = time.monotonic() + max_seconds
+    best = None
+    finished = 0
+    trial_seconds = 0.0
+    error = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while queued or running:
+            while queued and len(running) < workers:
+                if finished and time.monotonic() + trial_seconds / finished > deadline:
+                    break
+                label, encode = queued.popleft()
+                running[executor.submit(_timed, encode)] = label
+            if not running:
+                # No time left for another trial
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                label = running.pop(future)
+                try:
+                    data, seconds = future.result()
+                except Exception as e:
+                    logging.debug(f"PNG trial {label} failed: {str(e)}")
+                    error = e
+                    continue
+                trial_seconds += seconds
+                finished += 1
+                if best is None or len(data) < len(best[1]):
+                    best = (label, data)
+    if queued:
+        logging.debug(f"PNG trial time cap of {max_seconds:g}s reached; "
+                      f"skipped {len(queued)} of {total} trials")
+    if best is None:
+        raise error
+    logging.debug(f"Smallest PNG: {best[0]} ({len(best[1])} bytes, {finished} trials)")
+    return best[1], finished
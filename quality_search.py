@@ -0,0 +1,110 @@
+"""
+In-memory quality search.
+
+Encodes candidate qualities to memory buffers and searches for the
+boundary where a constraint (a byte budget, a perceptual threshold)
+starts or stops holding, so only the chosen encoding is written to disk.
+"""
+
+import io
+import statistics
+from collections import deque
+
+MIN_QUALITY = 1
+MAX_QUALITY = 100
+
+# Formats where the quality setting changes the encoded size
+QUALITY_FORMATS = ('jpeg', 'webp')
+
+
+def encode_to_bytes(img, save_kwargs, quality):
+    """Encode `img` with `save_kwargs` at `quality` and return the bytes"""
+    buffer = io.BytesIO()
+    img.save(buffer, **dict(save_kwargs, quality=quality))
+    return buffer.getvalue()
+
+
+def search_quality(trial, lo=MIN_QUALITY, hi=MAX_QUALITY, hint=None, highest=True, step=8):
+    """Find the quality boundary of a monotonic constraint.
+
+    trial(quality) returns (accepted, payload). With highest=True the
+    constraint holds for low qualities (e.g. "fits the byte budget") and
+    the highest accepted quality is returned; with highest=False it holds
+    for high qualities (e.g. "looks good enough") and the lowest accepted
+    quality is returned.
+
+    The search starts at `hint` (typically what similar images needed),
+    gallops by `step` until the boundary is bracketed, then bisects.
+    Returns (quality, payload, trials, met). When no quality is accepted,
+    the one closest to acceptance is returned with met=False.
+    """
+    def to_quality(x):
+        return x if highest else lo + hi - x
+
+    trials = {}
+
+    def accepted(x):
+        quality = to_quality(x)
+        if quality not in trials:
+            trials[quality] = trial(quality)
+        return trials[quality][0]
+
+    # In search space accepted values form a prefix: good <= boundary < bad
+    good, bad = lo - 1, hi + 1
+    x = hi if hint is None else min(max(to_quality(int(hint)), lo), hi)
+    if accepted(x):
+        good = x
+        while good < hi:
+            x = min(good + step, hi)
+            if accepted(x):
+                good = x
+            else:
+                bad = x
+                break
+    else:
+        bad = x
+        while bad > lo:
+            x = max(bad - step, lo)
+            if accepted(x):
+                good = x
+                break
+            bad = x
+
+    while bad - good > 1:
+        mid = (good + bad) // 2
+        if accepted(mid):
+            good = mid
+        else:
+            bad = mid
+
+    met = good >= lo
+    quality = to_quality(good if met else lo)
+    return quality, trials[quality][1], len(trials), met
+
+
+def search_quality_for_size(img, save_kwargs, max_bytes, max_quality, hint=None):
+    """Highest quality <= max_quality whose encoding fits in `max_bytes`.
+
+    Returns (quality, data, trials, met).
+    """
+    def trial(quality):
+        data = encode_to_bytes(img, save_kwargs, quality)
+        return len(data) <= max_bytes, data
+
+    return search_quality(trial, MIN_QUALITY, max_quality, hint=hint, highest=True)
+
+
+class QualityHistory:
+    """Recent qualities chosen in a batch, used to seed the next search"""
+
+    def __init__(self, size=16):
+        self._recent = deque(maxlen=size)
+
+    def add(self, quality):
+        if quality:
+            self._recent.append(quality)
+
+    def hint(self):
+        if not self._recent:
+            return None
+        return int(statistics.median(self._recent))
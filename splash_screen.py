@@ -1,11 +1,16 @@
 import tkinter as tk
 from tkinter import ttk
 import time
-import webbrowser
-from PIL import Image, ImageTk
+
+# Start-up that is done within this many seconds never shows the splash
+SPLASH_DELAY_SECONDS = 0.5
 
 class SplashScreen:
     def __init__(self, parent):
+        # Only a slow start-up shows the splash, so only then pay for these
+        import webbrowser
+        from PIL import Image, ImageTk
+        
         self.root = parent
         self.splash = tk.Toplevel(parent)
         self.splash.overrideredirect(True)
@@ -69,7 +74,16 @@ class SplashScreen:
             mode='determinate',
             style='Accent.Horizontal.TProgressbar'
         )
-        self.progress.pack(pady=30)
+        self.progress.pack(pady=(30, 5))
+        
+        # Current start-up step
+        self.status_label = ttk.Label(
+            main_frame,
+            text="",
+            font=("SF Pro Display", 9),
+            foreground="#666666"
+        )
+        self.status_label.pack()
         
         style.configure(
             'Accent.Horizontal.TProgressbar',
@@ -133,14 +147,42 @@ class SplashScreen:
         self.splash.update()
         self._photo_references = []
     
-    def progress_bar(self):
-        """Animate progress bar with smooth motion"""
-        for i in range(101):
-            self.progress['value'] = i
-            self.splash.update()
-            time.sleep(0.02)
+    def set_progress(self, fraction, message=""):
+        """Show a start-up step; the main loop is not running yet, so redraw now"""
+        self.progress['value'] = fraction * 100
+        self.status_label.config(text=message)
+        self.splash.update()
     
     def destroy(self):
         """Clean up and destroy splash screen"""
         self._photo_references.clear()
-        self.splash.destroy() 
\ No newline at end of file
+        self.splash.destroy()
+
+
+class StartupProgress:
+    """Forwards start-up steps to a SplashScreen that is only created when needed.
+
+    `started` is the time.perf_counter() value when start-up began; the
+    splash opens at the first step reported after `delay` seconds, so a
+    fast start goes straight to the main window.
+    """
+
+    def __init__(self, root, started, delay=SPLASH_DELAY_SECONDS):
+        self.root = root
+        self.started = started
+        self.delay = delay
+        self.splash = None
+        self.shown = False
+
+    def step(self, fraction, message=""):
+        if self.splash is None and time.perf_counter() - self.started >= self.delay:
+            self.splash = SplashScreen(self.root)
+            self.shown = True
+        if self.splash is not None:
+            self.splash.set_progress(fraction, message)
+
+    def close(self):
+        if self.splash is not None:
+            self.splash.set_progress(1.0)
+            self.splash.destroy()
+            self.splash = None 
\ No newline at end of file
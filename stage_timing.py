@@ -0,0 +1,120 @@
+"""
+Per-stage timing for the compression pipeline.
+
+StageTimer records how long each stage of one file took (read, open,
+decode, resize, convert, encode, write) with time.perf_counter. The samples are
+plain tuples so they travel back from worker processes on the
+CompressionResult. TimingReport aggregates them per stage and per format
+into count, total, p50, p95 and max, and writes JSON or CSV reports.
+"""
+
+import csv
+import json
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# Pipeline order, used to sort reports; "read" is only measured with
+# read-ahead, "preview" and "display" are the GUI's
+STAGES = ("read", "open", "decode", "resize", "convert", "encode", "write", "preview", "display")
+
+
+class StageTimer:
+    """Collects (stage, format, seconds) samples for one unit of work"""
+
+    def __init__(self):
+        self.samples = []
+
+    @contextmanager
+    def measure(self, stage, image_format=""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.append((stage, image_format, time.perf_counter() - start))
+
+
+def measure(timer, stage, image_format=""):
+    """timer.measure(...) or a no-op context when `timer` is None"""
+    if timer is None:
+        return nullcontext()
+    return timer.measure(stage, image_format)
+
+
+def _percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class TimingReport:
+    """Aggregate of stage samples across a batch"""
+
+    def __init__(self):
+        self._samples = {}
+
+    def add(self, samples):
+        for stage, image_format, seconds in samples:
+            self._samples.setdefault((stage, image_format), []).append(seconds)
+
+    def __bool__(self):
+        return bool(self._samples)
+
+    def rows(self):
+        """One dict per (stage, format), in pipeline stage order; times in ms"""
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        rows = []
+        for (stage, image_format), values in sorted(
+                self._samples.items(), key=lambda item: (order.get(item[0][0], len(order)), item[0])):
+            values = sorted(values)
+            rows.append({
+                "stage": stage,
+                "format": image_format,
+                "count": len(values),
+                "total_ms": round(sum(values) * 1000, 3),
+                "p50_ms": round(_percentile(values, 0.50) * 1000, 3),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            })
+        return rows
+
+    def stage_totals(self):
+        """Total seconds per stage across all formats"""
+        totals = {}
+        for (stage, _), values in self._samples.items():
+            totals[stage] = totals.get(stage, 0.0) + sum(values)
+        return totals
+
+    def summary(self):
+        """One line with each stage's share of the measured time"""
+        totals = self.stage_totals()
+        overall = sum(totals.values()) or 1e-9
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        parts = [f"{stage} {seconds:.2f}s ({seconds / overall:.0%})"
+                 for stage, seconds in sorted(totals.items(), key=lambda item: order.get(item[0], 99))]
+        return ", ".join(parts)
+
+    def log_summary(self, label="Stage timings"):
+        if not self:
+            return
+        logging.info(f"{label}: {self.summary()}")
+        for row in self.rows():
+            logging.debug(
+                f"  {row['stage']:<8} {row['format'] or '-':<5} n={row['count']} "
+                f"total={row['total_ms']:.0f}ms p50={row['p50_ms']:.1f}ms "
+                f"p95={row['p95_ms']:.1f}ms max={row['max_ms']:.1f}ms")
+
+    def save(self, path):
+        """Write the report as CSV if `path` ends in .csv, else as JSON"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            if path.lower().endswith(".csv"):
+                writer = csv.DictWriter(
+                    f, fieldnames=["stage", "format", "count", "total_ms", "p50_ms", "p95_ms", "max_ms"])
+                writer.writeheader()
+                writer.writerows(self.rows())
+            else:
+                json.dump({"stages": self.rows(), "totals_seconds": self.stage_totals()}, f, indent=2)
+        os.replace(tmp_path, path)
@@ -0,0 +1,29 @@
+from PIL import Image
+
+import duplicate_finder
+
+
+def test_flat_images_of_different_colours_are_not_duplicates(tmp_path):
+    files = []
+    for colour in ["red", "green", "blue"]:
+        path = tmp_path / f"{colour}.png"
+        Image.new("RGB", (50, 50), colour).save(path)
+        files.append(str(path))
+
+    plan = duplicate_finder.find_duplicates(files, "skip")
+
+    assert plan.clusters == []
+    assert len(plan) == 0
+
+
+def test_resized_copy_is_a_near_duplicate(tmp_path):
+    photo = Image.linear_gradient("L").rotate(30).resize((320, 240)).convert("RGB")
+    photo.paste((200, 40, 40), (40, 40, 120, 200))
+    photo.save(tmp_path / "photo.png")
+    photo.resize((160, 120)).save(tmp_path / "photo_small.png")
+    files = [str(tmp_path / "photo.png"), str(tmp_path / "photo_small.png")]
+
+    plan = duplicate_finder.find_duplicates(files, "keep-largest")
+
+    assert plan.clusters == [[0, 1]]
+    assert plan.keeper(1) == 0
@@ -0,0 +1,109 @@
+import io
+import os
+
+from PIL import Image
+
+import image_compressor_cli
+
+
+def test_expand_inputs_returns_directory_files_in_name_order(tmp_path):
+    names = ["ui.png", "a_small.jpg", "b.jpg", "a.jpg", "mislabeled.jpg", "a_copy.jpg"]
+    for name in names:
+        Image.new("RGB", (4, 4)).save(tmp_path / name, format="PNG" if name.endswith(".png") else "JPEG")
+    nested = tmp_path / "sub"
+    nested.mkdir()
+    Image.new("RGB", (4, 4)).save(nested / "0.jpg", format="JPEG")
+
+    files = image_compressor_cli.expand_inputs([str(tmp_path)])
+
+    expected = [os.path.join(str(tmp_path), name) for name in sorted(names)]
+    expected.append(os.path.join(str(nested), "0.jpg"))
+    assert files == expected
+
+
+def test_interrupted_job_needs_resume_or_restart(tmp_path):
+    source = tmp_path / "in"
+    source.mkdir()
+    for name in ["a.jpg", "b.jpg"]:
+        Image.new("RGB", (16, 16), "red").save(source / name, format="JPEG")
+    output = tmp_path / "out"
+    assert image_compressor_cli.main([str(source), "-o", str(output), "-j", "1"]) == 0
+
+    # Drop the last file and the "finished" line, as if the run had been killed
+    journal_path = output / image_compressor_cli.job_journal.JOURNAL_NAME
+    lines = journal_path.read_text().splitlines(keepends=True)
+    journal_path.write_text("".join(lines[:2]))
+
+    assert image_compressor_cli.main(
+        [str(source), "-o", str(output), "-j", "1", "--on-interrupted", "fail"]) == 2
+    assert journal_path.read_text() == "".join(lines[:2])
+
+    job = image_compressor_cli.job_journal.load(str(journal_path))
+    results = image_compressor_cli.compression_engine.compress_batch(
+        job.files, str(output), job.compression_settings(), workers=1,
+        journal=image_compressor_cli.job_journal.JobJournal.resume(job))
+    summary = image_compressor_cli.compression_engine.summarize_results(results)
+    assert (summary["resumed"], summary["skipped"], summary["succeeded"]) == (1, 0, 2)
+
+    journal_path.write_text("".join(lines[:2]))
+    assert image_compressor_cli.main(
+        [str(source), "-o", str(output), "-j", "1", "--on-interrupted", "restart"]) == 0
+    assert image_compressor_cli.job_journal.load(str(journal_path)).finished
+
+
+def test_unattended_rerun_resumes_an_interrupted_job(tmp_path, monkeypatch):
+    source = tmp_path / "in"
+    source.mkdir()
+    for name in ["a.jpg", "b.jpg"]:
+        Image.new("RGB", (16, 16), "red").save(source / name, format="JPEG")
+    output = tmp_path / "out"
+    assert image_compressor_cli.main([str(source), "-o", str(output), "-j", "1"]) == 0
+    journal_path = output / image_compressor_cli.job_journal.JOURNAL_NAME
+    journal_path.write_text("".join(journal_path.read_text().splitlines(keepends=True)[:2]))
+    monkeypatch.setattr(image_compressor_cli.sys, "stdin", io.StringIO())
+
+    assert image_compressor_cli.main([str(source), "-o", str(output), "-j", "1"]) == 0
+
+    assert image_compressor_cli.job_journal.load(str(journal_path)).finished
+
+
+def test_same_named_files_in_subfolders_keep_their_folders(tmp_path):
+    source = tmp_path / "in"
+    for folder in ["sub", "sub2"]:
+        (source / folder).mkdir(parents=True)
+        Image.new("RGB", (16, 16), "red").save(source / folder / "same.jpg", format="JPEG")
+    output = tmp_path / "out"
+
+    assert image_compressor_cli.main([str(source), "-o", str(output), "-j", "1"]) == 0
+
+    assert (output / "sub" / "same.webp").is_file()
+    assert (output / "sub2" / "same.webp").is_file()
+
+
+def test_colliding_output_names_fail_instead_of_overwriting(tmp_path):
+    for folder in ["a", "b"]:
+        (tmp_path / folder).mkdir()
+        Image.new("RGB", (16, 16), "red").save(tmp_path / folder / "same.jpg", format="JPEG")
+    files = [str(tmp_path / "a" / "same.jpg"), str(tmp_path / "b" / "same.jpg")]
+
+    results = image_compressor_cli.compression_engine.compress_batch(
+        files, str(tmp_path / "out"), image_compressor_cli.CompressionSettings(), workers=1)
+
+    assert results[0].ok
+    assert not results[1].ok and files[0] in results[1].error
+
+
+def test_watch_batches_keep_the_numbers_of_known_files(tmp_path):
+    source = tmp_path / "in"
+    source.mkdir()
+    for name in ["a.jpg", "b.jpg"]:
+        Image.new("RGB", (16, 16), "red").save(source / name, format="JPEG")
+    output = tmp_path / "out"
+    assert image_compressor_cli.main(
+        [str(source), "-o", str(output), "-j", "1", "--incremental", "--rename", "x_{number}"]) == 0
+
+    Image.new("RGB", (16, 16), "blue").save(source / "c.jpg", format="JPEG")
+    files = [str(source / "a.jpg"), str(source / "c.jpg")]
+    numbers, next_number = image_compressor_cli.watch_numbers(files, str(output), 3)
+
+    assert (numbers, next_number) == ([1, 3], 4)